@@ -0,0 +1,148 @@
+"""Storage backend benchmark
+
+Compares write and read throughput of the storage backends on one node:
+concurrent ``add_session`` writers, concurrent point reads
+(``get_session_encodings``) and a full scan of the embeddings. ``sqlite-plain``
+is SQLite with the default journal and no writer queue, as a reference for
+the tuned ``sqlite`` backend. PostgreSQL is included when ``--postgres-url``
+is given.
+
+Usage:
+    python -m benchmarks.bench_backends --rows 20000 --threads 8 --output backends.json
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import numpy as np
+from sqlmodel import select
+
+from benchmarks.common import BenchmarkResult
+from database.backends import (
+    DuckDBBackend,
+    PostgresBackend,
+    SQLiteBackend,
+    StorageBackend,
+)
+from database.crud import FaceEncoderCRUD
+from database.models import FaceEncoderSession
+from utils.helpers.embedding_utils import dequantize, quantize
+from utils.helpers.session_utils import uuid7
+
+
+def build_backends(directory: str, postgres_url: str) -> Dict[str, StorageBackend]:
+    """Build the backends to compare
+
+    Args:
+        directory (str): Directory of the embedded databases.
+        postgres_url (str): PostgreSQL URL, skipped when empty.
+
+    Returns:
+        Dict[str, StorageBackend]: The backends by name
+    """
+    backends = {
+        "sqlite-plain": StorageBackend(f"sqlite:///{directory}/plain.db"),
+        "sqlite": SQLiteBackend(f"sqlite:///{directory}/wal.db"),
+    }
+    try:
+        # pylint: disable=import-outside-toplevel,unused-import
+        import duckdb_engine  # noqa: F401
+
+        backends["duckdb"] = DuckDBBackend(f"duckdb:///{directory}/columnar.duckdb")
+    except ImportError:
+        print("duckdb_engine is not installed, skipping the duckdb backend")
+    if postgres_url:
+        backends["postgresql"] = PostgresBackend(postgres_url)
+    return backends
+
+
+def timed_map(threads: int, fn, items) -> float:
+    """Run a function over items from a thread pool
+
+    Args:
+        threads (int): Number of threads.
+        fn: Function to run.
+        items: Items to run the function on.
+
+    Returns:
+        float: Elapsed time in seconds
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(fn, items))
+    return time.perf_counter() - start
+
+
+def run(name: str, backend: StorageBackend, args, result: BenchmarkResult) -> None:
+    """Benchmark one backend
+
+    Args:
+        name (str): Backend name.
+        backend (StorageBackend): The backend.
+        args: Command line arguments.
+        result (BenchmarkResult): Result the metrics are added to.
+    """
+    crud = FaceEncoderCRUD(backend=backend)
+    crud.drop_db_and_tables()
+    crud.create_db_and_tables()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(256, 1, 128))
+    vectors /= np.linalg.norm(vectors, axis=2, keepdims=True)
+    payloads = [quantize(v, "float16") for v in vectors]
+    sessions = [uuid7() for _ in range(max(args.rows // 5, 1))]
+
+    elapsed = timed_map(
+        args.threads,
+        lambda i: crud.add_session(sessions[i % len(sessions)], payloads[i % 256]),
+        range(args.rows),
+    )
+    result.add(f"{name}.write_rows_per_s", args.rows / elapsed, "rows/s", True)
+
+    elapsed = timed_map(
+        args.threads,
+        lambda i: crud.get_session_encodings(sessions[i % len(sessions)]),
+        range(args.reads),
+    )
+    result.add(f"{name}.point_reads_per_s", args.reads / elapsed, "reads/s", True)
+
+    start = time.perf_counter()
+    with crud.get_session() as session:
+        stored = session.exec(select(FaceEncoderSession.face_encoding)).all()
+    matrix = np.concatenate([dequantize(s) for s in stored])
+    elapsed = time.perf_counter() - start
+    result.add(f"{name}.scan_rows_per_s", len(matrix) / elapsed, "rows/s", True)
+
+    crud.close()
+
+
+def main() -> None:
+    """Run the benchmark and save the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--reads", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--postgres-url", default=os.getenv("TEST_POSTGRES_URL"))
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    # Per-call INFO logs would dominate the timings.
+    logging.getLogger("face-encoder").setLevel(logging.WARNING)
+
+    result = BenchmarkResult(
+        "backends",
+        parameters={k: v for k, v in vars(args).items() if k != "postgres_url"},
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for name, backend in build_backends(directory, args.postgres_url).items():
+            run(name, backend, args, result)
+    result.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Embedding quantization benchmark
+
+Measures, for each quantization level, the accuracy loss (cosine similarity
+between the original and the restored vectors), the size of the JSON payload
+stored in ``sessions.face_encoding`` and the encode/decode time.
+
+Usage:
+    python -m benchmarks.bench_embedding_quantization --vectors 10000 --output quantization.json
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.common import BenchmarkResult
+from utils.helpers.embedding_utils import (
+    QUANTIZATION_LEVELS,
+    dequantize,
+    l2_normalize,
+    quantize,
+)
+
+
+def main() -> None:
+    """Run the benchmark and print one line per quantization level"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vectors", type=int, default=10000)
+    parser.add_argument("--dimension", type=int, default=128)
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    raw = rng.normal(size=(args.vectors, 1, args.dimension))
+    # What the service stored before post-processing: the raw encoder output.
+    baseline_bytes = sum(len(json.dumps(v.tolist())) for v in raw)
+
+    result = BenchmarkResult("embedding_quantization", parameters=vars(args))
+    result.add("raw.bytes_per_vector", baseline_bytes / args.vectors, "bytes")
+    for level in QUANTIZATION_LEVELS:
+        normalized = [l2_normalize(v)[0] for v in raw]
+
+        start = time.perf_counter()
+        stored = [quantize(v, level) for v in normalized]
+        encode_us = (time.perf_counter() - start) / args.vectors * 1e6
+
+        payloads = [json.dumps(s) for s in stored]
+        size = sum(map(len, payloads)) / args.vectors
+
+        start = time.perf_counter()
+        restored = [dequantize(json.loads(p)) for p in payloads]
+        decode_us = (time.perf_counter() - start) / args.vectors * 1e6
+
+        original = np.concatenate(normalized)
+        restored = l2_normalize(np.concatenate(restored))[0]
+        similarity = np.sum(original * restored, axis=1)
+        result.add(f"{level}.bytes_per_vector", size, "bytes")
+        result.add(f"{level}.encode_us", encode_us, "us")
+        result.add(f"{level}.decode_us", decode_us, "us")
+        result.add(f"{level}.min_cosine", similarity.min(), "", higher_is_better=True)
+        result.add(f"{level}.mean_cosine_loss", 1 - similarity.mean(), "")
+    result.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
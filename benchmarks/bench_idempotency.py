@@ -0,0 +1,113 @@
+"""Idempotency store benchmark
+
+Simulates clients that time out and retry their uploads with the same
+Idempotency-Key. Every request calls a stand-in encoder that sleeps for the
+encoder latency; a retry sent before the first attempt finished joins it and
+a later one replays the stored response. The report contains the encoder
+calls and encoder time saved, and the latency of first attempts and retries.
+
+Usage:
+    python -m benchmarks.bench_idempotency --requests 2000 --retry-rate 0.3 --output idempotency.json
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.common import BenchmarkResult
+from utils.helpers.idempotency_utils import IdempotencyStore, StoredResponse
+
+
+async def client(
+    store: IdempotencyStore,
+    request: int,
+    args: argparse.Namespace,
+    rng: random.Random,
+    latencies: Dict[str, List[float]],
+) -> None:
+    """Send a request and, at random, its retries
+
+    Args:
+        store (IdempotencyStore): The idempotency store.
+        request (int): Request number, used as the idempotency key.
+        args (argparse.Namespace): Command line arguments.
+        rng (random.Random): Random generator.
+        latencies (Dict[str, List[float]]): Latencies by attempt kind.
+    """
+
+    async def encoder() -> StoredResponse:
+        await asyncio.sleep(args.encoder_ms / 1000)
+        return StoredResponse(200, b'{"face_embedding": []}')
+
+    async def attempt(kind: str, delay_ms: float) -> None:
+        await asyncio.sleep(delay_ms / 1000)
+        start = time.perf_counter()
+        await store.run("upload", f"session:{request}", "digest", encoder)
+        latencies[kind].append((time.perf_counter() - start) * 1000)
+
+    # Retries are spread over twice the encoder latency, so that some of them
+    # join the first attempt and the others replay its response.
+    attempts = [attempt("first", 0.0)]
+    while len(attempts) <= args.max_retries and rng.random() < args.retry_rate:
+        attempts.append(attempt("retry", rng.uniform(0, 2 * args.encoder_ms)))
+    await asyncio.gather(*attempts)
+
+
+async def run(
+    args: argparse.Namespace,
+) -> Tuple[Dict[str, List[float]], IdempotencyStore]:
+    """Run the simulated clients
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    Returns:
+        Tuple[Dict[str, List[float]], IdempotencyStore]: Latencies by attempt
+        kind and the store
+    """
+    rng = random.Random(0)
+    store = IdempotencyStore()
+    latencies: Dict[str, List[float]] = {"first": [], "retry": []}
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(request: int) -> None:
+        async with semaphore:
+            await client(store, request, args, rng, latencies)
+
+    await asyncio.gather(*(bounded(i) for i in range(args.requests)))
+    return latencies, store
+
+
+def main() -> None:
+    """Run the benchmark and save the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--retry-rate", type=float, default=0.3)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--encoder-ms", type=float, default=20.0)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    latencies, store = asyncio.run(run(args))
+    metrics = store.metrics()["upload"]
+    attempts = metrics["executed"] + metrics["saved"]
+
+    result = BenchmarkResult("idempotency", parameters=vars(args))
+    result.add("encoder_calls", metrics["executed"], "calls")
+    result.add("encoder_calls_saved", metrics["saved"], "calls", True)
+    result.add("encoder_calls_saved_ratio", metrics["saved"] / attempts, "ratio", True)
+    result.add(
+        "encoder_time_saved_s", metrics["saved"] * args.encoder_ms / 1000, "s", True
+    )
+    result.add("joined", metrics["joined"], "calls")
+    result.add("replayed", metrics["replayed"], "calls")
+    result.add_latencies("first", latencies["first"])
+    result.add_latencies("retry", latencies["retry"])
+    result.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Image store benchmark
+
+Writes random images to each image store, then reads them back. Reports:
+
+- write throughput of the local store, and of the tiered store in front of
+  the fake S3 client with ``--s3-latency-ms`` per request
+- read throughput of the local store with ``read()`` and with ``mmap``, and
+  of the tiered store on a cold local tier
+- time to answer ``/images/{hash}`` with a ``FileResponse`` of the local
+  file, with the bytes read from the local store and with the bytes of the
+  in-memory cache, called as bare ASGI apps
+- cost of the in-memory cache: time of ``put`` and ``get``, and memory held
+  per cached image on top of the image bytes
+
+Usage:
+    python -m benchmarks.bench_image_store --images 2000 --image-size 65536 --output image_store.json
+"""
+
+import argparse
+import asyncio
+import mmap
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, List
+
+from fastapi.responses import FileResponse, Response
+
+from benchmarks.bench_rate_limit import receive, send
+from benchmarks.common import BenchmarkResult
+from benchmarks.fake_s3 import FakeS3Client
+from database.image_store import (
+    ImageCache,
+    LocalImageStore,
+    S3ImageStore,
+    TieredImageStore,
+)
+
+SCOPE = {"type": "http", "method": "GET", "path": "/images", "headers": []}
+
+
+def throughput(fn: Callable, items: List, image_size: int) -> float:
+    """Call a function on each item
+
+    Args:
+        fn (Callable): The function.
+        items (List): The items.
+        image_size (int): Size of each image in bytes.
+
+    Returns:
+        float: Megabytes per second
+    """
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return len(items) * image_size / (time.perf_counter() - start) / 1e6
+
+
+def mmap_read(path: str) -> bytes:
+    """Read a file through a memory map
+
+    Args:
+        path (str): File path.
+
+    Returns:
+        bytes: The file contents
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        return m[:]
+
+
+async def respond(responses: Callable, digests: List[str]) -> float:
+    """Send the response of each image
+
+    Args:
+        responses (Callable): Builds the response of an image hash.
+        digests (List[str]): The image hashes.
+
+    Returns:
+        float: Mean time per response in microseconds
+    """
+    start = time.perf_counter()
+    for digest in digests:
+        response = await responses(digest)
+        await response(SCOPE, receive, send)
+    return (time.perf_counter() - start) / len(digests) * 1e6
+
+
+def main() -> None:
+    """Run the benchmark and save the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--image-size", type=int, default=65536)
+    parser.add_argument("--s3-latency-ms", type=float, default=2.0)
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    result = BenchmarkResult("image_store", parameters=vars(args))
+    images = [os.urandom(args.image_size) for _ in range(args.images)]
+    size = args.image_size
+
+    with tempfile.TemporaryDirectory() as directory:
+        local = LocalImageStore(os.path.join(directory, "local"))
+        result.add(
+            "local.write_mb_per_s", throughput(local.put, images, size), "MB/s", True
+        )
+        digests = [local.put(image) for image in images]
+        result.add(
+            "local.read_mb_per_s", throughput(local.get, digests, size), "MB/s", True
+        )
+        paths = [local.path_for(digest) for digest in digests]
+        result.add(
+            "local.mmap_read_mb_per_s", throughput(mmap_read, paths, size), "MB/s", True
+        )
+
+        client = FakeS3Client(latency_ms=args.s3_latency_ms)
+        tiered = TieredImageStore(
+            S3ImageStore(client, "images"),
+            LocalImageStore(os.path.join(directory, "tier")),
+        )
+        result.add(
+            "tiered.write_mb_per_s", throughput(tiered.put, images, size), "MB/s", True
+        )
+        shutil.rmtree(tiered.local.root)
+        os.makedirs(tiered.local.root)
+        result.add(
+            "tiered.cold_read_mb_per_s",
+            throughput(tiered.get, digests, size),
+            "MB/s",
+            True,
+        )
+        result.add(
+            "tiered.warm_read_mb_per_s",
+            throughput(tiered.get, digests, size),
+            "MB/s",
+            True,
+        )
+
+        cache = ImageCache(max_bytes=len(images) * size, max_image_bytes=size)
+        for image, digest in zip(images, digests):
+            cache.put(digest, image)
+
+        async def file_response(digest: str) -> FileResponse:
+            return FileResponse(
+                await asyncio.to_thread(local.local_path, digest),
+                media_type="application/octet-stream",
+            )
+
+        async def read_response(digest: str) -> Response:
+            return Response(
+                await asyncio.to_thread(local.get, digest),
+                media_type="application/octet-stream",
+            )
+
+        async def cached_response(digest: str) -> Response:
+            return Response(cache.get(digest), media_type="application/octet-stream")
+
+        result.add(
+            "response.file_us", asyncio.run(respond(file_response, digests)), "us"
+        )
+        result.add(
+            "response.read_us", asyncio.run(respond(read_response, digests)), "us"
+        )
+        result.add(
+            "response.cached_us", asyncio.run(respond(cached_response, digests)), "us"
+        )
+
+    cache = ImageCache(max_bytes=len(images) * size, max_image_bytes=size)
+    start = time.perf_counter()
+    for image, digest in zip(images, digests):
+        cache.put(digest, image)
+    result.add("cache.put_us", (time.perf_counter() - start) / len(images) * 1e6, "us")
+    start = time.perf_counter()
+    for digest in digests:
+        cache.get(digest)
+    result.add("cache.get_us", (time.perf_counter() - start) / len(images) * 1e6, "us")
+
+    # The image bytes are shared with the caller, only the bookkeeping of the
+    # cache is allocated.
+    tracemalloc.start()
+    cache = ImageCache(max_bytes=len(images) * size, max_image_bytes=size)
+    before = tracemalloc.get_traced_memory()[0]
+    for image, digest in zip(images, digests):
+        cache.put(digest, image)
+    overhead = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    result.add("cache.overhead_bytes_per_image", overhead / len(images), "bytes")
+    result.add("cache.held_mb", cache.nbytes / 1e6, "MB")
+    result.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
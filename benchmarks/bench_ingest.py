@@ -0,0 +1,194 @@
+"""Bulk ingest benchmark
+
+Builds a synthetic corpus of random images grouped by user, starts the fake
+face-encoding service in a subprocess and ingests the corpus into a SQLite
+database with :class:`face_encoder.ingest.Ingestor`. Reports:
+
+- throughput of the pipeline, and of the same pipeline sending one image at
+  a time and writing one row per transaction, as ``/upload`` does
+- time to resume a completed run from its checkpoint
+
+Usage:
+    python -m benchmarks.bench_ingest --images 100000 --latency-ms 20 --output ingest.json
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import BenchmarkResult, max_rss_mb
+from database.backends import SQLiteBackend
+from database.crud import FaceEncoderCRUD
+from face_encoder.ingest import IngestCheckpoint, Ingestor, discover_images
+
+
+def build_corpus(directory: str, images: int, per_user: int, image_size: int) -> None:
+    """Write a synthetic corpus
+
+    Args:
+        directory (str): Corpus directory.
+        images (int): Number of images.
+        per_user (int): Images per user directory.
+        image_size (int): Size of each image in bytes.
+    """
+    for i in range(images):
+        user_dir = os.path.join(directory, f"user-{i // per_user:07d}")
+        if i % per_user == 0:
+            os.makedirs(user_dir)
+        with open(os.path.join(user_dir, f"{i % per_user}.jpg"), "wb") as f:
+            f.write(os.urandom(image_size))
+
+
+def free_port() -> int:
+    """Get a free local TCP port
+
+    Returns:
+        int: The port
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_encoder(port: int, latency_ms: float) -> subprocess.Popen:
+    """Start the fake face-encoding service and wait until it answers
+
+    Args:
+        port (int): Port to listen on.
+        latency_ms (float): Latency of each request.
+
+    Raises:
+        RuntimeError: The service did not start
+
+    Returns:
+        subprocess.Popen: The service process
+    """
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.fake_face_encoding",
+            "--port",
+            str(port),
+            "--latency-ms",
+            str(latency_ms),
+        ]
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/ping", timeout=1.0)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("The fake face-encoding service did not start")
+
+
+def ingest(
+    directory: str, items, checkpoint_path: str, port: int, **options
+) -> Ingestor:
+    """Ingest images into a SQLite database of the directory
+
+    Args:
+        directory (str): Directory of the database.
+        items: The images.
+        checkpoint_path (str): Checkpoint file.
+        port (int): Port of the fake face-encoding service.
+
+    Returns:
+        Ingestor: The ingestor, with the statistics of the run
+    """
+    crud = FaceEncoderCRUD(backend=SQLiteBackend(f"sqlite:///{directory}/ingest.db"))
+    crud.create_db_and_tables()
+    checkpoint = IngestCheckpoint(checkpoint_path)
+    ingestor = Ingestor(
+        crud, checkpoint, host="127.0.0.1", port=port, progress_interval=5.0, **options
+    )
+    try:
+        asyncio.run(ingestor.run(items))
+    finally:
+        checkpoint.close()
+        crud.close()
+    return ingestor
+
+
+def main() -> None:
+    """Run the benchmark and save the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=100000)
+    parser.add_argument("--per-user", type=int, default=5)
+    parser.add_argument("--image-size", type=int, default=2048)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--sequential-images",
+        type=int,
+        default=500,
+        help="Images ingested one at a time, as a baseline",
+    )
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    # Per-batch INFO logs would dominate the output.
+    logging.getLogger("face-encoder").setLevel(logging.WARNING)
+
+    result = BenchmarkResult("ingest", parameters=vars(args))
+    port = free_port()
+    encoder = start_fake_encoder(port, args.latency_ms)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            corpus = os.path.join(directory, "corpus")
+            start = time.perf_counter()
+            build_corpus(corpus, args.images, args.per_user, args.image_size)
+            result.add("corpus.build_s", time.perf_counter() - start, "s")
+            items = discover_images(corpus)
+            checkpoint = os.path.join(directory, "checkpoint.jsonl")
+
+            stats = ingest(
+                directory,
+                items,
+                checkpoint,
+                port,
+                workers=args.workers,
+                concurrency=args.concurrency,
+                batch_size=args.batch_size,
+            ).stats
+            result.add("bulk.images_per_s", stats.rate(), "images/s", True)
+            result.add("bulk.elapsed_s", stats.elapsed, "s")
+            result.add("bulk.failed", stats.failed, "images")
+
+            stats = ingest(directory, items, checkpoint, port).stats
+            result.add("resume.elapsed_s", stats.elapsed, "s")
+            result.add("resume.skipped", stats.skipped, "images", True)
+
+            baseline_dir = os.path.join(directory, "sequential")
+            os.makedirs(baseline_dir)
+            stats = ingest(
+                baseline_dir,
+                items[: args.sequential_images],
+                None,
+                port,
+                workers=1,
+                concurrency=1,
+                batch_size=1,
+            ).stats
+            result.add("sequential.images_per_s", stats.rate(), "images/s", True)
+    finally:
+        encoder.terminate()
+        encoder.wait()
+    result.add("client.max_rss_mb", max_rss_mb(), "MB")
+    result.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Profiling overhead benchmark
+
+Calls bare ASGI apps recording the spans of an ``/upload`` request directly,
+in these configurations:
+
+- ``baseline``: the app without spans
+- ``disabled``: ``PROFILING_ENABLED=false``. The CRUD is not proxied, only the
+  explicit encoder and post-processing spans run, as no-ops
+- ``sampled_<rate>``: profiling middleware tracing a fraction of the requests,
+  with the CRUD spans of the proxy
+- ``capture``: disabled, while a ``/debug/profile`` capture samples the stacks
+
+Usage:
+    python -m benchmarks.bench_profiling --requests 200000 --output profiling.json
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+import timeit
+
+from benchmarks.bench_rate_limit import receive, send
+from benchmarks.common import BenchmarkResult
+from face_encoder.app.middleware import ProfilingMiddleware
+from utils.helpers.profiling_utils import ProfilingConfig, StackSampler, span
+
+EXPLICIT_SPANS = ("face_encoding", "postprocess")
+SPANS = (
+    "crud.check_if_session_exists",
+    "crud.get_session_count",
+    "face_encoding",
+    "crud.get_session_encodings",
+    "postprocess",
+    "crud.add_session",
+)
+
+SCOPE = {
+    "type": "http",
+    "method": "POST",
+    "path": "/upload",
+    "query_string": b"",
+    "headers": [],
+}
+
+
+async def bare_app(scope, receive_, send_) -> None:
+    """ASGI app that answers 200 with an empty body"""
+    await send_({"type": "http.response.start", "status": 200, "headers": []})
+    await send_({"type": "http.response.body", "body": b""})
+
+
+async def disabled_app(scope, receive_, send_) -> None:
+    """ASGI app entering the explicit spans of an upload, then answering 200"""
+    for name in EXPLICIT_SPANS:
+        with span(name):
+            pass
+    await bare_app(scope, receive_, send_)
+
+
+async def spanned_app(scope, receive_, send_) -> None:
+    """ASGI app recording every span of an upload, then answering 200"""
+    for name in SPANS:
+        with span(name):
+            pass
+    await bare_app(scope, receive_, send_)
+
+
+async def run(app, requests: int) -> float:
+    """Send requests to an app
+
+    Args:
+        app: ASGI app.
+        requests (int): Number of requests.
+
+    Returns:
+        float: Mean time per request in microseconds
+    """
+    start = time.perf_counter()
+    for _ in range(requests):
+        await app(SCOPE, receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def best_of(app, requests: int, repeat: int) -> float:
+    """Run a configuration several times
+
+    Args:
+        app: ASGI app.
+        requests (int): Requests per run.
+        repeat (int): Number of runs.
+
+    Returns:
+        float: Best mean time per request in microseconds
+    """
+    return min(asyncio.run(run(app, requests)) for _ in range(repeat))
+
+
+def main() -> None:
+    """Run the benchmark and print the overhead per request"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--sample-rates", type=float, nargs="+", default=[0.0, 0.01, 1.0]
+    )
+    parser.add_argument("--interval-ms", type=float, default=5.0)
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    result = BenchmarkResult("profiling", parameters=vars(args))
+    result.add(
+        "span.disabled_ns",
+        min(timeit.repeat(lambda: span("crud"), number=100000, repeat=5))
+        / 100000
+        * 1e9,
+        "ns",
+    )
+
+    baseline = best_of(bare_app, args.requests, args.repeat)
+    result.add("baseline_us", baseline, "us")
+    disabled = best_of(disabled_app, args.requests, args.repeat)
+    result.add("disabled_us", disabled, "us")
+    result.add("disabled.overhead_us", disabled - baseline, "us")
+
+    for rate in args.sample_rates:
+        config = ProfilingConfig()
+        config.sample_rate = rate
+        config.slow_request_ms = float("inf")
+        app = ProfilingMiddleware(spanned_app, config)
+        elapsed = best_of(app, args.requests, args.repeat)
+        result.add(f"sampled_{rate:g}_us", elapsed, "us")
+        result.add(f"sampled_{rate:g}.overhead_us", elapsed - baseline, "us")
+
+    sampler = StackSampler(args.interval_ms / 1000)
+    stop = threading.Event()
+
+    def capture() -> None:
+        while not stop.is_set():
+            sampler.run(0.1)
+
+    thread = threading.Thread(target=capture, daemon=True)
+    thread.start()
+    try:
+        elapsed = best_of(disabled_app, args.requests, args.repeat)
+    finally:
+        stop.set()
+        thread.join()
+    result.add("capture_us", elapsed, "us")
+    result.add("capture.overhead_us", elapsed - disabled, "us")
+    result.add("capture.samples", sampler.samples, "samples")
+    result.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
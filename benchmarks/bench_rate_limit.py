@@ -0,0 +1,107 @@
+"""Rate limit middleware overhead benchmark
+
+Calls a bare ASGI app directly, with and without ``RateLimitMiddleware``,
+spreading the requests over a configurable number of distinct keys.
+
+Usage:
+    python -m benchmarks.bench_rate_limit --keys 10000 --requests 200000 --output rate_limit.json
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import BenchmarkResult
+from face_encoder.app.middleware import RateLimitMiddleware
+from utils.helpers.rate_limit_utils import InMemoryRateLimitStore, RateLimitConfig
+
+
+async def bare_app(scope, receive, send) -> None:
+    """ASGI app that answers 200 with an empty body"""
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive():
+    """ASGI receive channel of a request without body"""
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(_message) -> None:
+    """ASGI send channel that drops every message"""
+
+
+def build_scopes(keys: int, path: str, param: str):
+    """Build one ASGI scope per distinct key
+
+    Args:
+        keys (int): Number of distinct keys.
+        path (str): Request path.
+        param (str): Query parameter holding the key.
+
+    Returns:
+        List[Dict]: The ASGI scopes
+    """
+    return [
+        {
+            "type": "http",
+            "path": path,
+            "query_string": f"{param}={i}".encode(),
+            "headers": [],
+            "client": (f"10.0.{i // 256 % 256}.{i % 256}", 1234),
+        }
+        for i in range(keys)
+    ]
+
+
+async def run(app, scopes, requests: int) -> float:
+    """Send requests round-robin over the scopes
+
+    Args:
+        app: ASGI app.
+        scopes (List[Dict]): ASGI scopes.
+        requests (int): Number of requests.
+
+    Returns:
+        float: Mean time per request in microseconds
+    """
+    n_scopes = len(scopes)
+    start = time.perf_counter()
+    for i in range(requests):
+        await app(scopes[i % n_scopes], receive, send)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main() -> None:
+    """Run the benchmark and print the overhead per request"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--keys", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    config = RateLimitConfig()
+    # Generous limits: measure the bookkeeping, not the rejections.
+    config.user_rate = config.ip_rate = 1e9
+    config.user_burst = config.ip_burst = 1e9
+
+    results = {}
+    for path, param in (("/start_session", "user_id"), ("/upload", "session_id")):
+        scopes = build_scopes(args.keys, path, param)
+        limited = RateLimitMiddleware(bare_app, InMemoryRateLimitStore(), config)
+        baseline = asyncio.run(run(bare_app, scopes, args.requests))
+        with_limit = asyncio.run(run(limited, scopes, args.requests))
+        results[path] = (baseline, with_limit, len(limited.store))
+
+    result = BenchmarkResult("rate_limit", parameters=vars(args))
+    for path, (baseline, with_limit, n_keys) in results.items():
+        name = path.strip("/")
+        result.add(f"{name}.baseline_us", baseline, "us")
+        result.add(f"{name}.with_middleware_us", with_limit, "us")
+        result.add(f"{name}.overhead_us", with_limit - baseline, "us")
+        result.add(f"{name}.buckets", n_keys, "keys")
+    result.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Re-encode benchmark
+
+Fills a SQLite database with uploads encoded by version 1 of the encoder,
+with their images in a local image store, starts the fake face-encoding
+service in a subprocess and re-encodes them with version 2 using
+:class:`face_encoder.reencode.Reencoder`. Reports:
+
+- re-encode throughput without throttling
+- achieved rate of a throttled run, relative to the configured rate
+- throughput of the promotion of the re-encoded encodings
+
+Usage:
+    python -m benchmarks.bench_reencode --rows 20000 --latency-ms 20 --output reencode.json
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.bench_ingest import free_port, start_fake_encoder
+from benchmarks.common import BenchmarkResult
+from database.backends import SQLiteBackend
+from database.crud import FaceEncoderCRUD
+from database.image_store import LocalImageStore
+from face_encoder.reencode import Reencoder, ReencodeStats
+from utils.helpers.embedding_utils import EmbeddingConfig
+from utils.helpers.session_utils import uuid7
+
+MODEL = "face-encoding"
+
+
+def populate(
+    path: str, store: LocalImageStore, rows: int, image_size: int
+) -> FaceEncoderCRUD:
+    """Create a database of uploads encoded by version 1
+
+    Args:
+        path (str): Database file.
+        store (LocalImageStore): Image store the images are written to.
+        rows (int): Number of uploads.
+        image_size (int): Size of each image in bytes.
+
+    Returns:
+        FaceEncoderCRUD: CRUD of the database
+    """
+    crud = FaceEncoderCRUD(backend=SQLiteBackend(f"sqlite:///{path}"))
+    crud.create_db_and_tables()
+    encodings = {"dtype": "none", "data": [[1.0]]}
+    for offset in range(0, rows, 1000):
+        session_id = uuid7()
+        batch = [
+            (session_id, encodings, store.put(os.urandom(image_size)))
+            for _ in range(min(1000, rows - offset))
+        ]
+        crud.add_sessions(batch, MODEL, "1")
+    return crud
+
+
+def reencode(
+    crud: FaceEncoderCRUD, store: LocalImageStore, port: int, **options
+) -> ReencodeStats:
+    """Re-encode the uploads of a database with version 2
+
+    Args:
+        crud (FaceEncoderCRUD): CRUD of the database.
+        store (LocalImageStore): The image store.
+        port (int): Port of the fake face-encoding service.
+
+    Returns:
+        ReencodeStats: Statistics of the run
+    """
+    config = EmbeddingConfig()
+    config.encoder_model, config.encoder_version = MODEL, "2"
+    reencoder = Reencoder(
+        crud,
+        store,
+        config,
+        host="127.0.0.1",
+        port=port,
+        progress_interval=5.0,
+        **options,
+    )
+    return asyncio.run(reencoder.run())
+
+
+def main() -> None:
+    """Run the benchmark and save the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--image-size", type=int, default=2048)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=50.0, help="Throttled rate")
+    parser.add_argument(
+        "--throttled-rows",
+        type=int,
+        default=500,
+        help="Uploads re-encoded at --rate",
+    )
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    # Per-page INFO logs would dominate the output.
+    logging.getLogger("face-encoder").setLevel(logging.WARNING)
+
+    result = BenchmarkResult("reencode", parameters=vars(args))
+    port = free_port()
+    encoder = start_fake_encoder(port, args.latency_ms)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            store = LocalImageStore(os.path.join(directory, "images"))
+
+            crud = populate(
+                os.path.join(directory, "full.db"), store, args.rows, args.image_size
+            )
+            try:
+                stats = reencode(
+                    crud,
+                    store,
+                    port,
+                    rate=0,
+                    concurrency=args.concurrency,
+                    batch_size=args.batch_size,
+                )
+                result.add("unthrottled.rows_per_s", stats.rate(), "rows/s", True)
+                result.add("unthrottled.failed", stats.failed, "rows")
+
+                start = time.perf_counter()
+                promoted = crud.promote_pending_encodings(MODEL, "2")
+                elapsed = time.perf_counter() - start
+                result.add("promote.rows_per_s", promoted / elapsed, "rows/s", True)
+            finally:
+                crud.close()
+
+            crud = populate(
+                os.path.join(directory, "throttled.db"),
+                store,
+                args.throttled_rows,
+                args.image_size,
+            )
+            try:
+                stats = reencode(
+                    crud,
+                    store,
+                    port,
+                    rate=args.rate,
+                    burst=1.0,
+                    concurrency=args.concurrency,
+                    batch_size=args.batch_size,
+                )
+                result.add("throttled.rows_per_s", stats.rate(), "rows/s")
+                result.add("throttled.rate_ratio", stats.rate() / args.rate, "x")
+            finally:
+                crud.close()
+    finally:
+        encoder.terminate()
+        encoder.wait()
+    result.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Session ID benchmark
+
+Compares the legacy session IDs (MD5 hex digest of the time and a uuid4,
+stored as a ``VARCHAR`` primary key) with random (uuid4) and time-ordered
+(uuid7) IDs stored in 16 byte columns:
+
+- generation cost of each scheme
+- insert throughput into a table keyed by the ID, in batches, on SQLite and,
+  when ``--postgres-url`` is given, PostgreSQL
+- size of the table and its primary key index after the inserts
+
+Random keys land anywhere in the B-tree and split its pages, time-ordered
+keys are appended to its right-most page.
+
+Usage:
+    python -m benchmarks.bench_session_ids --rows 200000 --output session_ids.json
+"""
+
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+import timeit
+import uuid
+from typing import Any, Callable, Dict
+
+from sqlalchemy import (
+    Column,
+    Engine,
+    MetaData,
+    String,
+    Table,
+    Text,
+    create_engine,
+    insert,
+    text,
+)
+
+from benchmarks.common import BenchmarkResult
+from database.types import BinaryUUID
+from utils.helpers.session_utils import uuid7
+
+
+def legacy_unique_id() -> str:
+    """Session ID of the previous scheme
+
+    Returns:
+        str: MD5 hex digest of the time and a uuid4
+    """
+    timestamp = str(time.time())
+    random_str = str(uuid.uuid4())
+    return hashlib.md5((timestamp + random_str).encode()).hexdigest()
+
+
+SCHEMES: Dict[str, Dict[str, Any]] = {
+    "legacy_md5": {"generate": legacy_unique_id, "type": String(32)},
+    "uuid4": {"generate": uuid.uuid4, "type": BinaryUUID},
+    "uuid7": {"generate": uuid7, "type": BinaryUUID},
+}
+
+
+def generation_ns(generate: Callable[[], Any], count: int) -> float:
+    """Measure the cost of an ID generator
+
+    Args:
+        generate (Callable[[], Any]): ID generator.
+        count (int): Number of IDs to generate.
+
+    Returns:
+        float: Nanoseconds per ID, best of 5 runs
+    """
+    return min(timeit.repeat(generate, number=count, repeat=5)) / count * 1e9
+
+
+def table_size_mb(engine: Engine, table: str) -> float:
+    """Get the size of a table and its indexes
+
+    Args:
+        engine (Engine): The database engine.
+        table (str): Table name.
+
+    Returns:
+        float: Size in megabytes
+    """
+    with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            size = connection.execute(
+                text("SELECT pg_total_relation_size(:table)"), {"table": table}
+            ).scalar()
+        else:
+            # Every scheme has its own database file.
+            page_count = connection.execute(text("PRAGMA page_count")).scalar()
+            page_size = connection.execute(text("PRAGMA page_size")).scalar()
+            size = page_count * page_size
+    return size / 1024 / 1024
+
+
+def run_inserts(
+    name: str, url: str, scheme: str, args: argparse.Namespace, result: BenchmarkResult
+) -> None:
+    """Benchmark the inserts of one ID scheme on one database
+
+    Args:
+        name (str): Database name.
+        url (str): Database URL.
+        scheme (str): ID scheme.
+        args (argparse.Namespace): Command line arguments.
+        result (BenchmarkResult): Result the metrics are added to.
+    """
+    engine = create_engine(url)
+    table = Table(
+        f"bench_session_ids_{scheme}",
+        MetaData(),
+        Column("session_id", SCHEMES[scheme]["type"], primary_key=True),
+        Column("user_id", Text, nullable=False),
+    )
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+
+    generate = SCHEMES[scheme]["generate"]
+    statement = insert(table)
+    start = time.perf_counter()
+    for offset in range(0, args.rows, args.batch):
+        rows = [
+            {"session_id": generate(), "user_id": f"user-{offset + i}"}
+            for i in range(min(args.batch, args.rows - offset))
+        ]
+        with engine.begin() as connection:
+            connection.execute(statement, rows)
+    elapsed = time.perf_counter() - start
+
+    result.add(
+        f"{name}.{scheme}.insert_rows_per_s", args.rows / elapsed, "rows/s", True
+    )
+    result.add(f"{name}.{scheme}.size_mb", table_size_mb(engine, table.name), "MB")
+    table.drop(engine)
+    engine.dispose()
+
+
+def main() -> None:
+    """Run the benchmark and save the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--generate", type=int, default=100000)
+    parser.add_argument("--postgres-url", default=os.getenv("TEST_POSTGRES_URL"))
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    result = BenchmarkResult(
+        "session_ids",
+        parameters={k: v for k, v in vars(args).items() if k != "postgres_url"},
+    )
+    for scheme, spec in SCHEMES.items():
+        result.add(
+            f"generate.{scheme}_ns",
+            generation_ns(spec["generate"], args.generate),
+            "ns",
+        )
+
+    with tempfile.TemporaryDirectory() as directory:
+        for scheme in SCHEMES:
+            run_inserts(
+                "sqlite", f"sqlite:///{directory}/{scheme}.db", scheme, args, result
+            )
+    if args.postgres_url:
+        for scheme in SCHEMES:
+            run_inserts("postgresql", args.postgres_url, scheme, args, result)
+    result.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
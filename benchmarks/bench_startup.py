@@ -0,0 +1,200 @@
+"""Startup benchmark
+
+Measures how fast a new instance of the application serves traffic:
+
+- import time of ``face_encoder.app.app`` and ``face_encoder.__main__``, from
+  ``python -X importtime``, with the slowest packages they import
+- time from the start of the uvicorn process to the first ``/live`` and
+  ``/ready`` answers, on a fresh SQLite database
+- latency of the first and second ``/upload`` against the fake face-encoding
+  service, with and without the warm-up
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5 --latency-ms 5 --output startup.json
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks.bench_ingest import free_port, start_fake_encoder
+from benchmarks.common import BenchmarkResult
+
+
+def import_times(module: str, env: Dict[str, str]) -> Tuple[float, List[Tuple]]:
+    """Import a module in a new interpreter with ``-X importtime``
+
+    Args:
+        module (str): Module to import.
+        env (Dict[str, str]): Environment of the interpreter.
+
+    Returns:
+        Tuple[float, List[Tuple]]: Import time of the module in milliseconds,
+        and the cumulative milliseconds of each top-level package it imports,
+        slowest first
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    total, packages = 0.0, []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        name, ms = name.strip(), int(cumulative) / 1000
+        if name == module:
+            total = ms
+        elif "." not in name and not name.startswith("_"):
+            packages.append((name, ms))
+    return total, sorted(packages, key=lambda item: item[1], reverse=True)
+
+
+def wait_for(client: httpx.Client, path: str, timeout: float = 60.0) -> None:
+    """Poll an endpoint until it answers 200
+
+    Args:
+        client (httpx.Client): Client of the application.
+        path (str): Endpoint.
+        timeout (float, optional): Maximum wait in seconds. Defaults to 60.0.
+
+    Raises:
+        RuntimeError: The endpoint did not answer 200 in time
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(path).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError(f"{path} did not answer in {timeout:.0f}s")
+
+
+def first_requests(env: Dict[str, str]) -> Dict[str, float]:
+    """Start the application and time its first requests
+
+    Args:
+        env (Dict[str, str]): Environment of the application.
+
+    Returns:
+        Dict[str, float]: Milliseconds to ``/live`` and ``/ready``, and latency
+        of the first and second upload
+    """
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "face_encoder.app.app:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    timings = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5.0) as client:
+            wait_for(client, "/live")
+            timings["live_ms"] = (time.perf_counter() - start) * 1000
+            wait_for(client, "/ready")
+            timings["ready_ms"] = (time.perf_counter() - start) * 1000
+
+            session_id = client.post(
+                "/start_session", params={"user_id": "user"}
+            ).json()["session_id"]
+            for upload in ("first_upload_ms", "second_upload_ms"):
+                upload_start = time.perf_counter()
+                response = client.post(
+                    "/upload",
+                    params={"session_id": session_id},
+                    files={"file": os.urandom(1024)},
+                )
+                timings[upload] = (time.perf_counter() - upload_start) * 1000
+                response.raise_for_status()
+    finally:
+        process.terminate()
+        process.wait()
+    return timings
+
+
+def main() -> None:
+    """Run the benchmark and save the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports shown")
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    result = BenchmarkResult("startup", parameters=vars(args))
+    encoder_port = free_port()
+    encoder = start_fake_encoder(encoder_port, args.latency_ms)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                DB_BACKEND="sqlite",
+                DB_ECHO="false",
+                FACE_ENCODING_HOST="127.0.0.1",
+                FACE_ENCODING_PORT=str(encoder_port),
+                RATE_LIMIT_ENABLED="false",
+            )
+
+            for module in ("face_encoder.app.app", "face_encoder.__main__"):
+                runs = [
+                    import_times(module, dict(env, DB_PATH=f"{directory}/import.db"))
+                    for _ in range(args.runs)
+                ]
+                result.add(
+                    f"import.{module}_ms",
+                    statistics.median(total for total, _ in runs),
+                    "ms",
+                )
+                print(f"Slowest imports of {module}:")
+                for name, ms in runs[-1][1][: args.top]:
+                    print(f"  {name:<40} {ms:8.1f} ms")
+
+            for warmup in ("true", "false"):
+                runs = [
+                    first_requests(
+                        dict(
+                            env,
+                            DB_PATH=f"{directory}/warmup-{warmup}-{run}.db",
+                            WARMUP_ENABLED=warmup,
+                        )
+                    )
+                    for run in range(args.runs)
+                ]
+                prefix = "warmup" if warmup == "true" else "no_warmup"
+                for name in runs[0]:
+                    result.add(
+                        f"{prefix}.{name}",
+                        statistics.median(run[name] for run in runs),
+                        "ms",
+                    )
+    finally:
+        encoder.terminate()
+        encoder.wait()
+    result.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Shared helpers of the benchmark suite
+
+Every benchmark writes a JSON document with the same layout::
+
+    {
+        "benchmark": "crud",
+        "metadata": {"timestamp": ..., "python": ..., "platform": ..., "commit": ...},
+        "metrics": {
+            "add_session.p95_ms": {"value": 1.2, "unit": "ms", "higher_is_better": false},
+            ...
+        }
+    }
+
+so that :func:`compare_results` can compare any two runs of the same benchmark.
+"""
+
+import fnmatch
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_THRESHOLD = 0.10
+
+
+class BenchmarkResult:
+    """Benchmark Result Class"""
+
+    def __init__(self, benchmark: str, parameters: Dict = None) -> None:
+        self.benchmark = benchmark
+        self.parameters = parameters or {}
+        self.metrics: Dict[str, Dict] = {}
+
+    def add(
+        self, name: str, value: float, unit: str, higher_is_better: bool = False
+    ) -> None:
+        """Record a metric
+
+        Args:
+            name (str): Metric name.
+            value (float): Metric value.
+            unit (str): Unit of the value.
+            higher_is_better (bool, optional): Direction of improvement. Defaults to False.
+        """
+        self.metrics[name] = {
+            "value": float(value),
+            "unit": unit,
+            "higher_is_better": higher_is_better,
+        }
+
+    def add_latencies(self, prefix: str, samples_ms: List[float]) -> None:
+        """Record the mean and percentiles of a list of latencies
+
+        Args:
+            prefix (str): Metric name prefix.
+            samples_ms (List[float]): Latencies in milliseconds.
+        """
+        for name, value in latency_summary(samples_ms).items():
+            self.add(f"{prefix}.{name}", value, "ms")
+
+    def to_dict(self) -> Dict:
+        """Get the JSON representation of the result
+
+        Returns:
+            Dict: The result
+        """
+        return {
+            "benchmark": self.benchmark,
+            "metadata": run_metadata(),
+            "parameters": self.parameters,
+            "metrics": self.metrics,
+        }
+
+    def save(self, path: Optional[str]) -> None:
+        """Print the metrics and write them as JSON
+
+        Args:
+            path (Optional[str]): Output file. Nothing is written when None.
+        """
+        width = max((len(name) for name in self.metrics), default=0)
+        for name, metric in self.metrics.items():
+            print(f"{name:<{width}}  {metric['value']:>14.6g} {metric['unit']}")
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, indent=2)
+            print(f"Results saved to {path}")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Get a percentile with linear interpolation
+
+    Args:
+        samples (List[float]): Samples, in any order.
+        pct (float): Percentile between 0 and 100.
+
+    Returns:
+        float: The percentile, 0.0 when there are no samples
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_summary(samples_ms: List[float]) -> Dict[str, float]:
+    """Summarize latencies
+
+    Args:
+        samples_ms (List[float]): Latencies in milliseconds.
+
+    Returns:
+        Dict[str, float]: Mean, p50, p95 and p99 in milliseconds
+    """
+    return {
+        "mean_ms": sum(samples_ms) / len(samples_ms) if samples_ms else 0.0,
+        "p50_ms": percentile(samples_ms, 50),
+        "p95_ms": percentile(samples_ms, 95),
+        "p99_ms": percentile(samples_ms, 99),
+    }
+
+
+def max_rss_mb() -> float:
+    """Get the peak resident memory of the current process
+
+    Returns:
+        float: Peak RSS in megabytes
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+def process_rss_mb(pid: int) -> Optional[float]:
+    """Get the current resident memory of another process (Linux only)
+
+    Args:
+        pid (int): Process ID.
+
+    Returns:
+        Optional[float]: RSS in megabytes, None if it cannot be read
+    """
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def run_metadata() -> Dict:
+    """Get the metadata of the current run
+
+    Returns:
+        Dict: Timestamp, interpreter, platform and git commit
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=False,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def load_result(path: str) -> Dict:
+    """Load a result written by :meth:`BenchmarkResult.save`
+
+    Args:
+        path (str): Result file.
+
+    Returns:
+        Dict: The result
+    """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def threshold_for(name: str, thresholds: Dict[str, float], default: float) -> float:
+    """Get the allowed relative regression of a metric
+
+    Args:
+        name (str): Metric name.
+        thresholds (Dict[str, float]): Thresholds by metric glob pattern.
+        default (float): Threshold of metrics without a matching pattern.
+
+    Returns:
+        float: The allowed relative regression
+    """
+    for pattern, value in thresholds.items():
+        if fnmatch.fnmatch(name, pattern):
+            return value
+    return default
+
+
+def compare_results(
+    baseline: Dict,
+    current: Dict,
+    thresholds: Dict[str, float] = None,
+    default_threshold: float = DEFAULT_THRESHOLD,
+) -> List[Dict]:
+    """Compare two results of the same benchmark
+
+    Args:
+        baseline (Dict): Reference result.
+        current (Dict): New result.
+        thresholds (Dict[str, float], optional): Allowed relative regression by
+            metric glob pattern. Defaults to None.
+        default_threshold (float, optional): Allowed relative regression of the
+            other metrics. Defaults to DEFAULT_THRESHOLD.
+
+    Returns:
+        List[Dict]: One entry per metric present in both results, with its
+        relative change and whether it is a regression
+    """
+    thresholds = thresholds or {}
+    rows = []
+    for name, base in baseline["metrics"].items():
+        if name not in current["metrics"]:
+            continue
+        value = current["metrics"][name]["value"]
+        if base["value"] == 0:
+            change = 0.0 if value == 0 else float("inf")
+        else:
+            change = (value - base["value"]) / abs(base["value"])
+        worse = -change if base["higher_is_better"] else change
+        allowed = threshold_for(name, thresholds, default_threshold)
+        rows.append(
+            {
+                "metric": name,
+                "baseline": base["value"],
+                "current": value,
+                "unit": base["unit"],
+                "change": change,
+                "threshold": allowed,
+                "regression": worse > allowed,
+            }
+        )
+    return rows
+
+
+def regressions(rows: Iterable[Dict]) -> List[Dict]:
+    """Keep the regressed metrics of a comparison
+
+    Args:
+        rows (Iterable[Dict]): Output of :func:`compare_results`.
+
+    Returns:
+        List[Dict]: The regressed metrics
+    """
+    return [row for row in rows if row["regression"]]
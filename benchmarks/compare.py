@@ -0,0 +1,73 @@
+"""Compare two benchmark results and fail on regression
+
+Usage:
+    python -m benchmarks.compare baseline.json current.json \
+        --threshold 0.1 --thresholds benchmarks/thresholds.json
+
+Exits with status 1 when a metric regressed by more than its threshold.
+"""
+
+import argparse
+import json
+import sys
+
+from benchmarks.common import (
+    DEFAULT_THRESHOLD,
+    compare_results,
+    load_result,
+    regressions,
+)
+
+
+def main() -> int:
+    """Compare the results and print a report
+
+    Returns:
+        int: Exit status
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Allowed relative regression of metrics without a specific threshold",
+    )
+    parser.add_argument(
+        "--thresholds",
+        help="JSON file mapping metric glob patterns to allowed relative regressions",
+    )
+    args = parser.parse_args()
+
+    baseline = load_result(args.baseline)
+    current = load_result(args.current)
+    if baseline["benchmark"] != current["benchmark"]:
+        print(f"Cannot compare '{baseline['benchmark']}' with '{current['benchmark']}'")
+        return 2
+
+    thresholds = {}
+    if args.thresholds:
+        with open(args.thresholds, encoding="utf-8") as f:
+            thresholds = json.load(f)
+
+    rows = compare_results(baseline, current, thresholds, args.threshold)
+    width = max((len(row["metric"]) for row in rows), default=0)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['metric']:<{width}}  {row['baseline']:>12.3f} -> "
+            f"{row['current']:>12.3f} {row['unit']:<5} "
+            f"{row['change']:+8.1%} (max {row['threshold']:.0%}) {flag}"
+        )
+
+    failed = regressions(rows)
+    if failed:
+        print(f"{len(failed)} metric(s) regressed")
+        return 1
+    print("No regression")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
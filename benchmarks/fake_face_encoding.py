@@ -0,0 +1,102 @@
+"""Fake face-encoding service
+
+Stand-in for the ``face-encoding`` service with a configurable latency and
+error rate. Encodings are derived from the SHA-256 of the image, so the same
+image always gets the same vector and different images get different ones.
+
+Usage:
+    python -m benchmarks.fake_face_encoding --port 8002 --latency-ms 50 --error-rate 0.01
+
+then start the service with ``FACE_ENCODING_HOST=localhost FACE_ENCODING_PORT=8002``.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import random
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, File, UploadFile
+from fastapi.responses import JSONResponse
+
+
+def fake_encodings(contents: bytes, faces: int = 1, dimension: int = 128):
+    """Build deterministic face encodings for an image
+
+    Args:
+        contents (bytes): Image bytes.
+        faces (int, optional): Number of faces. Defaults to 1.
+        dimension (int, optional): Vector dimension. Defaults to 128.
+
+    Returns:
+        List[List[float]]: One vector per face
+    """
+    seed = int.from_bytes(hashlib.sha256(contents).digest()[:8], "little")
+    return np.random.default_rng(seed).normal(size=(faces, dimension)).tolist()
+
+
+def build_app(
+    latency_ms: float = 0.0,
+    jitter_ms: float = 0.0,
+    error_rate: float = 0.0,
+    faces: int = 1,
+    dimension: int = 128,
+) -> FastAPI:
+    """Build the fake face-encoding app
+
+    Args:
+        latency_ms (float, optional): Mean latency of a request. Defaults to 0.0.
+        jitter_ms (float, optional): Uniform jitter around the latency. Defaults to 0.0.
+        error_rate (float, optional): Fraction of requests answered with 500. Defaults to 0.0.
+        faces (int, optional): Faces returned per image. Defaults to 1.
+        dimension (int, optional): Vector dimension. Defaults to 128.
+
+    Returns:
+        FastAPI: The application
+    """
+    app = FastAPI(title="Fake Face Encoding")
+    app.state.requests = 0
+
+    @app.post("/v1/selfie")
+    async def selfie(file: UploadFile = File(...)):
+        app.state.requests += 1
+        contents = await file.read()
+        delay = latency_ms + random.uniform(-jitter_ms, jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if random.random() < error_rate:
+            return JSONResponse(content="Internal error", status_code=500)
+        return fake_encodings(contents, faces, dimension)
+
+    @app.get("/ping")
+    async def ping():
+        return {"status": 200}
+
+    return app
+
+
+def main() -> None:
+    """Run the fake face-encoding service"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--faces", type=int, default=1)
+    parser.add_argument("--dimension", type=int, default=128)
+    args = parser.parse_args()
+
+    app = build_app(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        faces=args.faces,
+        dimension=args.dimension,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Fake S3 client
+
+In-process stand-in for the ``boto3`` S3 client, implementing the calls of
+:class:`database.image_store.S3ImageStore` on an in-memory bucket, with a
+configurable latency per request. Errors have the same ``response`` layout
+as the ``botocore`` client errors.
+
+Usage:
+    store = S3ImageStore(FakeS3Client(latency_ms=5), "images")
+"""
+
+import io
+import threading
+import time
+from typing import Dict, Tuple
+
+
+class FakeClientError(Exception):
+    """Error of the fake S3 client, like ``botocore.exceptions.ClientError``"""
+
+    def __init__(self, code: str, operation: str) -> None:
+        super().__init__(f"An error occurred ({code}) when calling {operation}")
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3Exceptions:
+    """Exceptions of the fake S3 client, like ``client.exceptions``"""
+
+    ClientError = FakeClientError
+
+
+class FakeS3Client:
+    """Fake S3 Client Class"""
+
+    exceptions = FakeS3Exceptions
+
+    def __init__(self, latency_ms: float = 0.0) -> None:
+        self.latency_ms = latency_ms
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _request(self) -> None:
+        with self._lock:
+            self.requests += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **_) -> Dict:
+        """Store an object"""
+        self._request()
+        self.objects[(Bucket, Key)] = bytes(Body)
+        return {}
+
+    def get_object(self, Bucket: str, Key: str, **_) -> Dict:
+        """Read an object"""
+        self._request()
+        if (Bucket, Key) not in self.objects:
+            raise FakeClientError("NoSuchKey", "GetObject")
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def head_object(self, Bucket: str, Key: str, **_) -> Dict:
+        """Read the metadata of an object"""
+        self._request()
+        if (Bucket, Key) not in self.objects:
+            raise FakeClientError("404", "HeadObject")
+        return {"ContentLength": len(self.objects[(Bucket, Key)])}
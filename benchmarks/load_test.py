@@ -0,0 +1,228 @@
+"""End-to-end load generator
+
+Each virtual user loops over the session life cycle of a client:
+``/start_session``, up to 5 ``/upload`` calls and ``/session_summary``. The
+report contains the throughput, the p50/p95/p99 latency of each endpoint,
+the status codes and the memory of the client and, optionally, the server.
+
+Usage:
+    python -m benchmarks.fake_face_encoding --port 8002 --latency-ms 20 &
+    RATE_LIMIT_ENABLED=false FACE_ENCODING_HOST=localhost FACE_ENCODING_PORT=8002 \
+        uvicorn face_encoder.app.app:app --port 8001 &
+    python -m benchmarks.load_test --base-url http://localhost:8001 \
+        --users 20 --duration 30 --server-pid $(pgrep -f face_encoder.app.app) \
+        --output load.json
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from benchmarks.common import BenchmarkResult, max_rss_mb, process_rss_mb
+
+ENDPOINTS = ("start_session", "upload", "session_summary")
+
+
+class LoadStats:
+    """Load Test Statistics Class"""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = {name: [] for name in ENDPOINTS}
+        self.status_codes: Dict[str, Counter] = {name: Counter() for name in ENDPOINTS}
+        self.server_rss_mb: List[float] = []
+
+    def record(self, endpoint: str, start: float, status_code: int) -> None:
+        """Record a request
+
+        Args:
+            endpoint (str): Endpoint name.
+            start (float): ``time.perf_counter()`` before the request.
+            status_code (int): Response status code, 0 on connection errors.
+        """
+        self.latencies[endpoint].append((time.perf_counter() - start) * 1000)
+        self.status_codes[endpoint][status_code] += 1
+
+
+def image_source(image_dir: Optional[str], image_size: int) -> Callable[[], bytes]:
+    """Build the source of the uploaded images
+
+    Args:
+        image_dir (Optional[str]): Directory of real images, picked at random.
+        image_size (int): Size of the random images used when there is no directory.
+
+    Returns:
+        Callable[[], bytes]: Function returning the next image
+    """
+    if not image_dir:
+        # Fresh random bytes so that no two uploads are near-duplicates.
+        return lambda: random.randbytes(image_size)
+
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        with open(os.path.join(image_dir, name), "rb") as f:
+            images.append(f.read())
+    return lambda: random.choice(images)
+
+
+async def request(
+    stats: LoadStats, endpoint: str, call, *args, **kwargs
+) -> Optional[httpx.Response]:
+    """Send a request and record its outcome
+
+    Args:
+        stats (LoadStats): Statistics of the run.
+        endpoint (str): Endpoint name.
+        call: Client method to call.
+
+    Returns:
+        Optional[httpx.Response]: The response, None on connection errors
+    """
+    start = time.perf_counter()
+    try:
+        response = await call(*args, **kwargs)
+    except httpx.HTTPError:
+        stats.record(endpoint, start, 0)
+        return None
+    stats.record(endpoint, start, response.status_code)
+    return response
+
+
+async def virtual_user(
+    client: httpx.AsyncClient,
+    user: int,
+    deadline: float,
+    uploads: int,
+    next_image: Callable[[], bytes],
+    stats: LoadStats,
+) -> None:
+    """Run session life cycles until the deadline
+
+    Args:
+        client (httpx.AsyncClient): HTTP client.
+        user (int): Virtual user number.
+        deadline (float): ``time.perf_counter()`` value to stop at.
+        uploads (int): Uploads per session.
+        next_image (Callable[[], bytes]): Source of the uploaded images.
+        stats (LoadStats): Statistics of the run.
+    """
+    user_id = f"load-{os.getpid()}-{user}"
+    while time.perf_counter() < deadline:
+        response = await request(
+            stats,
+            "start_session",
+            client.post,
+            "/start_session",
+            params={"user_id": user_id},
+        )
+        if response is None or response.status_code != 200:
+            await asyncio.sleep(0.1)
+            continue
+        session_id = response.json()["session_id"]
+
+        for _ in range(uploads):
+            await request(
+                stats,
+                "upload",
+                client.post,
+                "/upload",
+                params={"session_id": session_id},
+                files={"file": ("image.jpg", next_image(), "image/jpeg")},
+            )
+
+        await request(
+            stats,
+            "session_summary",
+            client.get,
+            "/session_summary",
+            params={"session_id": session_id},
+        )
+
+
+async def sample_server_memory(pid: int, stats: LoadStats, deadline: float) -> None:
+    """Sample the memory of the server until the deadline
+
+    Args:
+        pid (int): Server process ID.
+        stats (LoadStats): Statistics of the run.
+        deadline (float): ``time.perf_counter()`` value to stop at.
+    """
+    while time.perf_counter() < deadline:
+        rss = process_rss_mb(pid)
+        if rss is not None:
+            stats.server_rss_mb.append(rss)
+        await asyncio.sleep(0.5)
+
+
+async def run(args: argparse.Namespace) -> LoadStats:
+    """Run the load test
+
+    Args:
+        args (argparse.Namespace): Command line arguments.
+
+    Returns:
+        LoadStats: Statistics of the run
+    """
+    stats = LoadStats()
+    next_image = image_source(args.image_dir, args.image_size)
+    limits = httpx.Limits(
+        max_connections=args.users, max_keepalive_connections=args.users
+    )
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=args.timeout
+    ) as client:
+        deadline = time.perf_counter() + args.duration
+        tasks = [
+            virtual_user(client, user, deadline, args.uploads, next_image, stats)
+            for user in range(args.users)
+        ]
+        if args.server_pid:
+            tasks.append(sample_server_memory(args.server_pid, stats, deadline))
+        await asyncio.gather(*tasks)
+    return stats
+
+
+def main() -> None:
+    """Run the load test and save the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--uploads", type=int, default=5)
+    parser.add_argument("--image-dir")
+    parser.add_argument("--image-size", type=int, default=50000)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--server-pid", type=int)
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = asyncio.run(run(args))
+    elapsed = time.perf_counter() - start
+
+    result = BenchmarkResult("load_test", parameters=vars(args))
+    total = sum(len(samples) for samples in stats.latencies.values())
+    result.add("total.rps", total / elapsed, "req/s", higher_is_better=True)
+    for endpoint in ENDPOINTS:
+        latencies = stats.latencies[endpoint]
+        codes = stats.status_codes[endpoint]
+        errors = sum(count for code, count in codes.items() if code == 0 or code >= 500)
+        result.add(
+            f"{endpoint}.rps", len(latencies) / elapsed, "req/s", higher_is_better=True
+        )
+        result.add(f"{endpoint}.error_rate", errors / max(len(latencies), 1), "ratio")
+        result.add_latencies(endpoint, latencies)
+        print(f"{endpoint} status codes: {dict(sorted(codes.items()))}")
+    result.add("client.max_rss_mb", max_rss_mb(), "MB")
+    if stats.server_rss_mb:
+        result.add("server.max_rss_mb", max(stats.server_rss_mb), "MB")
+    result.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import Engine, create_engine, event
+from sqlmodel import Session
+
+from database.config import FaceEncoderDBConfig
+from utils.logger.logger import Logger
+
+logger = Logger("face-encoder")
+
+WriteFn = Callable[[Session], Any]
+
+
+class StorageBackend:
+    """Storage Backend Base Class
+
+    A backend builds the SQLAlchemy engine for a database and decides how
+    writes are executed. By default every write runs in its own transaction
+    in the calling thread.
+    """
+
+    name = ""
+
+    def __init__(self, url: str, echo: bool = False) -> None:
+        self.url = url
+        self.echo = echo
+
+    def create_engine(self) -> Engine:
+        """Create the database engine
+
+        Returns:
+            Engine: The database engine
+        """
+        return create_engine(self.url, echo=self.echo)
+
+    def run_write(self, engine: Engine, fn: WriteFn) -> Any:
+        """Run a write and commit it
+
+        Args:
+            engine (Engine): The database engine.
+            fn (WriteFn): Function adding or updating rows in the given session.
+
+        Returns:
+            Any: The return value of the function
+        """
+        with Session(engine) as session:
+            result = fn(session)
+            session.commit()
+            return result
+
+    def close(self) -> None:
+        """Release the resources of the backend"""
+
+
+class PostgresBackend(StorageBackend):
+    """PostgreSQL Storage Backend"""
+
+    name = "postgresql"
+
+
+class SingleWriterQueue:
+    """Single Writer Queue Class
+
+    Embedded databases allow a single writer at a time, so concurrent
+    writers only contend on the database lock. All the writes go through one
+    thread instead, which drains the queue and commits up to ``batch_size``
+    pending writes in a single transaction (group commit). Each write runs in
+    its own savepoint, so a failing write does not affect the others. Without
+    savepoint support, a failed batch is retried one write per transaction.
+    ``commits`` and ``writes`` count the committed transactions and the
+    writes they held.
+    """
+
+    def __init__(
+        self, engine: Engine, batch_size: int = 64, savepoints: bool = True
+    ) -> None:
+        self.engine = engine
+        self.batch_size = batch_size
+        self.savepoints = savepoints
+        self.commits = 0
+        self.writes = 0
+        self._queue: "queue.Queue[Tuple[WriteFn, Future] | None]" = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="face-encoder-db-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, fn: WriteFn) -> Future:
+        """Queue a write
+
+        Args:
+            fn (WriteFn): Function adding or updating rows in the given session.
+
+        Returns:
+            Future: Resolved with the return value of the function once committed
+        """
+        future: Future = Future()
+        self._queue.put((fn, future))
+        return future
+
+    def close(self) -> None:
+        """Write the pending jobs and stop the writer thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _next_batch(self) -> Tuple[List[Tuple[WriteFn, Future]], bool]:
+        """Wait for a write and take the ones already queued behind it
+
+        Returns:
+            Tuple[List[Tuple[WriteFn, Future]], bool]: The writes and whether
+            the queue was closed
+        """
+        batch = []
+        item = self._queue.get()
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, False
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return batch, False
+        return batch, True
+
+    def _run(self) -> None:
+        """Writer thread loop"""
+        closed = False
+        while not closed:
+            batch, closed = self._next_batch()
+            if not batch:
+                continue
+            if self.savepoints:
+                self._write(batch, nested=True)
+            elif not self._write(batch, nested=False):
+                for item in batch:
+                    self._write([item], nested=False)
+
+    def _write(self, batch: List[Tuple[WriteFn, Future]], nested: bool) -> bool:
+        """Run a batch of writes in one transaction
+
+        Args:
+            batch (List[Tuple[WriteFn, Future]]): The writes.
+            nested (bool): Run each write in a savepoint. Otherwise the futures
+                are left pending when a write of a batch of several fails.
+
+        Returns:
+            bool: True if the futures of the batch were resolved
+        """
+        results: Dict[int, Any] = {}
+        failed: Dict[int, Exception] = {}
+        try:
+            with Session(self.engine) as session:
+                for i, (fn, _) in enumerate(batch):
+                    if not nested:
+                        results[i] = fn(session)
+                        continue
+                    try:
+                        with session.begin_nested():
+                            results[i] = fn(session)
+                    except Exception as e:  # pylint: disable=broad-except
+                        failed[i] = e
+                session.commit()
+        except Exception as e:  # pylint: disable=broad-except
+            if not nested and len(batch) > 1:
+                return False
+            logger.error(f"Failed to commit {len(batch)} write(s): {str(e)}")
+            for _, future in batch:
+                future.set_exception(e)
+            return True
+
+        self.commits += 1
+        self.writes += len(batch) - len(failed)
+        for i, (_, future) in enumerate(batch):
+            if i in failed:
+                future.set_exception(failed[i])
+            else:
+                future.set_result(results[i])
+        return True
+
+
+class EmbeddedBackend(StorageBackend):
+    """Embedded Database Storage Backend
+
+    Base class of the backends storing the database in a local file. Writes
+    are serialized through a :class:`SingleWriterQueue`.
+    """
+
+    supports_savepoints = True
+
+    def __init__(self, url: str, echo: bool = False, write_batch_size: int = 64):
+        super().__init__(url, echo)
+        self.write_batch_size = write_batch_size
+        self._writer: SingleWriterQueue | None = None
+        self._writer_lock = threading.Lock()
+
+    def run_write(self, engine: Engine, fn: WriteFn) -> Any:
+        """Queue a write to the writer thread and wait until it is committed
+
+        Args:
+            engine (Engine): The database engine.
+            fn (WriteFn): Function adding or updating rows in the given session.
+
+        Returns:
+            Any: The return value of the function
+        """
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = SingleWriterQueue(
+                        engine, self.write_batch_size, self.supports_savepoints
+                    )
+        return self._writer.submit(fn).result()
+
+    def close(self) -> None:
+        """Stop the writer thread"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class SQLiteBackend(EmbeddedBackend):
+    """SQLite Storage Backend
+
+    Runs SQLite in WAL mode so readers never block the writer, with pragmas
+    tuned for a single node service.
+    """
+
+    name = "sqlite"
+
+    PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": "5000",
+        "cache_size": "-65536",
+        "temp_store": "MEMORY",
+        "mmap_size": "268435456",
+        "foreign_keys": "ON",
+    }
+
+    def create_engine(self) -> Engine:
+        """Create the database engine and register the connection pragmas
+
+        Returns:
+            Engine: The database engine
+        """
+        engine = create_engine(
+            self.url, echo=self.echo, connect_args={"check_same_thread": False}
+        )
+
+        @event.listens_for(engine, "connect")
+        def on_connect(dbapi_connection, _connection_record):
+            # Let SQLAlchemy emit BEGIN itself, pysqlite's implicit
+            # transactions break savepoints.
+            dbapi_connection.isolation_level = None
+            cursor = dbapi_connection.cursor()
+            for name, value in self.PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+        @event.listens_for(engine, "begin")
+        def on_begin(connection):
+            connection.exec_driver_sql("BEGIN")
+
+        return engine
+
+
+class DuckDBBackend(EmbeddedBackend):
+    """DuckDB Storage Backend
+
+    Columnar storage, suited to analytical reads over the embeddings. Requires
+    the optional ``duckdb`` and ``duckdb_engine`` packages.
+    """
+
+    name = "duckdb"
+    supports_savepoints = False
+
+    def create_engine(self) -> Engine:
+        """Create the database engine
+
+        Raises:
+            ImportError: duckdb_engine is not installed
+
+        Returns:
+            Engine: The database engine
+        """
+        try:
+            # pylint: disable=import-outside-toplevel,unused-import
+            import duckdb_engine  # noqa: F401
+        except ImportError as e:
+            raise ImportError(
+                "The duckdb and duckdb_engine packages are required for the "
+                "duckdb storage backend"
+            ) from e
+        return create_engine(self.url, echo=self.echo)
+
+
+BACKENDS = {
+    backend.name: backend for backend in (PostgresBackend, SQLiteBackend, DuckDBBackend)
+}
+
+
+def build_backend(config: FaceEncoderDBConfig) -> StorageBackend:
+    """Build the storage backend selected in the configuration
+
+    Args:
+        config (FaceEncoderDBConfig): Database configuration.
+
+    Raises:
+        ValueError: Unknown storage backend
+
+    Returns:
+        StorageBackend: The storage backend
+    """
+    name = config.get_backend_name()
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown storage backend '{name}'. Expected one of {sorted(BACKENDS)}"
+        )
+    logger.info(f"Using {name} storage backend")
+    if name == PostgresBackend.name:
+        return PostgresBackend(config.get_url(), echo=config.echo)
+    return BACKENDS[name](
+        config.get_url(), echo=config.echo, write_batch_size=config.write_batch_size
+    )
@@ -1,7 +1,31 @@
+import functools
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+
+@functools.lru_cache(maxsize=None)
+def load_env() -> None:
+    """Load the nearest ``.env`` file into the environment, once
+
+    The file is looked up from the package directory upwards. python-dotenv is
+    only imported when a file is found, so containers, which get their
+    variables from the environment, skip it.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        path = os.path.join(directory, ".env")
+        if os.path.isfile(path):
+            # pylint: disable-next=import-outside-toplevel
+            from dotenv import load_dotenv
+
+            load_dotenv(path)
+            return
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return
+        directory = parent
+
+
+load_env()
 
 
 class FaceEncoderDBConfig:
@@ -13,7 +37,37 @@ class FaceEncoderDBConfig:
         self.db_password = os.getenv("DB_PASSWORD")
         self.db_host = os.getenv("DB_HOST")
         self.db_port = os.getenv("DB_PORT")
+        self.db_url = os.getenv("DB_URL")
+        self.echo = os.getenv("DB_ECHO", "true").lower() == "true"
+        self.backend = os.getenv("DB_BACKEND")
+        self.db_path = os.getenv("DB_PATH", "face_encoder.db")
+        self.write_batch_size = int(os.getenv("DB_WRITE_BATCH_SIZE", "64"))
+        # Schema management on startup of the app. Dropping the tables deletes
+        # every session, it is only meant for development.
+        self.create_tables = os.getenv("DB_CREATE_TABLES", "true").lower() == "true"
+        self.drop_tables = os.getenv("DB_DROP_TABLES", "false").lower() == "true"
+
+    def get_backend_name(self) -> str:
+        """Get the name of the storage backend
+
+        ``DB_BACKEND`` takes precedence, otherwise the backend is the scheme of
+        ``DB_URL``, and PostgreSQL when neither is set.
+        """
+        if self.backend:
+            return self.backend
+        if self.db_url:
+            return self.db_url.split(":", 1)[0].split("+", 1)[0]
+        return "postgresql"
 
     def get_url(self):
-        """Get the database URL"""
+        """Get the database URL
+
+        ``DB_URL`` takes precedence over the individual settings when it is set.
+        The embedded backends store the database in ``DB_PATH``.
+        """
+        if self.db_url:
+            return self.db_url
+        backend = self.get_backend_name()
+        if backend in ("sqlite", "duckdb"):
+            return f"{backend}:///{self.db_path}"
         return f"postgresql+psycopg2://{self.db_user}:{self.db_password}@{self.db_host}:{self.db_port}/{self.db_name}"
@@ -1,51 +1,184 @@
+import uuid
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Sequence, Tuple
 
+from sqlalchemy import ColumnElement, and_, func, null, or_
 from sqlalchemy.sql.operators import is_
-from sqlmodel import select, update
+from sqlmodel import insert, select, update
 
 from database.database import FaceEncoderDB
 from database.models import FaceEncoderSession, FaceEncoderUserSessions
+from utils.helpers.embedding_utils import decode_face_encodings
+from utils.helpers.session_utils import encode_session_id
 from utils.logger.logger import Logger
 from utils.schema.face_encoder_schema import FaceEncoderSessionSummary
 
 logger = Logger("face-encoder")
 
+ENCODING_COLUMNS = (
+    FaceEncoderSession.face_encoding,
+    FaceEncoderSession.encoder_model,
+    FaceEncoderSession.encoder_version,
+    FaceEncoderSession.pending_face_encoding,
+    FaceEncoderSession.pending_encoder_model,
+    FaceEncoderSession.pending_encoder_version,
+)
+
+
+def encoder_tag(
+    encoder_model: Optional[str], encoder_version: Optional[str]
+) -> Optional[str]:
+    """Get the label of an encoder
+
+    Args:
+        encoder_model (Optional[str]): Encoder model.
+        encoder_version (Optional[str]): Encoder version.
+
+    Returns:
+        Optional[str]: ``model:version``, None for the encodings stored before
+        they were tagged
+    """
+    if encoder_version is None:
+        return None
+    return f"{encoder_model}:{encoder_version}"
+
+
+def select_face_encoding(
+    row, encoder_model: str = None, encoder_version: str = None
+) -> Tuple[Optional[Dict], Optional[str]]:
+    """Pick the face encoding of an upload to read (dual read)
+
+    Args:
+        row: Row with the ENCODING_COLUMNS.
+        encoder_model (str, optional): Encoder model to read. Defaults to None.
+        encoder_version (str, optional): Encoder version to read. Defaults to None.
+
+    Returns:
+        Tuple[Optional[Dict], Optional[str]]: The re-encoded face encodings if
+        they were produced by the given encoder, the current ones otherwise,
+        and the label of their encoder
+    """
+    if (
+        encoder_version is not None
+        and row.pending_face_encoding is not None
+        and row.pending_encoder_model == encoder_model
+        and row.pending_encoder_version == encoder_version
+    ):
+        return row.pending_face_encoding, encoder_tag(encoder_model, encoder_version)
+    return row.face_encoding, encoder_tag(row.encoder_model, row.encoder_version)
+
+
+def stale_filter(encoder_model: str, encoder_version: str) -> ColumnElement:
+    """Filter of the uploads neither encoded nor re-encoded by an encoder
+
+    Args:
+        encoder_model (str): Encoder model.
+        encoder_version (str): Encoder version.
+
+    Returns:
+        ColumnElement: The filter
+    """
+    return and_(
+        or_(
+            FaceEncoderSession.encoder_model.is_distinct_from(encoder_model),
+            FaceEncoderSession.encoder_version.is_distinct_from(encoder_version),
+        ),
+        or_(
+            FaceEncoderSession.pending_encoder_model.is_distinct_from(encoder_model),
+            FaceEncoderSession.pending_encoder_version.is_distinct_from(
+                encoder_version
+            ),
+        ),
+    )
+
 
 class FaceEncoderCRUD(FaceEncoderDB):
     """Face Encoder CRUD Class"""
 
     def add_session(
         self,
-        session_id: str,
+        session_id: uuid.UUID,
         face_encodings: Dict = None,
+        image_hash: str = None,
+        encoder_model: str = None,
+        encoder_version: str = None,
     ) -> None:
         """Add a session and face encodings to the database
 
         Args:
-            session_id (str): The session ID to be added.
+            session_id (uuid.UUID): The session ID to be added.
             face_encodings (Dict, optional): The face encodings to be added. Defaults to None.
+            image_hash (str, optional): Hash of the retained image. Defaults to None.
+            encoder_model (str, optional): Model of the face encodings. Defaults to None.
+            encoder_version (str, optional): Version of the face encodings. Defaults to None.
 
         Raises:
             ValueError: Failed to add session to database
         """
-        with self.get_session() as session:
-            try:
-                logger.info(f"Adding session {session_id} to database")
-                session.add(
+        try:
+            logger.info(f"Adding session {encode_session_id(session_id)} to database")
+            self.run_write(
+                lambda session: session.add(
                     FaceEncoderSession(
-                        session_id=session_id, face_encoding=face_encodings
+                        session_id=session_id,
+                        face_encoding=face_encodings,
+                        image_hash=image_hash,
+                        encoder_model=encoder_model,
+                        encoder_version=encoder_version,
                     )
                 )
-                session.commit()
-            except Exception as e:
-                raise ValueError(f"Failed to add session to database: {str(e)}") from e
+            )
+        except Exception as e:
+            raise ValueError(f"Failed to add session to database: {str(e)}") from e
+
+    def add_sessions(
+        self,
+        face_encodings: Sequence[Tuple[uuid.UUID, Dict, Optional[str]]],
+        encoder_model: str = None,
+        encoder_version: str = None,
+    ) -> int:
+        """Add the face encodings of many uploads in one transaction
+
+        Args:
+            face_encodings (Sequence[Tuple[uuid.UUID, Dict, Optional[str]]]): The
+                session ID, the face encodings and the image hash of each upload.
+            encoder_model (str, optional): Model of the face encodings. Defaults to None.
+            encoder_version (str, optional): Version of the face encodings. Defaults to None.
 
-    def get_session_count(self, session_id: str) -> int:
+        Raises:
+            ValueError: Failed to add sessions to database
+
+        Returns:
+            int: The number of rows added
+        """
+        if not face_encodings:
+            return 0
+        try:
+            logger.info(f"Adding {len(face_encodings)} face encodings to database")
+            created_at = datetime.now()
+            rows = [
+                {
+                    "session_id": session_id,
+                    "face_encoding": encodings,
+                    "image_hash": image_hash,
+                    "encoder_model": encoder_model,
+                    "encoder_version": encoder_version,
+                    "created_at": created_at,
+                }
+                for session_id, encodings, image_hash in face_encodings
+            ]
+            self.run_write(
+                lambda session: session.execute(insert(FaceEncoderSession), rows)
+            )
+            return len(rows)
+        except Exception as e:
+            raise ValueError(f"Failed to add sessions to database: {str(e)}") from e
+
+    def get_session_count(self, session_id: uuid.UUID) -> int:
         """Get the number of sessions in the database
 
         Args:
-            session_id (str): The session ID.
+            session_id (uuid.UUID): The session ID.
 
         Raises:
             ValueError: Failed to get session count from database
@@ -67,21 +200,32 @@ class FaceEncoderCRUD(FaceEncoderDB):
                     f"Failed to get session count from database: {str(e)}"
                 ) from e
 
-    def get_session_summary(self, session_id: str) -> FaceEncoderSessionSummary:
+    def get_session_summary(
+        self,
+        session_id: uuid.UUID,
+        encoder_model: str = None,
+        encoder_version: str = None,
+    ) -> FaceEncoderSessionSummary:
         """Get the session summary from the database
 
         Args:
-            session_id (str): The session ID.
+            session_id (uuid.UUID): The session ID.
+            encoder_model (str, optional): Encoder model to read during a
+                re-encode. Defaults to None.
+            encoder_version (str, optional): Encoder version to read during a
+                re-encode. Defaults to None.
 
         Raises:
             ValueError: Failed to get session summary from database
 
         Returns:
-            FaceEncoderSessionSummary: The session summary
+            FaceEncoderSessionSummary: The session summary. Uploads re-encoded
+            by the given encoder return their new face encodings, the others
+            their current ones.
         """
         with self.get_session() as session:
             try:
-                statement = select(FaceEncoderSession).where(
+                statement = select(*ENCODING_COLUMNS).where(
                     FaceEncoderSession.session_id == session_id,
                     FaceEncoderSession.face_encoding is not None,
                 )
@@ -89,43 +233,292 @@ class FaceEncoderCRUD(FaceEncoderDB):
                 session_obj = results.all()
 
                 if len(session_obj) == 0:
-                    msg = f"Session {session_id} not found"
+                    msg = f"Session {encode_session_id(session_id)} not found"
                     logger.error(msg)
                     raise ValueError(msg)
 
+                selected = [
+                    select_face_encoding(row, encoder_model, encoder_version)
+                    for row in session_obj
+                ]
                 return FaceEncoderSessionSummary(
-                    session_id=session_id,
+                    session_id=encode_session_id(session_id),
                     all_face_encodings=[
-                        session_obj[i].face_encoding for i in range(len(session_obj))
+                        decode_face_encodings(encoding) for encoding, _ in selected
                     ],
+                    encoder_versions=[encoder for _, encoder in selected],
                 )
             except Exception as e:
                 raise ValueError(
                     f"Failed to get session summary from database: {str(e)}"
                 ) from e
 
-    def add_user_session(self, session_id: str, user_id: str):
-        """Add a user session to the database
+    def get_session_encodings(
+        self,
+        session_id: uuid.UUID,
+        encoder_model: str = None,
+        encoder_version: str = None,
+    ) -> List:
+        """Get the stored face encodings of a session
 
         Args:
-            session_id (str): The session ID to be added.
-            user_id (str): The user ID to be added.
+            session_id (uuid.UUID): The session ID.
+            encoder_model (str, optional): Only return the face encodings of
+                this encoder model. Defaults to None.
+            encoder_version (str, optional): Only return the face encodings of
+                this encoder version. Defaults to None.
 
         Raises:
-            ValueError: Failed to add user session to database
+            ValueError: Failed to get session encodings from database
+
+        Returns:
+            List: The face encodings of each upload, in their storage form.
+            With an encoder, the re-encoded ones are read for the uploads not
+            promoted yet and the uploads not re-encoded are left out, since
+            encodings of different models cannot be compared.
         """
         with self.get_session() as session:
             try:
-                logger.info(f"Adding user session {session_id} to database")
-                session.add(
-                    FaceEncoderUserSessions(session_id=session_id, user_id=user_id)
+                if encoder_version is None:
+                    statement = select(FaceEncoderSession.face_encoding).where(
+                        FaceEncoderSession.session_id == session_id
+                    )
+                    return session.exec(statement).all()
+
+                statement = select(*ENCODING_COLUMNS).where(
+                    FaceEncoderSession.session_id == session_id
                 )
-                session.commit()
+                target = encoder_tag(encoder_model, encoder_version)
+                return [
+                    encoding
+                    for encoding, encoder in (
+                        select_face_encoding(row, encoder_model, encoder_version)
+                        for row in session.exec(statement).all()
+                    )
+                    if encoder == target
+                ]
             except Exception as e:
                 raise ValueError(
-                    f"Failed to add user session to database: {str(e)}"
+                    f"Failed to get session encodings from database: {str(e)}"
                 ) from e
 
+    def has_session_image(self, session_id: uuid.UUID, image_hash: str) -> bool:
+        """Check if an image was uploaded in a session
+
+        Args:
+            session_id (uuid.UUID): The session ID.
+            image_hash (str): SHA-256 of the image.
+
+        Raises:
+            ValueError: Failed to check the session image in database
+
+        Returns:
+            bool: True if an upload of the session has this image
+        """
+        with self.get_session() as session:
+            try:
+                statement = (
+                    select(FaceEncoderSession.id)
+                    .where(
+                        FaceEncoderSession.session_id == session_id,
+                        FaceEncoderSession.image_hash == image_hash,
+                    )
+                    .limit(1)
+                )
+                return session.exec(statement).first() is not None
+            except Exception as e:
+                raise ValueError(
+                    f"Failed to check the session image in database: {str(e)}"
+                ) from e
+
+    def count_stale_sessions(self, encoder_model: str, encoder_version: str) -> int:
+        """Count the uploads that are neither encoded nor re-encoded by an encoder
+
+        Args:
+            encoder_model (str): Encoder model.
+            encoder_version (str): Encoder version.
+
+        Raises:
+            ValueError: Failed to count stale sessions in database
+
+        Returns:
+            int: The number of stale uploads
+        """
+        with self.get_session() as session:
+            try:
+                statement = (
+                    select(func.count())
+                    .select_from(FaceEncoderSession)
+                    .where(stale_filter(encoder_model, encoder_version))
+                )
+                return session.exec(statement).one()
+            except Exception as e:
+                raise ValueError(
+                    f"Failed to count stale sessions in database: {str(e)}"
+                ) from e
+
+    def get_stale_sessions(
+        self,
+        encoder_model: str,
+        encoder_version: str,
+        after_id: int = 0,
+        limit: int = 100,
+    ) -> List[Tuple[int, Optional[str]]]:
+        """Get a page of the uploads to re-encode, in primary key order
+
+        Keyset pagination: pass the last ID of a page as ``after_id`` to get
+        the next one, so every page is an index range scan.
+
+        Args:
+            encoder_model (str): Encoder model.
+            encoder_version (str): Encoder version.
+            after_id (int, optional): Last ID of the previous page. Defaults to 0.
+            limit (int, optional): Page size. Defaults to 100.
+
+        Raises:
+            ValueError: Failed to get stale sessions from database
+
+        Returns:
+            List[Tuple[int, Optional[str]]]: The ID and image hash of each upload
+        """
+        with self.get_session() as session:
+            try:
+                statement = (
+                    select(FaceEncoderSession.id, FaceEncoderSession.image_hash)
+                    .where(
+                        FaceEncoderSession.id > after_id,
+                        stale_filter(encoder_model, encoder_version),
+                    )
+                    .order_by(FaceEncoderSession.id)
+                    .limit(limit)
+                )
+                return [tuple(row) for row in session.exec(statement).all()]
+            except Exception as e:
+                raise ValueError(
+                    f"Failed to get stale sessions from database: {str(e)}"
+                ) from e
+
+    def set_pending_encodings(
+        self,
+        face_encodings: Sequence[Tuple[int, Dict]],
+        encoder_model: str,
+        encoder_version: str,
+    ) -> int:
+        """Store re-encoded face encodings next to the current ones
+
+        Args:
+            face_encodings (Sequence[Tuple[int, Dict]]): The ID and the new face
+                encodings of each upload.
+            encoder_model (str): Model of the new face encodings.
+            encoder_version (str): Version of the new face encodings.
+
+        Raises:
+            ValueError: Failed to set pending encodings in database
+
+        Returns:
+            int: The number of rows updated
+        """
+        if not face_encodings:
+            return 0
+        try:
+            rows = [
+                {
+                    "id": row_id,
+                    "pending_face_encoding": encodings,
+                    "pending_encoder_model": encoder_model,
+                    "pending_encoder_version": encoder_version,
+                }
+                for row_id, encodings in face_encodings
+            ]
+            self.run_write(
+                lambda session: session.execute(update(FaceEncoderSession), rows)
+            )
+            return len(rows)
+        except Exception as e:
+            raise ValueError(
+                f"Failed to set pending encodings in database: {str(e)}"
+            ) from e
+
+    def promote_pending_encodings(
+        self, encoder_model: str, encoder_version: str, batch_size: int = 1000
+    ) -> int:
+        """Replace the current face encodings with the re-encoded ones
+
+        Ends the dual-read period of a re-encode. Runs in batches of
+        ``batch_size`` rows, one transaction each.
+
+        Args:
+            encoder_model (str): Encoder model of the re-encoded face encodings.
+            encoder_version (str): Encoder version of the re-encoded face encodings.
+            batch_size (int, optional): Rows per transaction. Defaults to 1000.
+
+        Raises:
+            ValueError: Failed to promote pending encodings in database
+
+        Returns:
+            int: The number of rows promoted
+        """
+        promoted = 0
+        after_id = 0
+        try:
+            while True:
+                with self.get_session() as session:
+                    ids = session.exec(
+                        select(FaceEncoderSession.id)
+                        .where(
+                            FaceEncoderSession.id > after_id,
+                            FaceEncoderSession.pending_encoder_model == encoder_model,
+                            FaceEncoderSession.pending_encoder_version
+                            == encoder_version,
+                        )
+                        .order_by(FaceEncoderSession.id)
+                        .limit(batch_size)
+                    ).all()
+                if not ids:
+                    return promoted
+                statement = (
+                    update(FaceEncoderSession)
+                    .where(FaceEncoderSession.id.in_(ids))
+                    .values(
+                        face_encoding=FaceEncoderSession.pending_face_encoding,
+                        encoder_model=FaceEncoderSession.pending_encoder_model,
+                        encoder_version=FaceEncoderSession.pending_encoder_version,
+                        pending_face_encoding=null(),
+                        pending_encoder_model=None,
+                        pending_encoder_version=None,
+                    )
+                )
+                self.run_write(lambda session: session.exec(statement))
+                promoted += len(ids)
+                after_id = ids[-1]
+                logger.info(f"Promoted {promoted} re-encoded face encodings")
+        except Exception as e:
+            raise ValueError(
+                f"Failed to promote pending encodings in database: {str(e)}"
+            ) from e
+
+    def add_user_session(self, session_id: uuid.UUID, user_id: str):
+        """Add a user session to the database
+
+        Args:
+            session_id (uuid.UUID): The session ID to be added.
+            user_id (str): The user ID to be added.
+
+        Raises:
+            ValueError: Failed to add user session to database
+        """
+        try:
+            logger.info(
+                f"Adding user session {encode_session_id(session_id)} to database"
+            )
+            self.run_write(
+                lambda session: session.add(
+                    FaceEncoderUserSessions(session_id=session_id, user_id=user_id)
+                )
+            )
+        except Exception as e:
+            raise ValueError(f"Failed to add user session to database: {str(e)}") from e
+
     def get_user_session(self, user_id: str) -> List[FaceEncoderUserSessions]:
         """Get the user sessions from the database
 
@@ -150,11 +543,34 @@ class FaceEncoderCRUD(FaceEncoderDB):
                     f"Failed to get user sessions from database: {str(e)}"
                 ) from e
 
-    def check_if_session_exists(self, session_id: str) -> bool:
+    def get_session_user_id(self, session_id: uuid.UUID) -> Optional[str]:
+        """Get the user a session belongs to
+
+        Args:
+            session_id (uuid.UUID): The session ID.
+
+        Raises:
+            ValueError: Failed to get the user of the session from database
+
+        Returns:
+            Optional[str]: The user ID, None if the session does not exist
+        """
+        with self.get_session() as session:
+            try:
+                statement = select(FaceEncoderUserSessions.user_id).where(
+                    FaceEncoderUserSessions.session_id == session_id
+                )
+                return session.exec(statement).first()
+            except Exception as e:
+                raise ValueError(
+                    f"Failed to get the user of the session from database: {str(e)}"
+                ) from e
+
+    def check_if_session_exists(self, session_id: uuid.UUID) -> bool:
         """Check if the session exists in the database
 
         Args:
-            session_id (str): The session ID.
+            session_id (uuid.UUID): The session ID.
 
         Raises:
             ValueError: Failed to check if session exists in database
@@ -183,20 +599,18 @@ class FaceEncoderCRUD(FaceEncoderDB):
         Raises:
             ValueError: Failed to close user session in database
         """
-        with self.get_session() as session:
-            try:
-                logger.info(f"Closing user session {user_id} in database")
-                statement = (
-                    update(FaceEncoderUserSessions)
-                    .where(FaceEncoderUserSessions.user_id == user_id)
-                    .values(closed_at=datetime.now())
-                )
-                session.exec(statement)
-                session.commit()
-            except Exception as e:
-                raise ValueError(
-                    f"Failed to close user session in database: {str(e)}"
-                ) from e
+        try:
+            logger.info(f"Closing user session {user_id} in database")
+            statement = (
+                update(FaceEncoderUserSessions)
+                .where(FaceEncoderUserSessions.user_id == user_id)
+                .values(closed_at=datetime.now())
+            )
+            self.run_write(lambda session: session.exec(statement))
+        except Exception as e:
+            raise ValueError(
+                f"Failed to close user session in database: {str(e)}"
+            ) from e
 
     def get_user_oppened_sessions(self, user_id: str) -> List[FaceEncoderUserSessions]:
         """Get the user opened sessions from the database
@@ -1,33 +1,153 @@
 from contextlib import contextmanager
+from typing import Any, List, Tuple
 
-from sqlalchemy import create_engine
+from sqlalchemy import Connection, String, inspect, text
 from sqlmodel import Session, SQLModel
 
+from database.backends import StorageBackend, WriteFn, build_backend
 from database.config import FaceEncoderDBConfig
-from utils.logger.logger import Logger
 
-db_config = FaceEncoderDBConfig()
+# Registers the tables in the metadata the schema is created and checked from.
+from database.models import (  # pylint: disable=unused-import
+    FaceEncoderSession,
+    FaceEncoderUserSessions,
+)
+from database.types import BinaryUUID
+from utils.logger.logger import Logger
 
 logger = Logger("face-encoder")
 
 
+class SchemaMismatchError(RuntimeError):
+    """Raised when the database tables do not match the models"""
+
+
 class FaceEncoderDB:
     """Face Encoder Database Class"""
 
-    def __init__(self) -> None:
+    def __init__(self, backend: StorageBackend = None) -> None:
         logger.info("Creating database engine")
-        self.engine = create_engine(db_config.get_url(), echo=True)
+        self.backend = backend or build_backend(FaceEncoderDBConfig())
+        self.engine = self.backend.create_engine()
 
     def create_db_and_tables(self) -> None:
         """Creates the database and tables"""
         logger.info("Creating database and tables")
         SQLModel.metadata.create_all(self.engine, checkfirst=True)
 
+    def upgrade_schema(self) -> List[str]:
+        """Bring the tables created by an older version up to date
+
+        ``create_all`` creates the missing tables but never alters the existing
+        ones. Adds the missing columns, which are all nullable, and their
+        indexes. On PostgreSQL, session ID columns stored as text are converted
+        to ``uuid``; on the other databases they are left for
+        :meth:`check_schema` to report.
+
+        Returns:
+            List[str]: The statements run
+        """
+        with self.engine.begin() as connection:
+            statements, _ = self._schema_changes(connection)
+            for statement in statements:
+                logger.warning(f"Upgrading the database schema: {statement}")
+                connection.execute(text(statement))
+        return statements
+
+    def check_schema(self) -> int:
+        """Check that the tables match the models
+
+        Raises:
+            SchemaMismatchError: A table or column is missing, or a session ID
+                column has the type of an older version
+
+        Returns:
+            int: The number of tables checked
+        """
+        with self.engine.connect() as connection:
+            statements, problems = self._schema_changes(connection)
+        problems = problems + [f"pending upgrade: {s}" for s in statements]
+        if problems:
+            raise SchemaMismatchError(
+                "The database schema is out of date, see the upgrade steps of "
+                f"the README: {'; '.join(problems)}"
+            )
+        return len(SQLModel.metadata.tables)
+
+    def _schema_changes(self, connection: Connection) -> Tuple[List[str], List[str]]:
+        """Compare the tables with the models
+
+        Args:
+            connection (Connection): Database connection.
+
+        Returns:
+            Tuple[List[str], List[str]]: The statements upgrading the schema,
+            and the differences they cannot fix
+        """
+        inspector = inspect(connection)
+        dialect = connection.dialect
+        quote = dialect.identifier_preparer.quote
+        statements, problems = [], []
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                problems.append(f"missing table {table.name}")
+                continue
+            columns = {c["name"]: c for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                existing = columns.get(column.name)
+                if existing is None:
+                    column_type = column.type.compile(dialect=dialect)
+                    statements.append(
+                        f"ALTER TABLE {quote(table.name)} "
+                        f"ADD COLUMN {quote(column.name)} {column_type}"
+                    )
+                elif isinstance(column.type, BinaryUUID) and isinstance(
+                    existing["type"], String
+                ):
+                    if dialect.name != "postgresql":
+                        problems.append(f"{table.name}.{column.name} is stored as text")
+                        continue
+                    statements.append(
+                        f"ALTER TABLE {quote(table.name)} "
+                        f"ALTER COLUMN {quote(column.name)} TYPE uuid "
+                        f"USING {quote(column.name)}::uuid"
+                    )
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    columns_sql = ", ".join(quote(c.name) for c in index.columns)
+                    statements.append(
+                        f"CREATE INDEX {quote(index.name)} "
+                        f"ON {quote(table.name)} ({columns_sql})"
+                    )
+        return statements, problems
+
     def drop_db_and_tables(self) -> None:
         """Drop the database and tables"""
         logger.info("Dropping database and tables")
         SQLModel.metadata.drop_all(self.engine)
 
+    def warm_pool(self, connections: int) -> int:
+        """Open connections of the pool ahead of the first requests
+
+        Args:
+            connections (int): Number of connections to open.
+
+        Returns:
+            int: The number of connections opened and checked
+        """
+        opened = []
+        try:
+            for _ in range(connections):
+                connection = self.engine.connect()
+                opened.append(connection)
+                connection.execute(text("SELECT 1"))
+        finally:
+            # Returned to the pool, which keeps them open.
+            for connection in opened:
+                connection.close()
+        return len(opened)
+
     @contextmanager
     def get_session(self):
         """Get a session
@@ -37,3 +157,19 @@ class FaceEncoderDB:
         """
         with Session(self.engine) as session:
             yield session
+
+    def run_write(self, fn: WriteFn) -> Any:
+        """Run a write through the storage backend and commit it
+
+        Args:
+            fn (WriteFn): Function adding or updating rows in the given session.
+
+        Returns:
+            Any: The return value of the function
+        """
+        return self.backend.run_write(self.engine, fn)
+
+    def close(self) -> None:
+        """Release the storage backend and the database connections"""
+        self.backend.close()
+        self.engine.dispose()
@@ -0,0 +1,526 @@
+import hashlib
+import os
+from abc import ABC, abstractmethod
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from utils.logger.logger import Logger
+
+logger = Logger("face-encoder")
+
+HEX_DIGITS = frozenset("0123456789abcdef")
+
+
+class ImageStoreConfig:
+    """Image Store Configuration Class"""
+
+    def __init__(self) -> None:
+        self.backend = os.getenv("IMAGE_STORE_BACKEND", "local").lower()
+        # Root of the local store, and local tier of the s3 backend.
+        self.path = os.getenv("IMAGE_STORE_PATH", "")
+        self.s3_bucket = os.getenv("IMAGE_STORE_S3_BUCKET", "")
+        self.s3_prefix = os.getenv("IMAGE_STORE_S3_PREFIX", "images/")
+        self.s3_endpoint_url = os.getenv("IMAGE_STORE_S3_ENDPOINT_URL", "")
+        self.cache_bytes = int(os.getenv("IMAGE_STORE_CACHE_BYTES", "67108864"))
+        self.cache_max_image_bytes = int(
+            os.getenv("IMAGE_STORE_CACHE_MAX_IMAGE_BYTES", "1048576")
+        )
+
+
+def image_hash(contents: bytes) -> str:
+    """Get the content address of an image
+
+    Args:
+        contents (bytes): Image bytes.
+
+    Returns:
+        str: SHA-256 hex digest of the image
+    """
+    return hashlib.sha256(contents).hexdigest()
+
+
+def is_image_hash(value: str) -> bool:
+    """Check if a value is an image hash
+
+    Args:
+        value (str): The value, for instance a path parameter.
+
+    Returns:
+        bool: True if the value is a lowercase SHA-256 hex digest
+    """
+    return len(value) == 64 and HEX_DIGITS.issuperset(value)
+
+
+def shard_path(digest: str) -> str:
+    """Get the sharded relative path of an image
+
+    Args:
+        digest (str): Image hash.
+
+    Raises:
+        ValueError: The digest is not an image hash
+
+    Returns:
+        str: ``ab/cd/abcd...``
+    """
+    if not is_image_hash(digest):
+        raise ValueError(f"Invalid image hash '{digest}'")
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+class ImageStore(ABC):
+    """Image Store Base Class
+
+    Content-addressed store of the uploaded images: images are stored once
+    under their SHA-256 digest, and never modified.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def put(self, contents: bytes) -> str:
+        """Store an image
+
+        Args:
+            contents (bytes): Image bytes.
+
+        Returns:
+            str: The image hash
+        """
+
+    @abstractmethod
+    def get(self, digest: str) -> Optional[bytes]:
+        """Read an image
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            Optional[bytes]: The image bytes, None if the image is not stored
+        """
+
+    @abstractmethod
+    def exists(self, digest: str) -> bool:
+        """Check if an image is stored
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            bool: True if the image is stored
+        """
+
+    def local_path(self, digest: str) -> Optional[str]:
+        """Get the path of an image on local disk, to serve it from the file
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            Optional[str]: The image path, None if the image is not on local disk
+        """
+        return None
+
+
+class LocalImageStore(ImageStore):
+    """Local Image Store Class
+
+    Images are stored on local disk in two levels of shard directories
+    (``ab/cd/abcd...``) so that no directory grows too large. Writes go to a
+    temporary file renamed into place, so readers never see a partial image.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, digest: str) -> str:
+        """Get the path of an image
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            str: The image path
+        """
+        return os.path.join(self.root, *shard_path(digest).split("/"))
+
+    def put(self, contents: bytes) -> str:
+        """Store an image
+
+        Args:
+            contents (bytes): Image bytes.
+
+        Returns:
+            str: The image hash
+        """
+        digest = image_hash(contents)
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            return digest
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(contents)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """Read an image
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            Optional[bytes]: The image bytes, None if the image is not stored
+        """
+        try:
+            with open(self.path_for(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, digest: str) -> bool:
+        """Check if an image is stored
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            bool: True if the image is stored
+        """
+        return os.path.exists(self.path_for(digest))
+
+    def local_path(self, digest: str) -> Optional[str]:
+        """Get the path of an image on local disk, to serve it from the file
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            Optional[str]: The image path, None if the image is not stored
+        """
+        path = self.path_for(digest)
+        return path if os.path.exists(path) else None
+
+
+def _is_not_found(error: Any) -> bool:
+    """Check if an S3 client error means that the object does not exist
+
+    Args:
+        error (Any): ``botocore`` client error.
+
+    Returns:
+        bool: True for a missing object
+    """
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+class S3ImageStore(ImageStore):
+    """S3 Image Store Class
+
+    Images are stored as objects of an S3-compatible bucket (AWS S3, MinIO,
+    Ceph...), under the same sharded keys as on local disk. The shards spread
+    the keys over prefixes, which S3 partitions its request rate by.
+
+    ``client`` is a ``boto3`` S3 client, or any object with the same
+    ``put_object``, ``get_object``, ``head_object`` and
+    ``exceptions.ClientError``.
+    """
+
+    name = "s3"
+
+    def __init__(self, client: Any, bucket: str, prefix: str = "") -> None:
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def key_for(self, digest: str) -> str:
+        """Get the key of an image
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            str: The object key
+        """
+        return self.prefix + shard_path(digest)
+
+    def put(self, contents: bytes) -> str:
+        """Store an image, unless an object with the same hash exists
+
+        Args:
+            contents (bytes): Image bytes.
+
+        Returns:
+            str: The image hash
+        """
+        digest = image_hash(contents)
+        if not self.exists(digest):
+            self.client.put_object(
+                Bucket=self.bucket, Key=self.key_for(digest), Body=contents
+            )
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """Read an image
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            Optional[bytes]: The image bytes, None if the image is not stored
+        """
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self.key_for(digest)
+            )
+        except self.client.exceptions.ClientError as e:
+            if _is_not_found(e):
+                return None
+            raise
+        return response["Body"].read()
+
+    def exists(self, digest: str) -> bool:
+        """Check if an image is stored
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            bool: True if the image is stored
+        """
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key_for(digest))
+        except self.client.exceptions.ClientError as e:
+            if _is_not_found(e):
+                return False
+            raise
+        return True
+
+
+class TieredImageStore(ImageStore):
+    """Tiered Image Store Class
+
+    A remote store, the source of truth, with a local disk store in front of
+    it. Images are written to the remote store first, then to local disk, so
+    an image on local disk is always in the remote store. Reads are served
+    from local disk, and images missing there are fetched once from the
+    remote store. The local tier can be deleted at any time.
+    """
+
+    name = "tiered"
+
+    def __init__(self, remote: ImageStore, local: LocalImageStore) -> None:
+        self.remote = remote
+        self.local = local
+
+    def put(self, contents: bytes) -> str:
+        """Store an image
+
+        Args:
+            contents (bytes): Image bytes.
+
+        Returns:
+            str: The image hash
+        """
+        digest = image_hash(contents)
+        if not self.local.exists(digest):
+            self.remote.put(contents)
+            self.local.put(contents)
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """Read an image
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            Optional[bytes]: The image bytes, None if the image is not stored
+        """
+        contents = self.local.get(digest)
+        if contents is None:
+            contents = self.remote.get(digest)
+            if contents is not None:
+                self.local.put(contents)
+        return contents
+
+    def exists(self, digest: str) -> bool:
+        """Check if an image is stored
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            bool: True if the image is stored
+        """
+        return self.local.exists(digest) or self.remote.exists(digest)
+
+    def local_path(self, digest: str) -> Optional[str]:
+        """Get the path of an image on local disk, fetching it if needed
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            Optional[str]: The image path, None if the image is not stored
+        """
+        path = self.local.local_path(digest)
+        if path is None and self.get(digest) is not None:
+            path = self.local.path_for(digest)
+        return path
+
+
+class ImageCache:
+    """Image Cache Class
+
+    Bounded in-memory cache of recently uploaded and read images, evicting
+    the least recently used ones above ``max_bytes`` of image data. Images
+    larger than ``max_image_bytes`` are not cached, they are served from their
+    file instead. Thread-safe, as the image store is called from worker
+    threads.
+    """
+
+    def __init__(self, max_bytes: int, max_image_bytes: int = 1048576) -> None:
+        self.max_bytes = max_bytes
+        self.max_image_bytes = max_image_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._images: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def admits(self, size: int) -> bool:
+        """Check if an image is small enough to be cached
+
+        Args:
+            size (int): Size of the image in bytes.
+
+        Returns:
+            bool: True if the image is cached by :meth:`put`
+        """
+        return size <= min(self.max_image_bytes, self.max_bytes)
+
+    def get(self, digest: str) -> Optional[bytes]:
+        """Read an image
+
+        Args:
+            digest (str): Image hash.
+
+        Returns:
+            Optional[bytes]: The image bytes, None if the image is not cached
+        """
+        with self._lock:
+            contents = self._images.get(digest)
+            if contents is None:
+                self.misses += 1
+                return None
+            self._images.move_to_end(digest)
+            self.hits += 1
+            return contents
+
+    def put(self, digest: str, contents: bytes) -> None:
+        """Cache an image
+
+        Args:
+            digest (str): Image hash.
+            contents (bytes): Image bytes.
+        """
+        if not self.admits(len(contents)):
+            return
+        with self._lock:
+            if digest in self._images:
+                self._images.move_to_end(digest)
+                return
+            self._images[digest] = contents
+            self.nbytes += len(contents)
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self.nbytes -= len(evicted)
+
+    def metrics(self) -> Dict[str, int]:
+        """Get the counters
+
+        Returns:
+            Dict[str, int]: Number and bytes of cached images, hits and misses
+        """
+        return {
+            "images": len(self._images),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def build_s3_client(config: ImageStoreConfig) -> Any:
+    """Build the S3 client of the s3 backend
+
+    Credentials and region are read by ``boto3`` from the usual ``AWS_*``
+    variables or files.
+
+    Args:
+        config (ImageStoreConfig): Image store configuration.
+
+    Raises:
+        ImportError: boto3 is not installed
+
+    Returns:
+        Any: The ``boto3`` S3 client
+    """
+    try:
+        import boto3  # pylint: disable=import-outside-toplevel
+    except ImportError as e:
+        raise ImportError("The boto3 package is required for the s3 image store") from e
+    return boto3.client("s3", endpoint_url=config.s3_endpoint_url or None)
+
+
+def build_image_store(config: ImageStoreConfig) -> Optional[ImageStore]:
+    """Build the image store selected in the configuration
+
+    Args:
+        config (ImageStoreConfig): Image store configuration.
+
+    Raises:
+        ValueError: Unknown backend, or s3 backend without bucket
+
+    Returns:
+        Optional[ImageStore]: The image store, None when images are not
+        retained
+    """
+    if config.backend == LocalImageStore.name:
+        if not config.path:
+            return None
+        logger.info(f"Retaining uploaded images in {config.path}")
+        return LocalImageStore(config.path)
+
+    if config.backend == S3ImageStore.name:
+        if not config.s3_bucket:
+            raise ValueError("IMAGE_STORE_S3_BUCKET must be set for the s3 image store")
+        logger.info(f"Retaining uploaded images in the {config.s3_bucket} bucket")
+        remote = S3ImageStore(
+            build_s3_client(config), config.s3_bucket, prefix=config.s3_prefix
+        )
+        if not config.path:
+            return remote
+        logger.info(f"Caching the images of the bucket in {config.path}")
+        return TieredImageStore(remote, LocalImageStore(config.path))
+
+    raise ValueError(
+        f"Unknown image store '{config.backend}'. Expected one of "
+        f"{sorted([LocalImageStore.name, S3ImageStore.name])}"
+    )
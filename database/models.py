@@ -1,19 +1,46 @@
+import uuid
 from datetime import datetime
 from typing import Dict, Optional
 
-from sqlalchemy import JSON, Column
+from sqlalchemy import JSON, Column, Integer, Sequence
 from sqlmodel import Field, SQLModel
 
+from database.types import BinaryUUID
+
 
 class FaceEncoderSession(SQLModel, table=True):
     """Face Encoder Session Model"""
 
     __tablename__ = "sessions"
-    id: int | None = Field(title="ID", default=None, primary_key=True)
-    session_id: str = Field(title="Session ID", index=True)
+    # Explicit sequence: DuckDB has no SERIAL type. SQLite ignores it.
+    id: int | None = Field(
+        title="ID",
+        default=None,
+        sa_column=Column(Integer, Sequence("sessions_id_seq"), primary_key=True),
+    )
+    session_id: uuid.UUID = Field(
+        title="Session ID",
+        sa_column=Column(BinaryUUID, index=True, nullable=False),
+    )
     face_encoding: Optional[Dict] = Field(
         title="Face Encoding", default_factory=dict, sa_column=Column(JSON)
     )
+    encoder_model: Optional[str] = Field(title="Encoder model", default=None)
+    encoder_version: Optional[str] = Field(title="Encoder version", default=None)
+    image_hash: Optional[str] = Field(
+        title="SHA-256 of the uploaded image", default=None, index=True
+    )
+    # Re-encoded by the new encoder, read instead of face_encoding when it
+    # matches the configured encoder until it is promoted.
+    pending_face_encoding: Optional[Dict] = Field(
+        title="Re-encoded Face Encoding", default=None, sa_column=Column(JSON)
+    )
+    pending_encoder_model: Optional[str] = Field(
+        title="Encoder model of the re-encoded face encoding", default=None
+    )
+    pending_encoder_version: Optional[str] = Field(
+        title="Encoder version of the re-encoded face encoding", default=None
+    )
     created_at: datetime = Field(
         title="Timestamp of session creation", default_factory=datetime.now
     )
@@ -28,7 +55,9 @@ class FaceEncoderUserSessions(SQLModel, table=True):
     """Face Encoder User Sessions Model"""
 
     __tablename__ = "user_sessions"
-    session_id: str = Field(title="Session ID", primary_key=True)
+    session_id: uuid.UUID = Field(
+        title="Session ID", sa_column=Column(BinaryUUID, primary_key=True)
+    )
     user_id: str = Field(title="User ID", index=True)
     created_at: datetime = Field(
         title="Timestamp of session creation", default_factory=datetime.now
@@ -0,0 +1,62 @@
+import uuid
+from typing import Any, Optional
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.engine import Dialect
+from sqlalchemy.types import TypeDecorator, TypeEngine
+
+
+class BinaryUUID(TypeDecorator):
+    """UUID column stored in 16 bytes
+
+    Native ``UUID`` column on PostgreSQL, 16 byte binary column on the other
+    databases. Values are returned as :class:`uuid.UUID`; strings are accepted
+    as parameters in any form :class:`uuid.UUID` parses.
+    """
+
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect: Dialect) -> TypeEngine:
+        """Get the column type of a database
+
+        Args:
+            dialect (Dialect): The database dialect.
+
+        Returns:
+            TypeEngine: The column type
+        """
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(UUID(as_uuid=True))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value: Any, dialect: Dialect) -> Any:
+        """Convert a parameter to the column type
+
+        Args:
+            value (Any): UUID, string or None.
+            dialect (Dialect): The database dialect.
+
+        Returns:
+            Any: The UUID on PostgreSQL, its bytes on the other databases
+        """
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(value)
+        return value if dialect.name == "postgresql" else value.bytes
+
+    def process_result_value(self, value: Any, dialect: Dialect) -> Optional[uuid.UUID]:
+        """Convert a column value to a UUID
+
+        Args:
+            value (Any): The column value.
+            dialect (Dialect): The database dialect.
+
+        Returns:
+            Optional[uuid.UUID]: The UUID
+        """
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        return uuid.UUID(bytes=bytes(value))
@@ -1,25 +1,85 @@
-import uvicorn
+import argparse
+import os
+import sys
+from typing import List
 
 from utils.logger.logger import Logger
 
 logger = Logger("face-encoder")
 
 
-def main() -> None:
+def serve() -> None:
     """
     Run the application with specified logging and mode settings.
     """
 
+    import uvicorn  # pylint: disable=import-outside-toplevel
+
     logger.info("Starting face encoder system")
     uvicorn.run(
         "face_encoder.app.app:app",
         port=8000,
-        reload=True,
+        # The reloader imports the app a second time in a child process, it is
+        # only meant for development.
+        reload=os.getenv("FACE_ENCODER_RELOAD", "false").lower() == "true",
         host="0.0.0.0",
         log_config=None,
     )
 
 
+def main(argv: List[str] = None) -> None:
+    """
+    Run a command of the face encoder system. Without a command, run the
+    application.
+
+    Args:
+        argv (List[str], optional): Command line arguments. Defaults to sys.argv.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv in ([], ["serve"]):
+        # Starting pods skip the import of the bulk processing pipelines.
+        serve()
+        return
+
+    # pylint: disable=import-outside-toplevel
+    from face_encoder.ingest import add_ingest_arguments, run_ingest
+    from face_encoder.reencode import add_reencode_arguments, run_reencode
+
+    parser = argparse.ArgumentParser(prog="python -m face_encoder")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("serve", help="Run the application (default)")
+    add_ingest_arguments(
+        commands.add_parser(
+            "ingest",
+            help="Encode and store a directory or manifest of images in bulk",
+        )
+    )
+    add_reencode_arguments(
+        commands.add_parser(
+            "reencode",
+            help="Re-encode the uploads of previous encoder versions from the "
+            "image store",
+        )
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        stats = run_ingest(args)
+        if stats.failed:
+            sys.exit(1)
+        return
+    if args.command == "reencode":
+        try:
+            stats = run_reencode(args)
+        except ValueError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        if stats.failed:
+            sys.exit(1)
+        return
+    serve()
+
+
 if __name__ == "__main__":
     # pylint: disable=no-value-for-parameter
     main()
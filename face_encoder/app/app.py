@@ -1,26 +1,184 @@
+import asyncio
+import hashlib
+import hmac
 import os
-from typing import Dict
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional
 
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Header, UploadFile
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+)
 
+from database.config import FaceEncoderDBConfig
 from database.crud import FaceEncoderCRUD
-from utils.helpers.api_utils import send_request_to_face_encoding
-from utils.helpers.session_utils import convert_bytes_to_megabytes, generate_unique_id
+from database.image_store import (
+    ImageCache,
+    ImageStoreConfig,
+    build_image_store,
+    is_image_hash,
+)
+from face_encoder.app.middleware import ProfilingMiddleware, RateLimitMiddleware
+from utils.helpers.api_utils import (
+    FaceEncodingClientConfig,
+    build_face_encoding_client,
+    send_request_to_face_encoding,
+    warm_face_encoding_client,
+)
+from utils.helpers.embedding_utils import EmbeddingConfig, postprocess_face_encodings
+from utils.helpers.idempotency_utils import (
+    IdempotencyConfig,
+    IdempotencyConflictError,
+    IdempotencyStore,
+    IdempotencyStoreFullError,
+    StoredResponse,
+)
+from utils.helpers.profiling_utils import (
+    ProfileCapture,
+    ProfilingConfig,
+    Traced,
+    span,
+)
+from utils.helpers.rate_limit_utils import RateLimitConfig, build_rate_limit_store
+from utils.helpers.session_utils import (
+    convert_bytes_to_megabytes,
+    decode_session_id,
+    encode_session_id,
+    uuid7,
+)
+from utils.helpers.warmup_utils import Readiness, WarmupConfig
 from utils.logger.logger import Logger
 from utils.schema.face_encoder_schema import (
     FaceEncoderOutput,
     FaceEncoderSessionSummary,
 )
 
-app = FastAPI(title="Face Encoder")
-
 logger = Logger("face-encoder")
+db_config = FaceEncoderDBConfig()
+# Only creates the engine: no connection is opened and no DDL runs on import.
 db_crud = FaceEncoderCRUD()
-db_crud.drop_db_and_tables()
-db_crud.create_db_and_tables()
+warmup_config = WarmupConfig()
 
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "2000000"))
+embedding_config = EmbeddingConfig()
+image_store_config = ImageStoreConfig()
+image_store = build_image_store(image_store_config)
+image_cache = ImageCache(
+    image_store_config.cache_bytes, image_store_config.cache_max_image_bytes
+)
+
+profiling_config = ProfilingConfig()
+profile_capture = ProfileCapture(profiling_config)
+if profiling_config.enabled:
+    # Spans are only recorded through the proxies, so the CRUD and the image
+    # store are called directly when profiling is disabled.
+    db_crud = Traced(db_crud, "crud")
+    if image_store is not None:
+        image_store = Traced(image_store, "image_store")
+
+
+async def warm_up(readiness: Readiness) -> None:
+    """Create the shared face-encoding client, check the database schema and
+    open the database and face-encoding connections, then mark the service
+    ready. The required steps that failed are retried until they succeed.
+
+    Args:
+        readiness (Readiness): Readiness the warm-up steps are recorded in.
+    """
+    app.state.encoder_client = await asyncio.to_thread(
+        build_face_encoding_client, FaceEncodingClientConfig()
+    )
+    await readiness.run_step("schema", lambda: asyncio.to_thread(db_crud.check_schema))
+    if warmup_config.enabled:
+        await asyncio.gather(
+            readiness.run_step(
+                "database",
+                lambda: asyncio.to_thread(
+                    db_crud.warm_pool, warmup_config.db_connections
+                ),
+            ),
+            readiness.run_step(
+                "face_encoding",
+                lambda: warm_face_encoding_client(
+                    app.state.encoder_client,
+                    warmup_config.encoder_connections,
+                    timeout=warmup_config.timeout,
+                ),
+                required=False,
+            ),
+        )
+    readiness.finish()
+    await readiness.retry_until_ready(
+        warmup_config.retry_interval, warmup_config.retry_max_interval
+    )
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Prepare the database schema, warm up in the background and release the
+    connections on shutdown
+
+    The schema is created, or upgraded from an older version, before the first
+    request is served. The warm-up runs while the service already answers
+    ``/live``, ``/ready`` reports when it finished.
+    """
+    if db_config.drop_tables:
+        await asyncio.to_thread(db_crud.drop_db_and_tables)
+    if db_config.create_tables:
+        await asyncio.to_thread(db_crud.create_db_and_tables)
+        try:
+            await asyncio.to_thread(db_crud.upgrade_schema)
+        except Exception as e:  # pylint: disable=broad-except
+            # Reported by the schema step of the readiness probe.
+            logger.error(f"Failed to upgrade the database schema: {str(e)}")
+    app.state.readiness = Readiness()
+    warm_up_task = asyncio.create_task(warm_up(app.state.readiness))
+    yield
+    warm_up_task.cancel()
+    if app.state.encoder_client is not None:
+        await app.state.encoder_client.aclose()
+    db_crud.close()
+
+
+app = FastAPI(title="Face Encoder", lifespan=lifespan)
+# Requests served before the warm-up created the shared client use their own.
+app.state.encoder_client = None
+app.state.readiness = Readiness()
+
+idempotency_config = IdempotencyConfig()
+idempotency_store = IdempotencyStore(
+    max_keys=idempotency_config.max_keys, ttl=idempotency_config.ttl
+)
+
+
+async def get_session_user_id(session_id: str) -> Optional[str]:
+    """Get the user a session belongs to, for the rate limiter
+
+    Args:
+        session_id (str): Session ID
+
+    Returns:
+        Optional[str]: The user ID, None if the session does not exist
+    """
+    return await asyncio.to_thread(db_crud.get_session_user_id, session_id)
+
+
+rate_limit_config = RateLimitConfig()
+if rate_limit_config.enabled:
+    app.add_middleware(
+        RateLimitMiddleware,
+        store=build_rate_limit_store(rate_limit_config),
+        config=rate_limit_config,
+        resolve_user=get_session_user_id,
+        session_cache_size=rate_limit_config.max_keys,
+    )
+if profiling_config.enabled:
+    app.add_middleware(ProfilingMiddleware, config=profiling_config)
 
 
 @app.get("/ping")
@@ -33,23 +191,195 @@ async def ping() -> Dict:
     return {"status": 200}
 
 
+async def run_idempotent(
+    endpoint: str,
+    key: str,
+    fingerprint: str,
+    handler: Callable[[], Awaitable[JSONResponse]],
+) -> Response:
+    """Run a request handler at most once per idempotency key
+
+    Args:
+        endpoint (str): Endpoint name.
+        key (str): Idempotency key, scoped to the client it belongs to.
+        fingerprint (str): Digest of the request.
+        handler (Callable[[], Awaitable[JSONResponse]]): Request handler.
+
+    Returns:
+        Response: The response of the handler, or the stored one of the
+        first request sent with the key
+    """
+
+    async def stored_handler() -> StoredResponse:
+        response = await handler()
+        return StoredResponse(response.status_code, response.body)
+
+    try:
+        stored, shared = await idempotency_store.run(
+            endpoint, key, fingerprint, stored_handler
+        )
+    except IdempotencyConflictError as e:
+        logger.warning(f"{endpoint}: {str(e)}")
+        return JSONResponse(content={"message": str(e)}, status_code=422)
+    except IdempotencyStoreFullError as e:
+        logger.warning(f"{endpoint}: {str(e)}")
+        return JSONResponse(
+            content={"message": str(e)},
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+
+    headers = {"Idempotent-Replayed": "true"} if shared else None
+    if shared:
+        logger.info(f"{endpoint}: replaying the response of a previous request")
+    return Response(
+        content=stored.body,
+        status_code=stored.status_code,
+        headers=headers,
+        media_type="application/json",
+    )
+
+
+@app.get("/metrics/idempotency")
+async def idempotency_metrics() -> Dict:
+    """Get the idempotency counters of each endpoint
+
+    Returns:
+        Dict: Executed, replayed, joined and conflicting requests by endpoint
+    """
+    return {"keys": len(idempotency_store), "endpoints": idempotency_store.metrics()}
+
+
+@app.get("/metrics/image_cache")
+async def image_cache_metrics() -> Dict:
+    """Get the counters of the in-memory image cache
+
+    Returns:
+        Dict: Number and bytes of cached images, hits and misses
+    """
+    return image_cache.metrics()
+
+
+@app.get("/live")
+async def live() -> Dict:
+    """Liveness probe: the event loop serves requests
+
+    Returns:
+        Dict: Status of the service
+    """
+    return {"status": "alive"}
+
+
+@app.get("/ready")
+async def ready() -> JSONResponse:
+    """Readiness probe: the warm-up finished, the database is reachable and its
+    schema is up to date
+
+    Returns:
+        JSONResponse: The outcome of each warm-up step, with a 503 status
+        until the service is ready
+    """
+    readiness = app.state.readiness
+    return JSONResponse(
+        content=readiness.to_dict(), status_code=200 if readiness.ready else 503
+    )
+
+
+@app.get("/debug/profile")
+async def debug_profile(
+    seconds: float = 10.0, authorization: Optional[str] = Header(default=None)
+) -> Response:
+    """Capture a profile of the running process
+
+    Samples the stacks of every thread for ``seconds`` (capped to
+    ``PROFILING_MAX_SECONDS``) while the service keeps serving. Requires the
+    ``Authorization: Bearer <PROFILING_TOKEN>`` header.
+
+    Args:
+        seconds (float, optional): Duration of the capture. Defaults to 10.0.
+        authorization (Optional[str], optional): Authorization header.
+
+    Returns:
+        Response: The profile as folded stacks, ready for flame graph tools
+    """
+    if not profiling_config.token:
+        return JSONResponse(content={"message": "Not Found"}, status_code=404)
+    expected = f"Bearer {profiling_config.token}".encode()
+    if authorization is None or not hmac.compare_digest(
+        authorization.encode(), expected
+    ):
+        logger.warning("Rejected a profile request with an invalid token")
+        return JSONResponse(content={"message": "Invalid token"}, status_code=401)
+
+    sampler = await asyncio.to_thread(profile_capture.capture, seconds)
+    if sampler is None:
+        return JSONResponse(
+            content={"message": "A profile is already being captured"},
+            status_code=409,
+        )
+    filename = f"profile-{int(time.time())}.folded"
+    return PlainTextResponse(
+        sampler.folded(),
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Profile-Samples": str(sampler.samples),
+        },
+    )
+
+
 @app.post("/start_session")
-async def start_session(user_id: str) -> Dict:
-    """Start a new session and return the session ID"""
+async def start_session(
+    user_id: str, idempotency_key: Optional[str] = Header(default=None)
+) -> Dict:
+    """Start a new session and return the session ID
+
+    Args:
+        user_id (str): User ID
+        idempotency_key (Optional[str], optional): Idempotency-Key header. Retries
+            sent with the same key get the session of the first request.
+
+    Returns:
+        Dict: The session ID
+    """
+    if idempotency_key is None:
+        return await _start_session(user_id)
+    return await run_idempotent(
+        "start_session",
+        f"{user_id}:{idempotency_key}",
+        user_id,
+        lambda: _start_session(user_id),
+    )
+
+
+async def _start_session(user_id: str) -> JSONResponse:
+    """Close the opened sessions of a user and start a new one
+
+    Args:
+        user_id (str): User ID
+
+    Returns:
+        JSONResponse: The session ID
+    """
     try:
-        session_id = generate_unique_id()
-        logger.info(f"Starting session {session_id}")
+        session_id = uuid7()
+        logger.info(f"Starting session {encode_session_id(session_id)}")
 
-        user_sessions = db_crud.get_user_oppened_sessions(user_id=user_id)
+        user_sessions = await asyncio.to_thread(
+            db_crud.get_user_oppened_sessions, user_id=user_id
+        )
         logger.info(f"User {user_id} has {len(user_sessions)} sessions open")
         if len(user_sessions) > 0:
             logger.warning(f"User {user_id} has more than 1 session open")
             logger.info(f"Closing {user_id} previous session")
-            db_crud.close_user_session(user_id=user_id)
+            await asyncio.to_thread(db_crud.close_user_session, user_id=user_id)
 
-        db_crud.add_user_session(session_id=session_id, user_id=user_id)
+        await asyncio.to_thread(
+            db_crud.add_user_session, session_id=session_id, user_id=user_id
+        )
 
-        return JSONResponse(content={"session_id": session_id}, status_code=200)
+        return JSONResponse(
+            content={"session_id": encode_session_id(session_id)}, status_code=200
+        )
     except Exception as e:
         msg = f"Error while starting session: {str(e)}"
         logger.error(msg)
@@ -57,22 +387,86 @@ async def start_session(user_id: str) -> Dict:
 
 
 @app.post("/upload")
-async def upload(session_id: str, file: UploadFile = File(...)) -> JSONResponse:
+async def upload(
+    session_id: str,
+    file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(default=None),
+) -> JSONResponse:
     """Upload an image to the face-encoding service
 
     Args:
         file (UploadFile, optional): Selfie image to upload. Defaults to File(...).
         session_id (str): Session ID
+        idempotency_key (Optional[str], optional): Idempotency-Key header. Retries
+            sent with the same key get the response of the first request, without
+            calling the face-encoding service or storing the image again.
 
     Returns:
         FaceEncoderOutput | None: Face Encoder Output Model
     """
+    try:
+        session_uuid = decode_session_id(session_id)
+    except ValueError as e:
+        logger.error(str(e))
+        return JSONResponse(content={"message": str(e)}, status_code=400)
+
+    # The size is checked before the image is read into memory.
+    contents = await read_upload(file, MAX_FILE_SIZE)
+    if contents is None:
+        msg = f"The file is too large. \
+                File should be less than {convert_bytes_to_megabytes(MAX_FILE_SIZE)} MB. \
+                FileSize: {convert_bytes_to_megabytes(file.size or MAX_FILE_SIZE + 1)} MB"
+        logger.error(msg)
+        return JSONResponse(content={"message": msg}, status_code=400)
+
+    if idempotency_key is None:
+        return await _upload(session_uuid, file.filename, contents)
+    fingerprint = hashlib.sha256(contents).hexdigest()
+    return await run_idempotent(
+        "upload",
+        f"{encode_session_id(session_uuid)}:{idempotency_key}",
+        fingerprint,
+        lambda: _upload(session_uuid, file.filename, contents),
+    )
+
+
+async def read_upload(file: UploadFile, max_size: int) -> Optional[bytes]:
+    """Read an uploaded file, without reading more than ``max_size`` bytes
+
+    Args:
+        file (UploadFile): The uploaded file.
+        max_size (int): Maximum size in bytes.
+
+    Returns:
+        Optional[bytes]: The file contents, None if the file is too large
+    """
+    if file.size is not None and file.size > max_size:
+        return None
+    contents = await file.read(max_size + 1)
+    if len(contents) > max_size:
+        return None
+    return contents
+
+
+async def _upload(
+    session_id: uuid.UUID, filename: str, contents: bytes
+) -> JSONResponse:
+    """Encode an uploaded image and store its face encoding
+
+    Args:
+        session_id (uuid.UUID): Session ID
+        filename (str): Name of the uploaded file
+        contents (bytes): Uploaded image
+
+    Returns:
+        JSONResponse: Face Encoder Output Model
+    """
     logger.debug("Uploading image")
     try:
         try:
             logger.debug("Checking if session exists")
-            if not db_crud.check_if_session_exists(session_id):
-                msg = f"Session {session_id} not found"
+            if not await asyncio.to_thread(db_crud.check_if_session_exists, session_id):
+                msg = f"Session {encode_session_id(session_id)} not found"
                 logger.error(msg)
                 return JSONResponse(content={"message": msg}, status_code=404)
         except ValueError as e:
@@ -80,21 +474,15 @@ async def upload(session_id: str, file: UploadFile = File(...)) -> JSONResponse:
             logger.error(msg)
             return JSONResponse(content={"message": msg}, status_code=500)
 
-        if file.size > MAX_FILE_SIZE:
-            msg = f"The file is too large. \
-                    File should be less than {convert_bytes_to_megabytes(MAX_FILE_SIZE)} MB. \
-                    FileSize: {convert_bytes_to_megabytes(file.size)} MB"
-            logger.error(msg)
-            return JSONResponse(content={"message": msg}, status_code=400)
-
-        if db_crud.get_session_count(session_id) >= 5:
+        if await asyncio.to_thread(db_crud.get_session_count, session_id) >= 5:
             msg = "Session limit reached. Maximum of 5 files per session"
             logger.warning(msg)
             return JSONResponse(content={"message": msg}, status_code=400)
 
-        contents = await file.read()
-
-        _response = send_request_to_face_encoding(contents=contents)
+        with span("face_encoding"):
+            _response = await send_request_to_face_encoding(
+                contents=contents, client=app.state.encoder_client
+            )
 
         logger.debug("Image sent to the face-encoding service")
 
@@ -110,10 +498,54 @@ async def upload(session_id: str, file: UploadFile = File(...)) -> JSONResponse:
                 content={"message": _response.text}, status_code=_response.status_code
             )
 
-        logger.info(f"Session {session_id} uploaded image {file.filename}")
-        db_crud.add_session(session_id=session_id, face_encodings=_response.json())
+        session_encodings = await asyncio.to_thread(
+            db_crud.get_session_encodings,
+            session_id,
+            encoder_model=embedding_config.encoder_model,
+            encoder_version=embedding_config.encoder_version,
+        )
+        with span("postprocess"):
+            processed = postprocess_face_encodings(
+                _response.json(), embedding_config, session_encodings=session_encodings
+            )
+        if processed.quality.issues:
+            msg = f"Face encoding rejected: {'; '.join(processed.quality.issues)}"
+            logger.warning(msg)
+            return JSONResponse(
+                content={"message": msg, "quality": processed.quality.model_dump()},
+                status_code=422,
+            )
+        if processed.quality.is_duplicate:
+            msg = (
+                "Image is a near-duplicate of an upload of session "
+                f"{encode_session_id(session_id)}"
+            )
+            logger.warning(msg)
+            return JSONResponse(
+                content={"message": msg, "quality": processed.quality.model_dump()},
+                status_code=409,
+            )
+
+        logger.info(
+            f"Session {encode_session_id(session_id)} uploaded image {filename}"
+        )
+        image_hash = None
+        if image_store is not None:
+            image_hash = await asyncio.to_thread(image_store.put, contents)
+            # Recent uploads are the most likely to be read back.
+            image_cache.put(image_hash, contents)
+        await asyncio.to_thread(
+            db_crud.add_session,
+            session_id=session_id,
+            face_encodings=processed.stored,
+            image_hash=image_hash,
+            encoder_model=embedding_config.encoder_model,
+            encoder_version=embedding_config.encoder_version,
+        )
 
-        response = FaceEncoderOutput(face_embedding=_response.json())
+        response = FaceEncoderOutput(
+            face_embedding=processed.normalized.tolist(), quality=processed.quality
+        )
 
         return JSONResponse(content=response.model_dump(), status_code=200)
 
@@ -133,12 +565,101 @@ async def session_summary(session_id: str) -> FaceEncoderSessionSummary:
         SessionSummary: Session Summary Model
     """
     try:
-        logger.info(f"Getting session summary for session {session_id}")
-        sess_summary = db_crud.get_session_summary(session_id=session_id)
+        session_uuid = decode_session_id(session_id)
+    except ValueError as e:
+        logger.error(str(e))
+        return JSONResponse(content={"message": str(e)}, status_code=400)
+
+    try:
+        logger.info(
+            f"Getting session summary for session {encode_session_id(session_uuid)}"
+        )
+        sess_summary = await asyncio.to_thread(
+            db_crud.get_session_summary,
+            session_id=session_uuid,
+            encoder_model=embedding_config.encoder_model,
+            encoder_version=embedding_config.encoder_version,
+        )
     except ValueError as e:
         msg = (
-            f"Failed to get session summary for session '{session_id}'. Error: {str(e)}"
+            "Failed to get session summary for session "
+            f"'{encode_session_id(session_uuid)}'. Error: {str(e)}"
         )
         logger.error(msg)
         return JSONResponse(content={"message": msg}, status_code=500)
     return sess_summary
+
+
+@app.get("/images/{image_hash}")
+async def get_image(image_hash: str, session_id: str) -> Response:
+    """Get an image uploaded in a session
+
+    Images are served from the in-memory cache. Images too large for the
+    cache are streamed from their file on local disk, the others are read once
+    from the image store and cached.
+
+    Args:
+        image_hash (str): SHA-256 of the image, as stored with the upload
+        session_id (str): Session ID the image was uploaded in
+
+    Returns:
+        Response: The image bytes
+    """
+    if image_store is None:
+        return JSONResponse(
+            content={"message": "Uploaded images are not retained"}, status_code=404
+        )
+    try:
+        session_uuid = decode_session_id(session_id)
+    except ValueError as e:
+        logger.error(str(e))
+        return JSONResponse(content={"message": str(e)}, status_code=400)
+    if not is_image_hash(image_hash):
+        msg = f"Invalid image hash '{image_hash}'"
+        logger.error(msg)
+        return JSONResponse(content={"message": msg}, status_code=400)
+
+    try:
+        if not await asyncio.to_thread(
+            db_crud.has_session_image, session_uuid, image_hash
+        ):
+            msg = (
+                f"Image {image_hash} not found in session "
+                f"{encode_session_id(session_uuid)}"
+            )
+            logger.error(msg)
+            return JSONResponse(content={"message": msg}, status_code=404)
+    except ValueError as e:
+        msg = f"Error while checking the session image: {str(e)}"
+        logger.error(msg)
+        return JSONResponse(content={"message": msg}, status_code=500)
+
+    # Content-addressed: the image behind a hash never changes.
+    headers = {
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "X-Content-Type-Options": "nosniff",
+    }
+    contents = image_cache.get(image_hash)
+    if contents is not None:
+        return Response(
+            content=contents, headers=headers, media_type="application/octet-stream"
+        )
+
+    try:
+        path = await asyncio.to_thread(image_store.local_path, image_hash)
+        if path is not None and not image_cache.admits(os.path.getsize(path)):
+            return FileResponse(
+                path, headers=headers, media_type="application/octet-stream"
+            )
+        contents = await asyncio.to_thread(image_store.get, image_hash)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.exception(("There was an error reading the image. Error: %s", e))
+        return JSONResponse(content={"message": str(e)}, status_code=500)
+    if contents is None:
+        msg = f"Image {image_hash} is missing from the image store"
+        logger.error(msg)
+        return JSONResponse(content={"message": msg}, status_code=404)
+    image_cache.put(image_hash, contents)
+    return Response(
+        content=contents, headers=headers, media_type="application/octet-stream"
+    )
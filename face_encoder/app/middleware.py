@@ -0,0 +1,273 @@
+import math
+import random
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, Optional
+from urllib.parse import parse_qs
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.helpers.profiling_utils import (
+    ProfilingConfig,
+    RequestTrace,
+    end_trace,
+    start_trace,
+)
+from utils.helpers.rate_limit_utils import ConcurrencyLimiter, RateLimitConfig
+from utils.helpers.session_utils import decode_session_id, encode_session_id
+from utils.logger.logger import Logger
+
+logger = Logger("face-encoder")
+
+START_SESSION_PATH = "/start_session"
+UPLOAD_PATH = "/upload"
+PROFILE_PATH = "/debug/profile"
+
+
+class RateLimitMiddleware:
+    """Rate Limit Middleware
+
+    Applies a per-IP token bucket to every limited path, a per-user token
+    bucket keyed by ``user_id`` on ``/start_session`` and by the user of the
+    ``session_id`` on ``/upload``, and caps the number of concurrent uploads
+    per session. The user of a session is resolved with ``resolve_user`` and
+    cached, so that a user spreading uploads over several sessions still
+    shares one bucket; sessions that do not resolve use their own bucket.
+    Session IDs are keyed by their canonical form, so that other spellings of
+    the same ID share its buckets. Rejected requests get a 429 response with a ``Retry-After`` header.
+
+    Implemented as a plain ASGI middleware so that requests to other paths
+    only pay for a set lookup.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        store,
+        config: RateLimitConfig,
+        limited_paths: Iterable[str] = (START_SESSION_PATH, UPLOAD_PATH),
+        resolve_user: Optional[Callable[[str], Awaitable[Optional[str]]]] = None,
+        session_cache_size: int = 100000,
+    ) -> None:
+        self.app = app
+        self.store = store
+        self.config = config
+        self.limited_paths = frozenset(limited_paths)
+        self.upload_limiter = ConcurrencyLimiter(config.max_concurrent_uploads)
+        self.resolve_user = resolve_user
+        self.session_cache_size = session_cache_size
+        # Sessions never change user, the cache is only bounded by its size.
+        self._session_users: "OrderedDict[str, str]" = OrderedDict()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.limited_paths:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        config = self.config
+
+        client_ip = self._client_ip(scope)
+        allowed, retry_after = await self.store.consume(
+            f"ip:{client_ip}", config.ip_rate, config.ip_burst
+        )
+        if not allowed:
+            await self._reject(scope, receive, send, retry_after, "Too many requests")
+            return
+
+        principal = self._principal(scope, path, client_ip)
+        if principal is not None:
+            user = principal
+            if path == UPLOAD_PATH and not principal.startswith("ip:"):
+                user = await self._session_user(principal)
+            allowed, retry_after = await self.store.consume(
+                f"user:{user}", config.user_rate, config.user_burst
+            )
+            if not allowed:
+                await self._reject(
+                    scope, receive, send, retry_after, "Too many requests for user"
+                )
+                return
+
+        if path != UPLOAD_PATH or principal is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not self.upload_limiter.acquire(principal):
+            await self._reject(
+                scope, receive, send, 1.0, "Too many concurrent uploads for session"
+            )
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.upload_limiter.release(principal)
+
+    def _client_ip(self, scope: Scope) -> str:
+        """Get the client IP of the request
+
+        Args:
+            scope (Scope): ASGI scope.
+
+        Returns:
+            str: The client IP
+        """
+        if self.config.trust_forwarded:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def _session_user(self, session_id: str) -> str:
+        """Get the key of the user bucket of a session
+
+        Args:
+            session_id (str): Canonical session ID.
+
+        Returns:
+            str: The user ID, or the session ID when the user of the session
+            is unknown
+        """
+        user_id = self._session_users.get(session_id)
+        if user_id is not None:
+            self._session_users.move_to_end(session_id)
+            return user_id
+        if self.resolve_user is None:
+            return f"session:{session_id}"
+        try:
+            user_id = await self.resolve_user(session_id)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning(f"Failed to resolve the user of a session: {str(e)}")
+            user_id = None
+        if user_id is None:
+            return f"session:{session_id}"
+        self._session_users[session_id] = user_id
+        if len(self._session_users) > self.session_cache_size:
+            self._session_users.popitem(last=False)
+        return user_id
+
+    @staticmethod
+    def _principal(scope: Scope, path: str, client_ip: str) -> Optional[str]:
+        """Get the user or session the request is made for
+
+        Args:
+            scope (Scope): ASGI scope.
+            path (str): Request path.
+            client_ip (str): Client IP of the request.
+
+        Returns:
+            Optional[str]: The user ID for /start_session, the canonical session
+            ID for /upload, or the client IP when the session ID is invalid.
+            None if the query parameter is missing
+        """
+        param = "user_id" if path == START_SESSION_PATH else "session_id"
+        values = parse_qs(scope["query_string"].decode("latin-1")).get(param)
+        if not values:
+            return None
+        if path != UPLOAD_PATH:
+            return values[0]
+        try:
+            return encode_session_id(decode_session_id(values[0]))
+        except ValueError:
+            return f"ip:{client_ip}"
+
+    @staticmethod
+    async def _reject(
+        scope: Scope, receive: Receive, send: Send, retry_after: float, reason: str
+    ) -> None:
+        """Send a 429 response
+
+        Args:
+            scope (Scope): ASGI scope.
+            receive (Receive): ASGI receive channel.
+            send (Send): ASGI send channel.
+            retry_after (float): Seconds until the request may be retried.
+            reason (str): Reason of the rejection.
+        """
+        retry_after = max(1, math.ceil(retry_after))
+        logger.warning(f"{reason} on {scope['path']}, retry after {retry_after}s")
+        response = JSONResponse(
+            content={"message": f"{reason}. Retry after {retry_after} seconds"},
+            status_code=429,
+            headers={"Retry-After": str(retry_after)},
+        )
+        await response(scope, receive, send)
+
+
+class ProfilingMiddleware:
+    """Profiling Middleware
+
+    Times every request and traces a ``sample_rate`` fraction of them: the
+    spans recorded with :func:`utils.helpers.profiling_utils.span` during a
+    traced request are returned in a ``Server-Timing`` header. Requests slower
+    than ``slow_request_ms`` are logged, with their span breakdown when
+    traced.
+
+    Only added to the app when profiling is enabled.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        config: ProfilingConfig,
+        excluded_paths: Iterable[str] = (PROFILE_PATH,),
+    ) -> None:
+        self.app = app
+        self.config = config
+        self.excluded_paths = frozenset(excluded_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        if random.random() >= self.config.sample_rate:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self._log_if_slow(scope, start)
+            return
+
+        trace, token = start_trace()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start" and self.config.server_timing:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                metrics = (trace.server_timing(), f"total;dur={elapsed_ms:.1f}")
+                timing = ", ".join(metric for metric in metrics if metric)
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"server-timing", timing.encode("latin-1")),
+                    ],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end_trace(token)
+            self._log_if_slow(scope, start, trace)
+
+    def _log_if_slow(
+        self, scope: Scope, start: float, trace: Optional[RequestTrace] = None
+    ) -> None:
+        """Log a request slower than the threshold
+
+        Args:
+            scope (Scope): ASGI scope.
+            start (float): Start time of the request.
+            trace (Optional[RequestTrace], optional): Trace of a traced request,
+                its span breakdown is logged. Defaults to None.
+        """
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms < self.config.slow_request_ms:
+            return
+        msg = f"Slow request {scope['method']} {scope['path']} took {elapsed_ms:.1f} ms"
+        if trace is not None:
+            msg = f"{msg}: {trace.summary() or 'no spans'}"
+        logger.warning(msg)
@@ -0,0 +1,714 @@
+import argparse
+import asyncio
+import csv
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import httpx
+
+from database.crud import FaceEncoderCRUD
+from database.image_store import (
+    ImageStore,
+    ImageStoreConfig,
+    LocalImageStore,
+    build_image_store,
+    image_hash,
+)
+from utils.helpers.api_utils import (
+    FACE_ENCODING_HOST,
+    FACE_ENCODING_PORT,
+    send_request_with_retries,
+)
+from utils.helpers.embedding_utils import EmbeddingConfig, postprocess_face_encodings
+from utils.helpers.session_utils import decode_session_id, encode_session_id, uuid7
+from utils.logger.logger import Logger
+
+logger = Logger("face-encoder")
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp"}
+
+STORED = "stored"
+REJECTED = "rejected"
+
+
+class IngestItem:
+    """Image to ingest"""
+
+    __slots__ = ("path", "user_id", "session_id")
+
+    def __init__(
+        self, path: str, user_id: str, session_id: Optional[uuid.UUID] = None
+    ) -> None:
+        self.path = path
+        self.user_id = user_id
+        self.session_id = session_id
+
+
+class PreprocessedImage:
+    """Image read by a worker process
+
+    ``error`` is set when the image cannot be ingested. ``transient`` tells
+    an I/O error, worth retrying, from an invalid image.
+    """
+
+    __slots__ = ("path", "contents", "sha256", "error", "transient")
+
+    def __init__(
+        self,
+        path: str,
+        contents: bytes = b"",
+        sha256: str = "",
+        error: Optional[str] = None,
+        transient: bool = False,
+    ) -> None:
+        self.path = path
+        self.contents = contents
+        self.sha256 = sha256
+        self.error = error
+        self.transient = transient
+
+
+def preprocess_image(
+    path: str, max_file_size: int, image_store_path: str = ""
+) -> PreprocessedImage:
+    """Read and validate an image, and retain it. Runs in a worker process.
+
+    Args:
+        path (str): Image path.
+        max_file_size (int): Maximum file size in bytes.
+        image_store_path (str, optional): Root of the image store the image is
+            copied to, images are not retained when empty. Defaults to "".
+
+    Returns:
+        PreprocessedImage: The image, or the reason it cannot be ingested
+    """
+    try:
+        size = os.path.getsize(path)
+        if size == 0 or size > max_file_size:
+            return PreprocessedImage(path, error=f"Invalid file size {size} bytes")
+        with open(path, "rb") as f:
+            contents = f.read()
+        digest = (
+            LocalImageStore(image_store_path).put(contents)
+            if image_store_path
+            else image_hash(contents)
+        )
+    except OSError as e:
+        return PreprocessedImage(
+            path, error=f"Failed to read or retain image: {str(e)}", transient=True
+        )
+    return PreprocessedImage(path, contents, digest)
+
+
+def discover_images(source: str, default_user_id: str = "ingest") -> List[IngestItem]:
+    """List the images of a directory or a manifest
+
+    In a directory, the images are grouped by user: the first directory level
+    under ``source`` is the user ID, images directly in ``source`` belong to
+    ``default_user_id``. A manifest is a CSV file with a ``path`` column
+    (relative to the manifest directory or absolute), and optional ``user_id``
+    and ``session_id`` columns. Images with a ``session_id`` are added to that
+    existing session.
+
+    Args:
+        source (str): Directory or manifest file.
+        default_user_id (str, optional): User ID of the images without one.
+            Defaults to "ingest".
+
+    Raises:
+        ValueError: The manifest has no path column or an invalid session ID
+
+    Returns:
+        List[IngestItem]: The images, in a stable order
+    """
+    if os.path.isfile(source):
+        return _read_manifest(source, default_user_id)
+
+    items = []
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        relative = os.path.relpath(root, source)
+        user_id = default_user_id if relative == "." else relative.split(os.sep)[0]
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                items.append(IngestItem(os.path.join(root, name), user_id))
+    return items
+
+
+def _read_manifest(manifest: str, default_user_id: str) -> List[IngestItem]:
+    """Read a CSV manifest
+
+    Args:
+        manifest (str): Manifest file.
+        default_user_id (str): User ID of the rows without one.
+
+    Raises:
+        ValueError: The manifest has no path column or an invalid session ID
+
+    Returns:
+        List[IngestItem]: The images
+    """
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        if "path" not in (reader.fieldnames or []):
+            raise ValueError(f"Manifest {manifest} has no 'path' column")
+        items = []
+        for row in reader:
+            session_id = row.get("session_id")
+            items.append(
+                IngestItem(
+                    os.path.join(base, row["path"]),
+                    row.get("user_id") or default_user_id,
+                    decode_session_id(session_id) if session_id else None,
+                )
+            )
+    return items
+
+
+class IngestCheckpoint:
+    """Ingest Checkpoint Class
+
+    Append-only JSON lines file recording the session created for each user
+    and the images whose outcome is final: stored (committed to the database)
+    or rejected. Images that failed are not recorded, so a resumed run
+    retries them. A truncated last line, left by a crash, is ignored.
+    """
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = path
+        self.done: Set[str] = set()
+        self.sessions: Dict[str, uuid.UUID] = {}
+        self._file = None
+        if path is None:
+            return
+        if os.path.exists(path):
+            self._load(path)
+        # Kept open for the whole run, closed by close().
+        # pylint: disable-next=consider-using-with
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _load(self, path: str) -> None:
+        """Load the records of a previous run
+
+        Args:
+            path (str): Checkpoint file.
+        """
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "session_id" in record:
+                    self.sessions[record["user_id"]] = decode_session_id(
+                        record["session_id"]
+                    )
+                else:
+                    self.done.add(record["path"])
+
+    def record_session(self, user_id: str, session_id: uuid.UUID) -> None:
+        """Record the session created for a user
+
+        Args:
+            user_id (str): User ID.
+            session_id (uuid.UUID): Session ID.
+        """
+        self.sessions[user_id] = session_id
+        self._write([{"user_id": user_id, "session_id": encode_session_id(session_id)}])
+
+    def record_done(self, outcomes: Iterable[Tuple[str, str]]) -> None:
+        """Record the images whose outcome is final
+
+        Args:
+            outcomes (Iterable[Tuple[str, str]]): Path and outcome of each image.
+        """
+        outcomes = list(outcomes)
+        self.done.update(path for path, _ in outcomes)
+        self._write([{"path": path, "status": status} for path, status in outcomes])
+
+    def _write(self, records: List[Dict]) -> None:
+        """Append records and sync them to disk
+
+        Args:
+            records (List[Dict]): The records.
+        """
+        if self._file is None or not records:
+            return
+        self._file.write("".join(json.dumps(r) + "\n" for r in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        """Close the checkpoint file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class IngestStats:
+    """Ingest Statistics Class"""
+
+    def __init__(
+        self, total: int = 0, clock: Callable[[], float] = time.perf_counter
+    ) -> None:
+        self.total = total
+        self.skipped = 0
+        self.encoded = 0
+        self.stored = 0
+        self.rejected = 0
+        self.failed = 0
+        self.bytes_read = 0
+        self._clock = clock
+        self._start = clock()
+
+    @property
+    def processed(self) -> int:
+        """Number of images with an outcome in this run"""
+        return self.stored + self.rejected + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the start of the run"""
+        return self._clock() - self._start
+
+    def rate(self) -> float:
+        """Get the throughput
+
+        Returns:
+            float: Processed images per second
+        """
+        elapsed = self.elapsed
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def progress(self) -> str:
+        """Get the progress line
+
+        Returns:
+            str: Progress, throughput and estimated remaining time
+        """
+        remaining = self.total - self.skipped - self.processed
+        rate = self.rate()
+        eta = f"{remaining / rate:.0f}s" if rate > 0 else "-"
+        return (
+            f"Ingested {self.skipped + self.processed}/{self.total} images "
+            f"({self.stored} stored, {self.rejected} rejected, {self.failed} failed, "
+            f"{self.skipped} skipped) at {rate:.1f} images/s, ETA {eta}"
+        )
+
+    def to_dict(self) -> Dict:
+        """Get the counters
+
+        Returns:
+            Dict: The counters, elapsed time and throughput
+        """
+        return {
+            "total": self.total,
+            "skipped": self.skipped,
+            "encoded": self.encoded,
+            "stored": self.stored,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "bytes_read": self.bytes_read,
+            "elapsed_s": self.elapsed,
+            "images_per_s": self.rate(),
+        }
+
+
+class Ingestor:
+    """Bulk Ingest Class
+
+    Pipeline of three stages connected by bounded queues:
+
+    - images are read and validated in a process pool
+    - ``concurrency`` tasks send them to the face-encoding service over one
+      shared HTTP client, with retries, and post-process the encodings
+    - a writer inserts the results in batches with
+      :meth:`FaceEncoderCRUD.add_sessions` and records them in the checkpoint
+      once committed
+
+    Each user gets one session holding all of their images, the 5 uploads per
+    session limit of ``/upload`` does not apply.
+    """
+
+    def __init__(
+        self,
+        crud: FaceEncoderCRUD,
+        checkpoint: IngestCheckpoint,
+        embedding_config: EmbeddingConfig = None,
+        host: str = FACE_ENCODING_HOST,
+        port: int = FACE_ENCODING_PORT,
+        workers: int = None,
+        concurrency: int = 16,
+        batch_size: int = 500,
+        retries: int = 3,
+        timeout: float = 60.0,
+        max_file_size: int = int(os.getenv("MAX_FILE_SIZE", "2000000")),
+        progress_interval: float = 10.0,
+        image_store: ImageStore = None,
+    ) -> None:
+        self.crud = crud
+        self.checkpoint = checkpoint
+        self.embedding_config = embedding_config or EmbeddingConfig()
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.retries = retries
+        self.timeout = timeout
+        self.max_file_size = max_file_size
+        self.progress_interval = progress_interval
+        self.image_store = image_store
+        self.stats = IngestStats()
+
+    async def run(
+        self, items: List[IngestItem], client: httpx.AsyncClient = None
+    ) -> IngestStats:
+        """Ingest images
+
+        Args:
+            items (List[IngestItem]): The images.
+            client (httpx.AsyncClient, optional): Client of the face-encoding
+                service. A client with ``concurrency`` connections is created
+                when None. Defaults to None.
+
+        Returns:
+            IngestStats: Statistics of the run
+        """
+        self.stats = IngestStats(total=len(items))
+        if client is None:
+            limits = httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            )
+            async with httpx.AsyncClient(limits=limits) as new_client:
+                return await self.run(items, client=new_client)
+
+        encode_queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=self.batch_size * 2)
+        # Spawned workers: forking would copy the locks held by the database
+        # writer and logging threads.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+            reporter = asyncio.create_task(self._report_progress())
+            writer = asyncio.create_task(self._write(write_queue))
+            encoders = [
+                asyncio.create_task(self._encode(client, encode_queue, write_queue))
+                for _ in range(self.concurrency)
+            ]
+            try:
+                await self._read(pool, items, encode_queue)
+                for _ in encoders:
+                    await encode_queue.put(None)
+                await asyncio.gather(*encoders)
+                await write_queue.put(None)
+                await writer
+            finally:
+                reporter.cancel()
+                for task in (writer, *encoders):
+                    task.cancel()
+
+        logger.info(self.stats.progress())
+        return self.stats
+
+    async def _session_for(self, item: IngestItem) -> uuid.UUID:
+        """Get the session of an image, creating the session of its user
+
+        Args:
+            item (IngestItem): The image.
+
+        Returns:
+            uuid.UUID: The session ID
+        """
+        if item.session_id is not None:
+            return item.session_id
+        session_id = self.checkpoint.sessions.get(item.user_id)
+        if session_id is None:
+            session_id = uuid7()
+            await asyncio.to_thread(self._start_session, session_id, item.user_id)
+            self.checkpoint.record_session(item.user_id, session_id)
+        return session_id
+
+    def _start_session(self, session_id: uuid.UUID, user_id: str) -> None:
+        """Close the opened sessions of a user and start a new one, as
+        ``/start_session`` does
+
+        Args:
+            session_id (uuid.UUID): Session ID.
+            user_id (str): User ID.
+        """
+        if self.crud.get_user_oppened_sessions(user_id=user_id):
+            logger.info(f"Closing {user_id} previous session")
+            self.crud.close_user_session(user_id=user_id)
+        self.crud.add_user_session(session_id=session_id, user_id=user_id)
+
+    async def _read(
+        self,
+        pool: ProcessPoolExecutor,
+        items: List[IngestItem],
+        encode_queue: asyncio.Queue,
+    ) -> None:
+        """Read the images in the process pool and queue them for encoding
+
+        Args:
+            pool (ProcessPoolExecutor): The process pool.
+            items (List[IngestItem]): The images.
+            encode_queue (asyncio.Queue): Queue of the encoding stage.
+        """
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.workers * 4)
+        pending: Set[asyncio.Task] = set()
+        # Workers write to a local store themselves, other stores are written
+        # to from this process.
+        local_root = (
+            self.image_store.root
+            if isinstance(self.image_store, LocalImageStore)
+            else ""
+        )
+        remote_store = None if local_root else self.image_store
+
+        async def read_one(item: IngestItem, session_id: uuid.UUID) -> None:
+            try:
+                image = await loop.run_in_executor(
+                    pool,
+                    preprocess_image,
+                    item.path,
+                    self.max_file_size,
+                    local_root,
+                )
+            finally:
+                slots.release()
+            if image.error is not None and image.transient:
+                # Not checkpointed: the image is retried on resume.
+                logger.warning(f"Failed to read {item.path}: {image.error}")
+                self.stats.failed += 1
+                return
+            if image.error is not None:
+                logger.warning(f"Skipping {item.path}: {image.error}")
+                self.stats.rejected += 1
+                self.checkpoint.record_done([(item.path, REJECTED)])
+                return
+            if remote_store is not None:
+                try:
+                    await asyncio.to_thread(remote_store.put, image.contents)
+                except Exception as e:  # pylint: disable=broad-except
+                    # Not checkpointed: the image is retried on resume.
+                    logger.warning(f"Failed to retain {item.path}: {str(e)}")
+                    self.stats.failed += 1
+                    return
+            self.stats.bytes_read += len(image.contents)
+            await encode_queue.put((item, session_id, image))
+
+        for item in items:
+            if item.path in self.checkpoint.done:
+                self.stats.skipped += 1
+                continue
+            session_id = await self._session_for(item)
+            await slots.acquire()
+            task = asyncio.create_task(read_one(item, session_id))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def _encode(
+        self,
+        client: httpx.AsyncClient,
+        encode_queue: asyncio.Queue,
+        write_queue: asyncio.Queue,
+    ) -> None:
+        """Encoding worker: encode and post-process the queued images
+
+        Args:
+            client (httpx.AsyncClient): Client of the face-encoding service.
+            encode_queue (asyncio.Queue): Queue of the encoding stage.
+            write_queue (asyncio.Queue): Queue of the writer.
+        """
+        while True:
+            job = await encode_queue.get()
+            if job is None:
+                return
+            item, session_id, image = job
+            response = await self._send(client, image)
+            if response is None:
+                self.stats.failed += 1
+                continue
+            self.stats.encoded += 1
+            if response.status_code != 200:
+                logger.warning(
+                    f"Rejected {item.path}: face-encoding service returned "
+                    f"{response.status_code}"
+                )
+                await write_queue.put((item.path, None))
+                continue
+            try:
+                processed = postprocess_face_encodings(
+                    response.json(), self.embedding_config
+                )
+            except ValueError as e:
+                logger.warning(f"Rejected {item.path}: {str(e)}")
+                await write_queue.put((item.path, None))
+                continue
+            if processed.quality.issues:
+                logger.warning(
+                    f"Rejected {item.path}: {'; '.join(processed.quality.issues)}"
+                )
+                await write_queue.put((item.path, None))
+                continue
+            await write_queue.put(
+                (item.path, (session_id, processed.stored, image.sha256))
+            )
+
+    async def _send(
+        self, client: httpx.AsyncClient, image: PreprocessedImage
+    ) -> Optional[httpx.Response]:
+        """Send an image to the face-encoding service, retrying on errors
+
+        Args:
+            client (httpx.AsyncClient): Client of the face-encoding service.
+            image (PreprocessedImage): The image.
+
+        Returns:
+            Optional[httpx.Response]: The response, None when every attempt
+            failed with a connection error or a 5xx status
+        """
+        try:
+            response = await send_request_with_retries(
+                client,
+                image.contents,
+                host=self.host,
+                port=self.port,
+                retries=self.retries,
+                timeout=self.timeout,
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"Failed to encode {image.path}: {str(e)}")
+            return None
+        if response.status_code >= 500:
+            logger.error(
+                f"Failed to encode {image.path}: status code {response.status_code}"
+            )
+            return None
+        return response
+
+    async def _write(self, write_queue: asyncio.Queue) -> None:
+        """Writer: insert the results in batches and checkpoint them
+
+        Args:
+            write_queue (asyncio.Queue): Queue of the writer.
+        """
+        batch: List[Tuple[str, Optional[Tuple[uuid.UUID, Dict, str]]]] = []
+        closed = False
+        while not closed:
+            try:
+                result = await asyncio.wait_for(write_queue.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                result = ()
+            if result is None:
+                closed = True
+            elif result:
+                batch.append(result)
+            if batch and (closed or not result or len(batch) >= self.batch_size):
+                await self._flush(batch)
+                batch = []
+
+    async def _flush(
+        self, batch: List[Tuple[str, Optional[Tuple[uuid.UUID, Dict, str]]]]
+    ) -> None:
+        """Insert a batch of results
+
+        Args:
+            batch (List[Tuple[str, Optional[Tuple[uuid.UUID, Dict, str]]]]): Path and
+                session ID, face encodings and image hash of each image, None if
+                rejected.
+        """
+        rows = [row for _, row in batch if row is not None]
+        try:
+            await asyncio.to_thread(
+                self.crud.add_sessions,
+                rows,
+                encoder_model=self.embedding_config.encoder_model,
+                encoder_version=self.embedding_config.encoder_version,
+            )
+        except ValueError as e:
+            logger.error(str(e))
+            self.stats.failed += len(rows)
+            rejected = [(path, REJECTED) for path, row in batch if row is None]
+            self.stats.rejected += len(rejected)
+            self.checkpoint.record_done(rejected)
+            return
+        self.stats.stored += len(rows)
+        self.stats.rejected += len(batch) - len(rows)
+        self.checkpoint.record_done(
+            (path, STORED if row is not None else REJECTED) for path, row in batch
+        )
+
+    async def _report_progress(self) -> None:
+        """Log the progress periodically"""
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            logger.info(self.stats.progress())
+
+
+def add_ingest_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments of the ingest command
+
+    Args:
+        parser (argparse.ArgumentParser): Parser of the command.
+    """
+    parser.add_argument("source", help="Directory of images or CSV manifest")
+    parser.add_argument(
+        "--checkpoint",
+        help="Checkpoint file. An interrupted run started again with the same "
+        "file resumes where it stopped",
+    )
+    parser.add_argument("--user-id", default="ingest", help="Default user ID")
+    parser.add_argument("--workers", type=int, help="Image reading processes")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--host", default=FACE_ENCODING_HOST)
+    parser.add_argument("--port", type=int, default=FACE_ENCODING_PORT)
+    parser.add_argument("--progress-interval", type=float, default=10.0)
+
+
+def run_ingest(args: argparse.Namespace) -> IngestStats:
+    """Run the ingest command
+
+    Args:
+        args (argparse.Namespace): Arguments of the command.
+
+    Returns:
+        IngestStats: Statistics of the run
+    """
+    items = discover_images(args.source, args.user_id)
+    logger.info(f"Found {len(items)} images in {args.source}")
+
+    crud = FaceEncoderCRUD()
+    crud.create_db_and_tables()
+    checkpoint = IngestCheckpoint(args.checkpoint)
+    ingestor = Ingestor(
+        crud,
+        checkpoint,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        retries=args.retries,
+        timeout=args.timeout,
+        progress_interval=args.progress_interval,
+        image_store=build_image_store(ImageStoreConfig()),
+    )
+    try:
+        return asyncio.run(ingestor.run(items))
+    finally:
+        checkpoint.close()
+        crud.close()
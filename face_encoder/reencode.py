@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from database.crud import FaceEncoderCRUD
+from database.image_store import ImageStore, ImageStoreConfig, build_image_store
+from utils.helpers.api_utils import (
+    FACE_ENCODING_HOST,
+    FACE_ENCODING_PORT,
+    send_request_with_retries,
+)
+from utils.helpers.embedding_utils import EmbeddingConfig, postprocess_face_encodings
+from utils.helpers.rate_limit_utils import InMemoryRateLimitStore
+from utils.logger.logger import Logger
+
+logger = Logger("face-encoder")
+
+
+class ReencodeStats:
+    """Re-encode Statistics Class"""
+
+    def __init__(
+        self, total: int = 0, clock: Callable[[], float] = time.perf_counter
+    ) -> None:
+        self.total = total
+        self.reencoded = 0
+        self.missing_image = 0
+        self.rejected = 0
+        self.failed = 0
+        self.last_id = 0
+        self._clock = clock
+        self._start = clock()
+
+    @property
+    def scanned(self) -> int:
+        """Number of stale uploads with an outcome in this run"""
+        return self.reencoded + self.missing_image + self.rejected + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the start of the run"""
+        return self._clock() - self._start
+
+    def rate(self) -> float:
+        """Get the throughput
+
+        Returns:
+            float: Scanned uploads per second
+        """
+        elapsed = self.elapsed
+        return self.scanned / elapsed if elapsed > 0 else 0.0
+
+    def progress(self) -> str:
+        """Get the progress line
+
+        Returns:
+            str: Progress, throughput and estimated remaining time
+        """
+        rate = self.rate()
+        remaining = max(self.total - self.scanned, 0)
+        eta = f"{remaining / rate:.0f}s" if rate > 0 else "-"
+        return (
+            f"Re-encoded {self.reencoded}/{self.total} uploads "
+            f"({self.missing_image} without image, {self.rejected} rejected, "
+            f"{self.failed} failed, last ID {self.last_id}) at {rate:.1f} uploads/s, "
+            f"ETA {eta}"
+        )
+
+    def to_dict(self) -> Dict:
+        """Get the counters
+
+        Returns:
+            Dict: The counters, elapsed time and throughput
+        """
+        return {
+            "total": self.total,
+            "scanned": self.scanned,
+            "reencoded": self.reencoded,
+            "missing_image": self.missing_image,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "last_id": self.last_id,
+            "elapsed_s": self.elapsed,
+            "uploads_per_s": self.rate(),
+        }
+
+
+class Reencoder:
+    """Incremental Re-encode Class
+
+    Re-encodes the uploads whose face encodings were not produced by the
+    configured encoder (``FACE_ENCODER_MODEL`` and ``FACE_ENCODER_VERSION``):
+
+    - stale uploads are read in primary key order, one keyset page of
+      ``batch_size`` rows at a time
+    - their images are read from the image store and sent to the face-encoding
+      service by up to ``concurrency`` tasks, at most ``rate`` images per
+      second
+    - the new encodings of each page are written next to the current ones
+      with :meth:`FaceEncoderCRUD.set_pending_encodings`, and read in their
+      place from then on
+
+    Re-encoded uploads are no longer stale, so a run started again after an
+    interruption continues where the previous one stopped. Uploads without a
+    retained image, or whose new encodings fail the quality checks, keep
+    their current encodings.
+    """
+
+    def __init__(
+        self,
+        crud: FaceEncoderCRUD,
+        image_store: ImageStore,
+        embedding_config: EmbeddingConfig = None,
+        host: str = FACE_ENCODING_HOST,
+        port: int = FACE_ENCODING_PORT,
+        rate: float = 50.0,
+        burst: float = 50.0,
+        batch_size: int = 200,
+        concurrency: int = 8,
+        retries: int = 3,
+        timeout: float = 60.0,
+        progress_interval: float = 10.0,
+    ) -> None:
+        self.crud = crud
+        self.image_store = image_store
+        self.embedding_config = embedding_config or EmbeddingConfig()
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = timeout
+        self.progress_interval = progress_interval
+        self.stats = ReencodeStats()
+        self._limiter = InMemoryRateLimitStore(max_keys=1)
+
+    @property
+    def encoder_model(self) -> str:
+        """Model the uploads are re-encoded with"""
+        return self.embedding_config.encoder_model
+
+    @property
+    def encoder_version(self) -> str:
+        """Version the uploads are re-encoded with"""
+        return self.embedding_config.encoder_version
+
+    async def run(self, client: httpx.AsyncClient = None) -> ReencodeStats:
+        """Re-encode the stale uploads
+
+        Args:
+            client (httpx.AsyncClient, optional): Client of the face-encoding
+                service. A client with ``concurrency`` connections is created
+                when None. Defaults to None.
+
+        Returns:
+            ReencodeStats: Statistics of the run
+        """
+        if client is None:
+            limits = httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            )
+            async with httpx.AsyncClient(limits=limits) as new_client:
+                return await self.run(client=new_client)
+
+        total = await asyncio.to_thread(
+            self.crud.count_stale_sessions, self.encoder_model, self.encoder_version
+        )
+        self.stats = ReencodeStats(total=total)
+        logger.info(
+            f"Re-encoding {total} uploads with "
+            f"{self.encoder_model}:{self.encoder_version}"
+        )
+        slots = asyncio.Semaphore(self.concurrency)
+        reporter = asyncio.create_task(self._report_progress())
+        try:
+            while True:
+                page = await asyncio.to_thread(
+                    self.crud.get_stale_sessions,
+                    self.encoder_model,
+                    self.encoder_version,
+                    after_id=self.stats.last_id,
+                    limit=self.batch_size,
+                )
+                if not page:
+                    break
+                results = await asyncio.gather(
+                    *(self._reencode(client, slots, *row) for row in page)
+                )
+                await self._flush([row for row in results if row is not None])
+                self.stats.last_id = page[-1][0]
+        finally:
+            reporter.cancel()
+
+        logger.info(self.stats.progress())
+        return self.stats
+
+    async def _throttle(self) -> None:
+        """Wait until the rate limit allows one more image"""
+        if self.rate <= 0:
+            return
+        while True:
+            allowed, retry_after = await self._limiter.consume(
+                "reencode", self.rate, self.burst
+            )
+            if allowed:
+                return
+            await asyncio.sleep(retry_after)
+
+    async def _reencode(
+        self,
+        client: httpx.AsyncClient,
+        slots: asyncio.Semaphore,
+        row_id: int,
+        digest: Optional[str],
+    ) -> Optional[Tuple[int, Dict]]:
+        """Re-encode one upload
+
+        Args:
+            client (httpx.AsyncClient): Client of the face-encoding service.
+            slots (asyncio.Semaphore): Bound on the concurrent requests.
+            row_id (int): ID of the upload.
+            digest (Optional[str]): Hash of its image.
+
+        Returns:
+            Optional[Tuple[int, Dict]]: The ID and new face encodings of the
+            upload, None if it cannot be re-encoded
+        """
+        async with slots:
+            contents = (
+                await asyncio.to_thread(self.image_store.get, digest)
+                if digest
+                else None
+            )
+            if contents is None:
+                self.stats.missing_image += 1
+                return None
+
+            await self._throttle()
+            try:
+                response = await send_request_with_retries(
+                    client,
+                    contents,
+                    host=self.host,
+                    port=self.port,
+                    retries=self.retries,
+                    timeout=self.timeout,
+                )
+            except httpx.HTTPError as e:
+                logger.error(f"Failed to re-encode upload {row_id}: {str(e)}")
+                self.stats.failed += 1
+                return None
+
+        if response.status_code >= 500:
+            logger.error(
+                f"Failed to re-encode upload {row_id}: "
+                f"status code {response.status_code}"
+            )
+            self.stats.failed += 1
+            return None
+        if response.status_code != 200:
+            logger.warning(
+                f"Rejected upload {row_id}: face-encoding service returned "
+                f"{response.status_code}"
+            )
+            self.stats.rejected += 1
+            return None
+        try:
+            processed = postprocess_face_encodings(
+                response.json(), self.embedding_config
+            )
+        except ValueError as e:
+            logger.warning(f"Rejected upload {row_id}: {str(e)}")
+            self.stats.rejected += 1
+            return None
+        if processed.quality.issues:
+            logger.warning(
+                f"Rejected upload {row_id}: {'; '.join(processed.quality.issues)}"
+            )
+            self.stats.rejected += 1
+            return None
+        return row_id, processed.stored
+
+    async def _flush(self, rows: List[Tuple[int, Dict]]) -> None:
+        """Write the new face encodings of a page
+
+        Args:
+            rows (List[Tuple[int, Dict]]): The ID and new face encodings of each
+                upload.
+        """
+        try:
+            await asyncio.to_thread(
+                self.crud.set_pending_encodings,
+                rows,
+                self.encoder_model,
+                self.encoder_version,
+            )
+        except ValueError as e:
+            logger.error(str(e))
+            self.stats.failed += len(rows)
+            return
+        self.stats.reencoded += len(rows)
+
+    async def _report_progress(self) -> None:
+        """Log the progress periodically"""
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            logger.info(self.stats.progress())
+
+
+def add_reencode_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments of the reencode command
+
+    Args:
+        parser (argparse.ArgumentParser): Parser of the command.
+    """
+    parser.add_argument(
+        "--promote",
+        action="store_true",
+        help="End the dual-read period: replace the current face encodings "
+        "with the re-encoded ones instead of re-encoding",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=50.0,
+        help="Images sent per second, unlimited when 0",
+    )
+    parser.add_argument("--burst", type=float, default=50.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--host", default=FACE_ENCODING_HOST)
+    parser.add_argument("--port", type=int, default=FACE_ENCODING_PORT)
+    parser.add_argument("--progress-interval", type=float, default=10.0)
+
+
+def run_reencode(args: argparse.Namespace) -> ReencodeStats:
+    """Run the reencode command
+
+    Args:
+        args (argparse.Namespace): Arguments of the command.
+
+    Raises:
+        ValueError: No image store is configured
+
+    Returns:
+        ReencodeStats: Statistics of the run
+    """
+    embedding_config = EmbeddingConfig()
+    crud = FaceEncoderCRUD()
+    try:
+        if args.promote:
+            stats = ReencodeStats()
+            stats.reencoded = crud.promote_pending_encodings(
+                embedding_config.encoder_model,
+                embedding_config.encoder_version,
+                batch_size=args.batch_size,
+            )
+            logger.info(f"Promoted {stats.reencoded} re-encoded uploads")
+            return stats
+
+        image_store = build_image_store(ImageStoreConfig())
+        if image_store is None:
+            raise ValueError(
+                "An image store (IMAGE_STORE_PATH or IMAGE_STORE_BACKEND=s3) must "
+                "be configured to re-encode uploads"
+            )
+        reencoder = Reencoder(
+            crud,
+            image_store,
+            embedding_config,
+            host=args.host,
+            port=args.port,
+            rate=args.rate,
+            burst=args.burst,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+            retries=args.retries,
+            timeout=args.timeout,
+            progress_interval=args.progress_interval,
+        )
+        return asyncio.run(reencoder.run())
+    finally:
+        crud.close()
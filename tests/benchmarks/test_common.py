@@ -0,0 +1,70 @@
+from benchmarks.common import (
+    BenchmarkResult,
+    compare_results,
+    latency_summary,
+    percentile,
+    regressions,
+)
+
+
+def build_result(latency: float, rps: float) -> dict:
+    """Build a benchmark result
+
+    Args:
+        latency (float): p99 latency in milliseconds.
+        rps (float): Throughput.
+
+    Returns:
+        dict: The JSON representation of the result
+    """
+    result = BenchmarkResult("load_test")
+    result.add("upload.p99_ms", latency, "ms")
+    result.add("upload.rps", rps, "req/s", higher_is_better=True)
+    return result.to_dict()
+
+
+def test_percentile():
+    """Test case for the percentile function"""
+    samples = list(range(1, 101))
+
+    assert percentile(samples, 50) == 50.5
+    assert percentile(samples, 99) == 99.01
+    assert percentile([], 99) == 0.0
+
+
+def test_latency_summary():
+    """Test case for the latency_summary function"""
+    summary = latency_summary([1.0, 2.0, 3.0])
+
+    assert summary["mean_ms"] == 2.0
+    assert summary["p50_ms"] == 2.0
+    assert set(summary) == {"mean_ms", "p50_ms", "p95_ms", "p99_ms"}
+
+
+def test_compare_results_without_regression():
+    """Test case for the comparison of two equivalent runs"""
+    rows = compare_results(build_result(10.0, 100.0), build_result(10.5, 98.0))
+
+    assert len(rows) == 2
+    assert regressions(rows) == []
+
+
+def test_compare_results_detects_regressions():
+    """Test case for the detection of latency and throughput regressions"""
+    rows = compare_results(build_result(10.0, 100.0), build_result(12.0, 80.0))
+
+    assert [row["metric"] for row in regressions(rows)] == [
+        "upload.p99_ms",
+        "upload.rps",
+    ]
+
+
+def test_compare_results_uses_metric_thresholds():
+    """Test case for the thresholds by metric pattern"""
+    rows = compare_results(
+        build_result(10.0, 100.0),
+        build_result(12.0, 100.0),
+        thresholds={"*.p99_ms": 0.25},
+    )
+
+    assert regressions(rows) == []
@@ -0,0 +1,27 @@
+from fastapi.testclient import TestClient
+
+from benchmarks.fake_face_encoding import build_app
+
+
+def test_fake_face_encoding_is_deterministic():
+    """Test that the same image always gets the same encodings"""
+    client = TestClient(build_app(faces=2, dimension=8))
+
+    first = client.post("/v1/selfie", files={"file": ("a.jpg", b"image-a")})
+    second = client.post("/v1/selfie", files={"file": ("a.jpg", b"image-a")})
+    other = client.post("/v1/selfie", files={"file": ("b.jpg", b"image-b")})
+
+    assert first.status_code == 200
+    assert len(first.json()) == 2
+    assert len(first.json()[0]) == 8
+    assert first.json() == second.json()
+    assert first.json() != other.json()
+
+
+def test_fake_face_encoding_error_rate():
+    """Test the configurable error rate of the fake service"""
+    client = TestClient(build_app(error_rate=1.0))
+
+    response = client.post("/v1/selfie", files={"file": ("a.jpg", b"image")})
+
+    assert response.status_code == 500
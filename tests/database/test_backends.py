@@ -0,0 +1,294 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import pytest
+from sqlalchemy import text
+
+from database.backends import (
+    DuckDBBackend,
+    PostgresBackend,
+    SQLiteBackend,
+    StorageBackend,
+    build_backend,
+)
+from database.config import FaceEncoderDBConfig
+from database.crud import FaceEncoderCRUD
+from database.models import FaceEncoderSession
+from utils.helpers.session_utils import encode_session_id, uuid7
+
+SESSION, OTHER, MISSING, FIRST, SECOND, FAILED, OK = (uuid7() for _ in range(7))
+SESSIONS = [uuid7() for _ in range(4)]
+
+
+def build_storage_backend(name: str, tmp_path: Any) -> StorageBackend:
+    """Build a storage backend for the CRUD tests
+
+    Args:
+        name (str): Backend name.
+        tmp_path (Any): Temporary directory of the test.
+
+    Returns:
+        StorageBackend: The storage backend
+    """
+    if name == "sqlite":
+        return SQLiteBackend(f"sqlite:///{tmp_path / 'face_encoder.db'}")
+    if name == "duckdb":
+        pytest.importorskip("duckdb_engine")
+        return DuckDBBackend(f"duckdb:///{tmp_path / 'face_encoder.duckdb'}")
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+    return PostgresBackend(url)
+
+
+@pytest.fixture(name="crud", params=["sqlite", "duckdb", "postgresql"])
+def fixture_crud(request: Any, tmp_path: Any) -> FaceEncoderCRUD:
+    """Fixture for creating a FaceEncoderCRUD instance on each storage backend."""
+    crud = FaceEncoderCRUD(backend=build_storage_backend(request.param, tmp_path))
+    crud.drop_db_and_tables()
+    crud.create_db_and_tables()
+    yield crud
+    crud.close()
+
+
+def test_add_and_count_sessions(crud: FaceEncoderCRUD) -> None:
+    """Test the add_session and get_session_count methods
+
+    Args:
+        crud (FaceEncoderCRUD): FaceEncoderCRUD instance.
+    """
+    for i in range(3):
+        crud.add_session(SESSION, {"dtype": "none", "data": [[float(i)]]})
+    crud.add_session(OTHER, {"dtype": "none", "data": [[1.0]]})
+
+    assert crud.get_session_count(SESSION) == 3
+    assert crud.get_session_count(MISSING) == 0
+    assert len(crud.get_session_encodings(SESSION)) == 3
+
+
+def test_get_session_summary(crud: FaceEncoderCRUD) -> None:
+    """Test the get_session_summary method
+
+    Args:
+        crud (FaceEncoderCRUD): FaceEncoderCRUD instance.
+    """
+    crud.add_session(SESSION, {"dtype": "none", "data": [[0.6, 0.8]]})
+
+    summary = crud.get_session_summary(SESSION)
+
+    assert summary.session_id == encode_session_id(SESSION)
+    assert summary.all_face_encodings == [[[0.6, 0.8]]]
+    with pytest.raises(ValueError):
+        crud.get_session_summary(MISSING)
+
+
+def test_add_sessions_in_bulk(crud: FaceEncoderCRUD) -> None:
+    """Test the add_sessions method
+
+    Args:
+        crud (FaceEncoderCRUD): FaceEncoderCRUD instance.
+    """
+    rows = [
+        (SESSIONS[i % 2], {"dtype": "none", "data": [[float(i)]]}, None)
+        for i in range(7)
+    ]
+
+    assert crud.add_sessions(rows, "model", "1") == 7
+    assert crud.add_sessions([]) == 0
+    assert crud.get_session_count(SESSIONS[0]) == 4
+    assert crud.get_session_count(SESSIONS[1]) == 3
+
+
+def test_reencode_dual_read_and_promote(crud: FaceEncoderCRUD) -> None:
+    """Test the re-encode methods: stale pages, dual read and promotion
+
+    Args:
+        crud (FaceEncoderCRUD): FaceEncoderCRUD instance.
+    """
+    old = {"dtype": "none", "data": [[1.0, 0.0]]}
+    new = {"dtype": "none", "data": [[0.0, 1.0]]}
+    for i in range(5):
+        crud.add_session(SESSION, old, f"hash-{i}", "model", "1")
+
+    assert crud.count_stale_sessions("model", "1") == 0
+    assert crud.count_stale_sessions("model", "2") == 5
+    first_page = crud.get_stale_sessions("model", "2", limit=3)
+    assert [image_hash for _, image_hash in first_page] == [
+        "hash-0",
+        "hash-1",
+        "hash-2",
+    ]
+    second_page = crud.get_stale_sessions("model", "2", after_id=first_page[-1][0])
+    assert len(second_page) == 2
+
+    crud.set_pending_encodings(
+        [(row_id, new) for row_id, _ in first_page], "model", "2"
+    )
+
+    assert crud.count_stale_sessions("model", "2") == 2
+    summary = crud.get_session_summary(SESSION, "model", "2")
+    assert summary.all_face_encodings == [[[0.0, 1.0]]] * 3 + [[[1.0, 0.0]]] * 2
+    assert summary.encoder_versions == ["model:2"] * 3 + ["model:1"] * 2
+    assert crud.get_session_encodings(SESSION, "model", "2") == [new] * 3
+    assert len(crud.get_session_encodings(SESSION)) == 5
+
+    assert crud.promote_pending_encodings("model", "2", batch_size=2) == 3
+    summary = crud.get_session_summary(SESSION)
+    assert summary.encoder_versions == ["model:2"] * 3 + ["model:1"] * 2
+    assert crud.count_stale_sessions("model", "2") == 2
+    assert crud.promote_pending_encodings("model", "2") == 0
+
+
+def test_user_sessions(crud: FaceEncoderCRUD) -> None:
+    """Test the user session methods
+
+    Args:
+        crud (FaceEncoderCRUD): FaceEncoderCRUD instance.
+    """
+    crud.add_user_session(session_id=FIRST, user_id="user")
+    crud.add_user_session(session_id=SECOND, user_id="user")
+
+    assert crud.check_if_session_exists(FIRST) is True
+    assert crud.check_if_session_exists(MISSING) is False
+    assert crud.get_session_user_id(FIRST) == "user"
+    assert crud.get_session_user_id(MISSING) is None
+    assert len(crud.get_user_session("user")) == 2
+    assert len(crud.get_user_oppened_sessions("user")) == 2
+
+    crud.close_user_session("user")
+
+    assert crud.get_user_oppened_sessions("user") == []
+    assert len(crud.get_user_session("user")) == 2
+
+
+def test_duplicate_user_session_fails(crud: FaceEncoderCRUD) -> None:
+    """Test that a failing write raises and leaves the other rows untouched
+
+    Args:
+        crud (FaceEncoderCRUD): FaceEncoderCRUD instance.
+    """
+    crud.add_user_session(session_id=FIRST, user_id="user")
+
+    with pytest.raises(ValueError):
+        crud.add_user_session(session_id=FIRST, user_id="other")
+
+    assert len(crud.get_user_session("user")) == 1
+
+
+def test_concurrent_writes(crud: FaceEncoderCRUD) -> None:
+    """Test writes coming from many threads at once
+
+    Args:
+        crud (FaceEncoderCRUD): FaceEncoderCRUD instance.
+    """
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(
+            executor.map(lambda i: crud.add_session(SESSIONS[i % 4], None), range(200))
+        )
+
+    assert sum(crud.get_session_count(s) for s in SESSIONS) == 200
+
+
+def test_single_writer_isolates_failing_writes(tmp_path: Any) -> None:
+    """Test that a failing write of a batch does not roll back the others
+
+    Args:
+        tmp_path (Any): Temporary directory of the test.
+    """
+    backend = SQLiteBackend(f"sqlite:///{tmp_path / 'face_encoder.db'}")
+    crud = FaceEncoderCRUD(backend=backend)
+    crud.create_db_and_tables()
+
+    def failing_write(session):
+        session.add(FaceEncoderSession(session_id=FAILED))
+        session.flush()
+        raise RuntimeError("write failed")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [
+            executor.submit(
+                crud.run_write,
+                (
+                    failing_write
+                    if i == 5
+                    else (
+                        lambda session: session.add(FaceEncoderSession(session_id=OK))
+                    )
+                ),
+            )
+            for i in range(20)
+        ]
+        errors = [f.exception() for f in futures]
+
+    assert sum(error is not None for error in errors) == 1
+    assert crud.get_session_count(OK) == 19
+    assert crud.get_session_count(FAILED) == 0
+    crud.close()
+
+
+def test_session_ids_are_stored_in_16_bytes(tmp_path: Any) -> None:
+    """Test the storage of the session IDs in binary columns
+
+    Args:
+        tmp_path (Any): Temporary directory of the test.
+    """
+    crud = FaceEncoderCRUD(
+        backend=SQLiteBackend(f"sqlite:///{tmp_path / 'face_encoder.db'}")
+    )
+    crud.create_db_and_tables()
+    crud.add_user_session(session_id=SESSION, user_id="user")
+    crud.add_session(encode_session_id(SESSION), None)
+
+    with crud.engine.connect() as connection:
+        lengths = connection.execute(
+            text(
+                "SELECT length(session_id) FROM user_sessions "
+                "UNION ALL SELECT length(session_id) FROM sessions"
+            )
+        ).scalars()
+        assert list(lengths) == [16, 16]
+
+    assert crud.get_user_session("user")[0].session_id == SESSION
+    assert crud.get_session_count(SESSION) == 1
+    crud.close()
+
+
+def test_sqlite_pragmas(tmp_path: Any) -> None:
+    """Test that SQLite runs in WAL mode with the tuned pragmas
+
+    Args:
+        tmp_path (Any): Temporary directory of the test.
+    """
+    crud = FaceEncoderCRUD(
+        backend=SQLiteBackend(f"sqlite:///{tmp_path / 'face_encoder.db'}")
+    )
+
+    with crud.engine.connect() as connection:
+        journal_mode = connection.execute(text("PRAGMA journal_mode")).scalar()
+        synchronous = connection.execute(text("PRAGMA synchronous")).scalar()
+
+    assert journal_mode == "wal"
+    assert synchronous == 1
+    crud.close()
+
+
+def test_build_backend_from_config(monkeypatch: Any) -> None:
+    """Test the selection of the storage backend from the configuration
+
+    Args:
+        monkeypatch (Any): Pytest monkeypatch fixture.
+    """
+    monkeypatch.setenv("DB_BACKEND", "sqlite")
+    monkeypatch.setenv("DB_PATH", "/tmp/face_encoder.db")
+    monkeypatch.delenv("DB_URL", raising=False)
+
+    backend = build_backend(FaceEncoderDBConfig())
+
+    assert isinstance(backend, SQLiteBackend)
+    assert backend.url == "sqlite:////tmp/face_encoder.db"
+
+    monkeypatch.delenv("DB_BACKEND")
+    monkeypatch.setenv("DB_URL", "duckdb:///:memory:")
+
+    assert isinstance(build_backend(FaceEncoderDBConfig()), DuckDBBackend)
@@ -1,7 +1,11 @@
+import sqlite3
+from typing import Any
+
 import pytest
-from sqlalchemy import Engine
+from sqlalchemy import Engine, inspect
 
-from database.database import FaceEncoderDB
+from database.backends import SQLiteBackend
+from database.database import FaceEncoderDB, SchemaMismatchError
 
 
 @pytest.fixture(name="face_encoder_db")
@@ -28,3 +32,81 @@ def test_get_session(face_encoder_db: FaceEncoderDB):
     """
     with face_encoder_db.get_session() as session:
         assert session is not None
+
+
+LEGACY_SCHEMA = """
+CREATE TABLE sessions (
+    id INTEGER PRIMARY KEY,
+    session_id VARCHAR NOT NULL,
+    face_encoding JSON,
+    created_at DATETIME NOT NULL
+);
+CREATE INDEX ix_sessions_session_id ON sessions (session_id);
+CREATE TABLE user_sessions (
+    session_id VARCHAR NOT NULL PRIMARY KEY,
+    user_id VARCHAR NOT NULL,
+    created_at DATETIME NOT NULL,
+    closed_at DATETIME
+);
+CREATE INDEX ix_user_sessions_user_id ON user_sessions (user_id);
+"""
+
+
+def build_database(path: str, schema: str = "") -> FaceEncoderDB:
+    """Build a SQLite database, with the tables of an older version
+
+    Args:
+        path (str): Database file.
+        schema (str, optional): SQL script run first. Defaults to "".
+
+    Returns:
+        FaceEncoderDB: The database, its tables created
+    """
+    if schema:
+        with sqlite3.connect(path) as connection:
+            connection.executescript(schema)
+    database = FaceEncoderDB(backend=SQLiteBackend(f"sqlite:///{path}"))
+    database.create_db_and_tables()
+    return database
+
+
+def test_upgrade_schema(tmp_path: Any):
+    """Test that the missing columns and indexes are added to older tables
+
+    Args:
+        tmp_path (Any): Temporary directory of the test.
+    """
+    database = build_database(
+        str(tmp_path / "face_encoder.db"),
+        LEGACY_SCHEMA.replace(
+            "VARCHAR NOT NULL PRIMARY", "BLOB NOT NULL PRIMARY"
+        ).replace("session_id VARCHAR", "session_id BLOB"),
+    )
+
+    statements = database.upgrade_schema()
+
+    assert len(statements) == 7
+    assert database.upgrade_schema() == []
+    assert database.check_schema() == 2
+    columns = {c["name"] for c in inspect(database.engine).get_columns("sessions")}
+    assert {"encoder_model", "image_hash", "pending_face_encoding"} <= columns
+    database.close()
+
+
+def test_check_schema(tmp_path: Any):
+    """Test that the session IDs stored as text are reported
+
+    Args:
+        tmp_path (Any): Temporary directory of the test.
+    """
+    database = build_database(str(tmp_path / "face_encoder.db"), LEGACY_SCHEMA)
+    database.upgrade_schema()
+
+    with pytest.raises(SchemaMismatchError, match="sessions.session_id"):
+        database.check_schema()
+    database.close()
+
+    database = build_database(str(tmp_path / "new.db"))
+    assert database.upgrade_schema() == []
+    assert database.check_schema() == 2
+    database.close()
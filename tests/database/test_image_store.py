@@ -0,0 +1,136 @@
+import os
+from typing import Any
+
+import pytest
+
+from benchmarks.fake_s3 import FakeS3Client
+from database.image_store import (
+    ImageCache,
+    ImageStore,
+    ImageStoreConfig,
+    LocalImageStore,
+    S3ImageStore,
+    TieredImageStore,
+    build_image_store,
+    image_hash,
+    is_image_hash,
+)
+
+
+def test_put_and_get(tmp_path: Any) -> None:
+    """Test that images are stored once under their hash"""
+    store = LocalImageStore(str(tmp_path))
+    digest = store.put(b"image")
+
+    assert digest == image_hash(b"image")
+    assert store.put(b"image") == digest
+    assert store.get(digest) == b"image"
+    assert store.exists(digest)
+    assert store.path_for(digest) == os.path.join(
+        str(tmp_path), digest[:2], digest[2:4], digest
+    )
+    assert store.get(image_hash(b"other")) is None
+    assert not any(
+        name.startswith(".tmp-") for _, _, names in os.walk(tmp_path) for name in names
+    )
+
+
+def test_incomplete_store_cannot_be_instantiated() -> None:
+    """Test that a store missing a required method fails on instantiation"""
+
+    class IncompleteStore(ImageStore):
+        """Store without exists"""
+
+        def put(self, contents: bytes) -> str:
+            return image_hash(contents)
+
+        def get(self, digest: str) -> None:
+            return None
+
+    with pytest.raises(TypeError, match="exists"):
+        IncompleteStore()
+
+
+def test_build_image_store(monkeypatch: Any, tmp_path: Any) -> None:
+    """Test that images are only retained when a path is configured"""
+    monkeypatch.delenv("IMAGE_STORE_BACKEND", raising=False)
+    monkeypatch.delenv("IMAGE_STORE_PATH", raising=False)
+    assert build_image_store(ImageStoreConfig()) is None
+
+    monkeypatch.setenv("IMAGE_STORE_PATH", str(tmp_path))
+    assert build_image_store(ImageStoreConfig()).root == str(tmp_path)
+
+
+def test_path_for_rejects_invalid_hashes(tmp_path: Any) -> None:
+    """Test that only image hashes are mapped to paths"""
+    store = LocalImageStore(str(tmp_path))
+
+    with pytest.raises(ValueError):
+        store.path_for("../" + "0" * 61)
+    assert not is_image_hash("A" * 64)
+    assert is_image_hash(image_hash(b"image"))
+
+
+def test_s3_store() -> None:
+    """Test the s3 store against the fake S3 client"""
+    client = FakeS3Client()
+    store = S3ImageStore(client, "bucket", prefix="images/")
+    digest = store.put(b"image")
+
+    assert ("bucket", f"images/{digest[:2]}/{digest[2:4]}/{digest}") in client.objects
+    assert store.get(digest) == b"image"
+    assert store.exists(digest)
+    assert store.local_path(digest) is None
+    assert store.get(image_hash(b"other")) is None
+    assert not store.exists(image_hash(b"other"))
+
+    requests = client.requests
+    store.put(b"image")
+    assert client.requests == requests + 1
+
+
+def test_tiered_store(tmp_path: Any) -> None:
+    """Test that the local tier is written through and filled on reads"""
+    remote = S3ImageStore(FakeS3Client(), "bucket")
+    local = LocalImageStore(str(tmp_path))
+    store = TieredImageStore(remote, local)
+
+    digest = store.put(b"image")
+    assert remote.exists(digest) and local.exists(digest)
+
+    os.remove(local.path_for(digest))
+    assert store.local_path(digest) == local.path_for(digest)
+    assert local.get(digest) == b"image"
+
+    os.remove(local.path_for(digest))
+    assert store.get(digest) == b"image"
+    assert local.exists(digest)
+    assert store.local_path(image_hash(b"other")) is None
+
+
+def test_image_cache_evicts_least_recently_used() -> None:
+    """Test that the cache stays under its size in bytes"""
+    cache = ImageCache(max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+
+    cache.put("c", b"1234")
+    cache.put("large", b"12345678901")
+
+    assert cache.get("b") is None
+    assert cache.get("large") is None
+    assert cache.metrics() == {"images": 2, "bytes": 8, "hits": 1, "misses": 2}
+
+
+def test_build_s3_image_store(monkeypatch: Any) -> None:
+    """Test that the s3 image store requires a bucket"""
+    monkeypatch.setenv("IMAGE_STORE_BACKEND", "s3")
+    monkeypatch.delenv("IMAGE_STORE_S3_BUCKET", raising=False)
+
+    with pytest.raises(ValueError):
+        build_image_store(ImageStoreConfig())
+
+    monkeypatch.setenv("IMAGE_STORE_BACKEND", "ftp")
+    with pytest.raises(ValueError):
+        build_image_store(ImageStoreConfig())
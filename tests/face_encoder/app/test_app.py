@@ -0,0 +1,410 @@
+import importlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.bench_ingest import free_port
+from benchmarks.fake_face_encoding import build_app
+from benchmarks.fake_s3 import FakeS3Client
+from database.backends import SQLiteBackend
+from database.image_store import (
+    ImageCache,
+    LocalImageStore,
+    S3ImageStore,
+    TieredImageStore,
+    image_hash,
+)
+from tests.database.test_database import LEGACY_SCHEMA
+
+
+@pytest.fixture(name="app_module")
+def fixture_app_module(monkeypatch: pytest.MonkeyPatch, tmp_path: Any) -> Any:
+    """Fixture for importing the app on a SQLite database, with the
+    face-encoding service down."""
+    monkeypatch.setenv("DB_BACKEND", "sqlite")
+    monkeypatch.setenv("DB_PATH", str(tmp_path / "face_encoder.db"))
+    monkeypatch.setenv("DB_ECHO", "false")
+    monkeypatch.setenv("RATE_LIMIT_ENABLED", "false")
+    monkeypatch.setenv("FACE_ENCODING_HOST", "127.0.0.1")
+    monkeypatch.setenv("FACE_ENCODING_PORT", str(free_port()))
+    monkeypatch.setenv("WARMUP_TIMEOUT", "1")
+    monkeypatch.setenv("IMAGE_STORE_PATH", str(tmp_path / "images"))
+    # The face-encoding address is read on import.
+    importlib.reload(importlib.import_module("utils.helpers.api_utils"))
+    return importlib.reload(importlib.import_module("face_encoder.app.app"))
+
+
+@pytest.fixture(name="encoder")
+def fixture_encoder(app_module: Any, monkeypatch: pytest.MonkeyPatch) -> Any:
+    """Fixture for serving the face-encoding requests of the app with the fake
+    face-encoding app, counting its requests in ``encoder.state.requests``."""
+    encoder = build_app(latency_ms=200)
+    monkeypatch.setattr(
+        app_module,
+        "build_face_encoding_client",
+        lambda _config: httpx.AsyncClient(transport=httpx.ASGITransport(app=encoder)),
+    )
+    return encoder
+
+
+def wait_until_ready(client: TestClient, timeout: float = 10.0) -> Any:
+    """Poll /ready until the warm-up finished
+
+    Args:
+        client (TestClient): Client of the app.
+        timeout (float, optional): Maximum wait in seconds. Defaults to 10.0.
+
+    Returns:
+        Any: The last /ready response
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get("/ready")
+        if response.json()["finished"] or time.monotonic() > deadline:
+            return response
+        time.sleep(0.01)
+
+
+def test_import_does_not_touch_the_database(app_module: Any, tmp_path: Any):
+    """Test that the schema is created by the lifespan, not on import"""
+    database = tmp_path / "face_encoder.db"
+    assert (
+        not database.exists()
+        or not sqlite3.connect(database)
+        .execute("SELECT name FROM sqlite_master")
+        .fetchall()
+    )
+
+    with TestClient(app_module.app):
+        tables = sqlite3.connect(database).execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )
+        assert {"sessions", "user_sessions"} <= {name for (name,) in tables}
+
+
+def test_live_and_ready(app_module: Any):
+    """Test the probes: live at once, ready after the warm-up even with the
+    face-encoding service down"""
+    with TestClient(app_module.app) as client:
+        assert client.get("/live").status_code == 200
+
+        response = wait_until_ready(client)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["ready"]
+    assert body["steps"]["schema"]["result"] == 2
+    assert body["steps"]["database"]["status"] == "ok"
+    assert body["steps"]["database"]["result"] == 4
+    assert body["steps"]["face_encoding"]["status"] == "failed"
+    assert app_module.app.state.encoder_client.is_closed
+
+
+def test_outdated_schema_is_not_ready(app_module: Any, tmp_path: Any):
+    """Test that the missing columns are added on startup, and that session IDs
+    stored as text keep the service not ready"""
+    with sqlite3.connect(tmp_path / "face_encoder.db") as connection:
+        connection.executescript(LEGACY_SCHEMA)
+
+    with TestClient(app_module.app) as client:
+        response = wait_until_ready(client)
+        columns = sqlite3.connect(tmp_path / "face_encoder.db").execute(
+            "SELECT name FROM pragma_table_info('sessions')"
+        )
+
+    assert response.status_code == 503
+    assert response.json()["steps"]["schema"]["status"] == "failed"
+    assert "session_id is stored as text" in response.json()["steps"]["schema"]["error"]
+    assert "image_hash" in {name for (name,) in columns}
+
+
+def test_ready_once_the_database_is_reachable(
+    app_module: Any, monkeypatch: pytest.MonkeyPatch, tmp_path: Any
+):
+    """Test that the failed warm-up steps are retried, so that the service gets
+    ready when the database becomes reachable after the startup"""
+    database = tmp_path / "later" / "face_encoder.db"
+    monkeypatch.setenv("DB_PATH", str(database))
+    monkeypatch.setenv("DB_CREATE_TABLES", "false")
+    monkeypatch.setenv("WARMUP_RETRY_INTERVAL", "0.05")
+    monkeypatch.setenv("WARMUP_RETRY_MAX_INTERVAL", "0.1")
+    app_module = importlib.reload(app_module)
+
+    with TestClient(app_module.app) as client:
+        unreachable = wait_until_ready(client)
+        database.parent.mkdir()
+        crud = app_module.FaceEncoderCRUD(
+            backend=SQLiteBackend(f"sqlite:///{database}")
+        )
+        crud.create_db_and_tables()
+        crud.close()
+        deadline = time.monotonic() + 10.0
+        while client.get("/ready").status_code != 200:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        ready = client.get("/ready").json()
+
+    assert unreachable.status_code == 503
+    assert unreachable.json()["steps"]["schema"]["status"] == "failed"
+    assert ready["steps"]["schema"]["status"] == "ok"
+    assert ready["steps"]["database"]["status"] == "ok"
+
+
+def test_restart_keeps_the_sessions(app_module: Any):
+    """Test that the tables are not dropped when the app starts again"""
+    with TestClient(app_module.app) as client:
+        session_id = client.post("/start_session", params={"user_id": "user"}).json()[
+            "session_id"
+        ]
+
+    with TestClient(app_module.app):
+        assert app_module.db_crud.check_if_session_exists(uuid.UUID(session_id))
+
+
+def test_get_image(app_module: Any):
+    """Test that the images are only served to their session, from the cache or
+    from the file when too large for the cache"""
+    with TestClient(app_module.app) as client:
+        session_id = client.post("/start_session", params={"user_id": "user"}).json()[
+            "session_id"
+        ]
+        small = app_module.image_store.put(b"image")
+        large = app_module.image_store.put(b"large image")
+        for digest in (small, large):
+            app_module.db_crud.add_session(
+                uuid.UUID(session_id), {"dtype": "none", "data": [[1.0]]}, digest
+            )
+        app_module.image_cache.max_image_bytes = len(b"image")
+
+        responses = [
+            client.get(f"/images/{digest}", params={"session_id": session_id})
+            for digest in (small, small, large)
+        ]
+        other_session = client.get(
+            f"/images/{small}", params={"session_id": uuid.uuid4().hex}
+        )
+        invalid = client.get("/images/" + "g" * 64, params={"session_id": session_id})
+
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert [response.content for response in responses] == [
+        b"image",
+        b"image",
+        b"large image",
+    ]
+    assert "immutable" in responses[0].headers["cache-control"]
+    assert app_module.image_cache.metrics() == {
+        "images": 1,
+        "bytes": len(b"image"),
+        "hits": 1,
+        "misses": 2,
+    }
+    assert other_session.status_code == 404
+    assert invalid.status_code == 400
+
+
+def test_upload_too_large(app_module: Any, monkeypatch: pytest.MonkeyPatch):
+    """Test that a file over the size limit is rejected before it is read"""
+    monkeypatch.setattr(app_module, "MAX_FILE_SIZE", 1000)
+    with TestClient(app_module.app) as client:
+        session_id = client.post("/start_session", params={"user_id": "user"}).json()[
+            "session_id"
+        ]
+        response = client.post(
+            "/upload",
+            params={"session_id": session_id},
+            files={"file": b"x" * 1001},
+        )
+
+    assert response.status_code == 400
+    assert "too large" in response.json()["message"]
+
+
+def test_start_session_idempotency_key(app_module: Any, tmp_path: Any):
+    """Test that a retry of /start_session gets the session of the first request"""
+    with TestClient(app_module.app) as client:
+        responses = [
+            client.post(
+                "/start_session",
+                params={"user_id": "user"},
+                headers={"Idempotency-Key": "key"},
+            )
+            for _ in range(2)
+        ]
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].json() == responses[1].json()
+    assert "Idempotent-Replayed" not in responses[0].headers
+    assert responses[1].headers["Idempotent-Replayed"] == "true"
+    rows = sqlite3.connect(tmp_path / "face_encoder.db").execute(
+        "SELECT count(*) FROM user_sessions"
+    )
+    assert rows.fetchone() == (1,)
+
+
+def test_upload_idempotency_key(app_module: Any, encoder: Any):
+    """Test that a retry of /upload is replayed without encoding and storing the
+    image again"""
+    with TestClient(app_module.app) as client:
+        wait_until_ready(client)
+        session_id = client.post("/start_session", params={"user_id": "user"}).json()[
+            "session_id"
+        ]
+        responses = [
+            client.post(
+                "/upload",
+                params={"session_id": session_id},
+                files={"file": b"image"},
+                headers={"Idempotency-Key": "key"},
+            )
+            for _ in range(2)
+        ]
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].content == responses[1].content
+    assert "Idempotent-Replayed" not in responses[0].headers
+    assert responses[1].headers["Idempotent-Replayed"] == "true"
+    assert encoder.state.requests == 1
+    assert app_module.db_crud.get_session_count(uuid.UUID(session_id)) == 1
+
+
+def test_concurrent_duplicate_upload(app_module: Any, encoder: Any):
+    """Test that a duplicate /upload sent while the first one is in flight waits
+    on the same request"""
+    with TestClient(app_module.app) as client:
+        wait_until_ready(client)
+        session_id = client.post("/start_session", params={"user_id": "user"}).json()[
+            "session_id"
+        ]
+
+        def send(_: int) -> Any:
+            return client.post(
+                "/upload",
+                params={"session_id": session_id},
+                files={"file": b"image"},
+                headers={"Idempotency-Key": "key"},
+            )
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            responses = list(executor.map(send, range(2)))
+        metrics = client.get("/metrics/idempotency").json()
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].content == responses[1].content
+    assert [
+        response.headers.get("Idempotent-Replayed") for response in responses
+    ].count("true") == 1
+    assert encoder.state.requests == 1
+    assert metrics["endpoints"]["upload"]["joined"] == 1
+    assert app_module.db_crud.get_session_count(uuid.UUID(session_id)) == 1
+
+
+def test_concurrent_uploads_share_commits(app_module: Any, encoder: Any):
+    """Test that the writes of concurrent /upload requests are committed
+    together by the writer thread instead of blocking the event loop"""
+    # Below the default executor size, which is at least 5 threads.
+    uploads = 4
+    with TestClient(app_module.app) as client:
+        wait_until_ready(client)
+        session_ids = [
+            client.post("/start_session", params={"user_id": f"user-{i}"}).json()[
+                "session_id"
+            ]
+            for i in range(uploads)
+        ]
+        writer = app_module.db_crud.backend._writer
+        commits, writes = writer.commits, writer.writes
+
+        # Hold the writer thread until every upload has queued its write.
+        gate = threading.Event()
+        blocker = writer.submit(lambda _session: gate.wait(30))
+
+        def send(i: int) -> Any:
+            return client.post(
+                "/upload",
+                params={"session_id": session_ids[i]},
+                files={"file": f"image-{i}".encode()},
+            )
+
+        with ThreadPoolExecutor(max_workers=uploads) as executor:
+            futures = [executor.submit(send, i) for i in range(uploads)]
+            deadline = time.monotonic() + 10
+            while writer._queue.qsize() < uploads and time.monotonic() < deadline:
+                time.sleep(0.01)
+            queued = writer._queue.qsize()
+            gate.set()
+            responses = [future.result() for future in futures]
+
+    assert blocker.result() is True
+    assert queued == uploads
+    assert [response.status_code for response in responses] == [200] * uploads
+    assert writer.writes - writes == uploads + 1
+    assert writer.commits - commits == 2
+
+
+def upload_image(client: TestClient, contents: bytes) -> str:
+    """Start a session and upload an image in it
+
+    Args:
+        client (TestClient): Client of the app.
+        contents (bytes): The image.
+
+    Returns:
+        str: The session ID
+    """
+    wait_until_ready(client)
+    session_id = client.post("/start_session", params={"user_id": "user"}).json()[
+        "session_id"
+    ]
+    response = client.post(
+        "/upload", params={"session_id": session_id}, files={"file": contents}
+    )
+    assert response.status_code == 200
+    return session_id
+
+
+def test_uploaded_image_is_served(app_module: Any, encoder: Any):
+    """Test that an upload stores its image and its hash, and that the image is
+    served back to its session"""
+    digest = image_hash(b"image")
+    with TestClient(app_module.app) as client:
+        session_id = upload_image(client, b"image")
+        response = client.get(f"/images/{digest}", params={"session_id": session_id})
+
+    assert encoder.state.requests == 1
+    assert app_module.db_crud.has_session_image(uuid.UUID(session_id), digest)
+    assert app_module.image_store.get(digest) == b"image"
+    assert response.status_code == 200
+    assert response.content == b"image"
+
+
+def test_image_is_read_from_s3_on_a_local_miss(
+    app_module: Any, encoder: Any, monkeypatch: pytest.MonkeyPatch, tmp_path: Any
+):
+    """Test that an image missing from the local tier is read from S3 and
+    written back to the local tier"""
+    s3 = FakeS3Client()
+    remote = S3ImageStore(s3, "images")
+    local = LocalImageStore(str(tmp_path / "tier"))
+    monkeypatch.setattr(app_module, "image_store", TieredImageStore(remote, local))
+    digest = image_hash(b"image")
+    with TestClient(app_module.app) as client:
+        session_id = upload_image(client, b"image")
+        assert ("images", remote.key_for(digest)) in s3.objects
+        # As on a new instance: the cache and the local tier are empty.
+        os.remove(local.path_for(digest))
+        monkeypatch.setattr(app_module, "image_cache", ImageCache(1 << 20))
+        requests = s3.requests
+        response = client.get(f"/images/{digest}", params={"session_id": session_id})
+
+    assert response.status_code == 200
+    assert response.content == b"image"
+    assert s3.requests == requests + 1
+    assert local.get(digest) == b"image"
@@ -0,0 +1,241 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from face_encoder.app.middleware import ProfilingMiddleware, RateLimitMiddleware
+from utils.helpers.profiling_utils import ProfilingConfig, span
+from utils.helpers.rate_limit_utils import InMemoryRateLimitStore, RateLimitConfig
+from utils.helpers.session_utils import uuid7
+
+
+@pytest.fixture(name="rate_limit_config")
+def fixture_rate_limit_config() -> RateLimitConfig:
+    """Fixture for creating a restrictive rate limit configuration."""
+    config = RateLimitConfig()
+    config.user_rate = 0.001
+    config.user_burst = 2
+    config.ip_rate = 0.001
+    config.ip_burst = 100
+    config.max_concurrent_uploads = 1
+    return config
+
+
+def build_app(config: RateLimitConfig, resolve_user=None) -> FastAPI:
+    """Build a FastAPI app with the rate limit middleware
+
+    Args:
+        config (RateLimitConfig): Rate limit configuration.
+        resolve_user (optional): Gets the user of a session. Defaults to None.
+
+    Returns:
+        FastAPI: The application
+    """
+    app = FastAPI()
+    app.add_middleware(
+        RateLimitMiddleware,
+        store=InMemoryRateLimitStore(),
+        config=config,
+        resolve_user=resolve_user,
+    )
+
+    @app.post("/start_session")
+    async def start_session(user_id: str):
+        return {"user_id": user_id}
+
+    @app.post("/upload")
+    async def upload(session_id: str):
+        await asyncio.sleep(0.2)
+        return {"session_id": session_id}
+
+    @app.get("/ping")
+    async def ping():
+        return {"status": 200}
+
+    return app
+
+
+def test_user_rate_limit(rate_limit_config: RateLimitConfig):
+    """Test the per-user token bucket of the RateLimitMiddleware
+
+    Args:
+        rate_limit_config (RateLimitConfig): Rate limit configuration
+    """
+    client = TestClient(build_app(rate_limit_config))
+
+    codes = [
+        client.post("/start_session", params={"user_id": "user"}).status_code
+        for _ in range(3)
+    ]
+    response = client.post("/start_session", params={"user_id": "other"})
+
+    assert codes == [200, 200, 429]
+    assert response.status_code == 200
+
+
+def test_rate_limited_response_has_retry_after(rate_limit_config: RateLimitConfig):
+    """Test the 429 response of the RateLimitMiddleware
+
+    Args:
+        rate_limit_config (RateLimitConfig): Rate limit configuration
+    """
+    client = TestClient(build_app(rate_limit_config))
+    for _ in range(2):
+        client.post("/start_session", params={"user_id": "user"})
+
+    response = client.post("/start_session", params={"user_id": "user"})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert "message" in response.json()
+
+
+def test_unlimited_paths_are_not_counted(rate_limit_config: RateLimitConfig):
+    """Test that paths outside of the limited ones are not rate limited
+
+    Args:
+        rate_limit_config (RateLimitConfig): Rate limit configuration
+    """
+    client = TestClient(build_app(rate_limit_config))
+
+    assert all(client.get("/ping").status_code == 200 for _ in range(10))
+
+
+def test_concurrent_uploads_per_session(rate_limit_config: RateLimitConfig):
+    """Test the cap of concurrent uploads per session
+
+    Args:
+        rate_limit_config (RateLimitConfig): Rate limit configuration
+    """
+    rate_limit_config.user_burst = 100
+    app = build_app(rate_limit_config)
+
+    async def upload_twice():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await asyncio.gather(
+                client.post("/upload", params={"session_id": "s"}),
+                client.post("/upload", params={"session_id": "s"}),
+            )
+
+    responses = asyncio.run(upload_twice())
+
+    assert sorted(r.status_code for r in responses) == [200, 429]
+
+
+def test_user_rate_limit_across_sessions(rate_limit_config: RateLimitConfig):
+    """Test that the uploads of a user share one bucket whatever the session
+
+    Args:
+        rate_limit_config (RateLimitConfig): Rate limit configuration
+    """
+    sessions = {uuid7().hex: "user" for _ in range(3)}
+    other_session = uuid7().hex
+    sessions[other_session] = "other"
+    lookups = []
+
+    async def resolve_user(session_id: str):
+        lookups.append(session_id)
+        return sessions.get(session_id)
+
+    client = TestClient(build_app(rate_limit_config, resolve_user))
+    user_sessions = [s for s, user in sessions.items() if user == "user"]
+    statuses = [
+        client.post("/upload", params={"session_id": session_id}).status_code
+        for session_id in user_sessions + user_sessions[:1]
+    ]
+    other = client.post("/upload", params={"session_id": other_session})
+
+    assert statuses == [200, 200, 429, 429]
+    assert other.status_code == 200
+    assert sorted(lookups) == sorted(sessions)
+
+
+def build_profiled_app(sample_rate: float) -> FastAPI:
+    """Build a FastAPI app with the profiling middleware
+
+    Args:
+        sample_rate (float): Fraction of the requests traced.
+
+    Returns:
+        FastAPI: The application
+    """
+    config = ProfilingConfig()
+    config.sample_rate = sample_rate
+    config.slow_request_ms = 0
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, config=config)
+
+    @app.post("/upload")
+    async def upload():
+        with span("face_encoding"):
+            await asyncio.sleep(0.01)
+        with span("crud.add_session"):
+            pass
+        return {"status": 200}
+
+    return app
+
+
+def test_sampled_requests_get_server_timing(caplog: pytest.LogCaptureFixture):
+    """Test the Server-Timing header and slow request log of traced requests
+
+    Args:
+        caplog (pytest.LogCaptureFixture): Captured logs
+    """
+    client = TestClient(build_profiled_app(sample_rate=1.0))
+
+    response = client.post("/upload")
+
+    metrics = dict(
+        metric.split(";dur=")
+        for metric in response.headers["Server-Timing"].split(", ")
+    )
+    assert list(metrics) == ["face_encoding", "crud.add_session", "total"]
+    assert float(metrics["face_encoding"]) >= 10
+    assert "Slow request POST /upload" in caplog.text
+    assert "face_encoding" in caplog.text
+
+
+def test_unsampled_requests_are_not_traced():
+    """Test that requests outside of the sample have no span breakdown"""
+    client = TestClient(build_profiled_app(sample_rate=0.0))
+
+    response = client.post("/upload")
+
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+
+
+def test_session_id_spellings_share_the_upload_limit(
+    rate_limit_config: RateLimitConfig,
+):
+    """Test that the spellings of a session ID accepted by the app are limited as
+    the same session
+
+    Args:
+        rate_limit_config (RateLimitConfig): Rate limit configuration
+    """
+    rate_limit_config.user_burst = 100
+    app = build_app(rate_limit_config)
+    session_id = uuid7()
+
+    async def upload_twice():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await asyncio.gather(
+                client.post("/upload", params={"session_id": session_id.hex}),
+                client.post(
+                    "/upload", params={"session_id": f"{{{str(session_id).upper()}}}"}
+                ),
+            )
+
+    responses = asyncio.run(upload_twice())
+
+    assert sorted(r.status_code for r in responses) == [200, 429]
@@ -0,0 +1,152 @@
+import asyncio
+from typing import Any
+
+import httpx
+import pytest
+
+from benchmarks.fake_face_encoding import build_app
+from database.backends import SQLiteBackend
+from database.crud import FaceEncoderCRUD
+from face_encoder.ingest import (
+    IngestCheckpoint,
+    IngestItem,
+    Ingestor,
+    discover_images,
+)
+from utils.helpers.session_utils import uuid7
+
+
+@pytest.fixture(name="corpus")
+def fixture_corpus(tmp_path: Any) -> Any:
+    """Fixture for creating a corpus of 3 users with 4 images each."""
+    root = tmp_path / "images"
+    for user in range(3):
+        (root / f"user-{user}").mkdir(parents=True)
+        for image in range(4):
+            (root / f"user-{user}" / f"{image}.jpg").write_bytes(
+                f"image-{user}-{image}".encode()
+            )
+    (root / "user-0" / "notes.txt").write_text("not an image")
+    return root
+
+
+@pytest.fixture(name="crud")
+def fixture_crud(tmp_path: Any) -> FaceEncoderCRUD:
+    """Fixture for creating a FaceEncoderCRUD instance on SQLite."""
+    crud = FaceEncoderCRUD(
+        backend=SQLiteBackend(f"sqlite:///{tmp_path / 'face_encoder.db'}")
+    )
+    crud.create_db_and_tables()
+    yield crud
+    crud.close()
+
+
+def ingest(crud: FaceEncoderCRUD, items, checkpoint_path: str, app) -> Any:
+    """Ingest images against a fake face-encoding app
+
+    Args:
+        crud (FaceEncoderCRUD): FaceEncoderCRUD instance.
+        items: The images.
+        checkpoint_path (str): Checkpoint file.
+        app: Fake face-encoding app.
+
+    Returns:
+        Any: The statistics of the run
+    """
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await ingestor.run(items, client=client)
+
+    checkpoint = IngestCheckpoint(checkpoint_path)
+    ingestor = Ingestor(crud, checkpoint, workers=1, concurrency=4, retries=0)
+    try:
+        return asyncio.run(run())
+    finally:
+        checkpoint.close()
+
+
+def test_discover_images(corpus: Any, tmp_path: Any):
+    """Test the listing of the images of a directory and of a manifest"""
+    items = discover_images(str(corpus))
+
+    assert len(items) == 12
+    assert {item.user_id for item in items} == {"user-0", "user-1", "user-2"}
+
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("path,user_id\nimages/user-1/0.jpg,someone\n")
+    (item,) = discover_images(str(manifest))
+    assert item.path == str(corpus / "user-1" / "0.jpg")
+    assert item.user_id == "someone"
+
+
+def test_ingest_stores_one_session_per_user(
+    corpus: Any, crud: FaceEncoderCRUD, tmp_path: Any
+):
+    """Test the ingest of a directory in bulk"""
+    app = build_app()
+    stats = ingest(crud, discover_images(str(corpus)), tmp_path / "ckpt", app)
+
+    assert (stats.stored, stats.rejected, stats.failed) == (12, 0, 0)
+    assert app.state.requests == 12
+    for user in range(3):
+        (user_session,) = crud.get_user_session(f"user-{user}")
+        assert crud.get_session_count(user_session.session_id) == 4
+
+
+def test_ingest_resumes_from_checkpoint(
+    corpus: Any, crud: FaceEncoderCRUD, tmp_path: Any
+):
+    """Test that a second run only retries the images that failed"""
+    items = discover_images(str(corpus))
+    checkpoint_path = tmp_path / "ckpt"
+
+    failing = build_app(error_rate=0.5)
+    first = ingest(crud, items, checkpoint_path, failing)
+    assert first.failed > 0
+    assert first.stored + first.failed == 12
+
+    app = build_app()
+    second = ingest(crud, items, checkpoint_path, app)
+
+    assert second.skipped == first.stored
+    assert second.stored == first.failed
+    assert app.state.requests == first.failed
+    assert len(crud.get_user_session("user-0")) == 1
+    total = sum(
+        crud.get_session_count(crud.get_user_session(f"user-{user}")[0].session_id)
+        for user in range(3)
+    )
+    assert total == 12
+
+
+def test_unreadable_images_are_retried(crud: FaceEncoderCRUD, tmp_path: Any):
+    """Test that an image that cannot be read is retried on resume, while an
+    invalid one is rejected"""
+    missing = tmp_path / "missing.jpg"
+    empty = tmp_path / "empty.jpg"
+    empty.write_bytes(b"")
+    items = [IngestItem(str(missing), "user"), IngestItem(str(empty), "user")]
+    checkpoint_path = tmp_path / "ckpt"
+
+    first = ingest(crud, items, checkpoint_path, build_app())
+    assert (first.stored, first.rejected, first.failed) == (0, 1, 1)
+
+    missing.write_bytes(b"image")
+    second = ingest(crud, items, checkpoint_path, build_app())
+
+    assert (second.stored, second.rejected, second.failed) == (1, 0, 0)
+    assert second.skipped == 1
+
+
+def test_ingest_closes_the_opened_sessions(
+    corpus: Any, crud: FaceEncoderCRUD, tmp_path: Any
+):
+    """Test that the session created for a user closes the ones opened before"""
+    crud.add_user_session(session_id=uuid7(), user_id="user-0")
+    ingest(crud, discover_images(str(corpus)), tmp_path / "ckpt", build_app())
+
+    (opened,) = crud.get_user_oppened_sessions("user-0")
+    assert len(crud.get_user_session("user-0")) == 2
+    assert crud.get_session_count(opened.session_id) == 4
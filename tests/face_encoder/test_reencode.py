@@ -0,0 +1,113 @@
+import asyncio
+import os
+import time
+from typing import Any
+
+import httpx
+import pytest
+
+from benchmarks.fake_face_encoding import build_app
+from database.backends import SQLiteBackend
+from database.crud import FaceEncoderCRUD
+from database.image_store import LocalImageStore
+from face_encoder.reencode import Reencoder
+from utils.helpers.embedding_utils import EmbeddingConfig
+from utils.helpers.session_utils import uuid7
+
+SESSION = uuid7()
+
+
+@pytest.fixture(name="image_store")
+def fixture_image_store(tmp_path: Any) -> LocalImageStore:
+    """Fixture for creating an image store."""
+    return LocalImageStore(str(tmp_path / "images"))
+
+
+@pytest.fixture(name="crud")
+def fixture_crud(tmp_path: Any, image_store: LocalImageStore) -> FaceEncoderCRUD:
+    """Fixture for creating a database of 6 uploads encoded by version 1."""
+    crud = FaceEncoderCRUD(
+        backend=SQLiteBackend(f"sqlite:///{tmp_path / 'face_encoder.db'}")
+    )
+    crud.create_db_and_tables()
+    crud.add_user_session(session_id=SESSION, user_id="user")
+    for i in range(6):
+        digest = image_store.put(f"image-{i}".encode())
+        crud.add_session(
+            SESSION, {"dtype": "none", "data": [[1.0]]}, digest, "face-encoding", "1"
+        )
+    yield crud
+    crud.close()
+
+
+def reencode(
+    crud: FaceEncoderCRUD, image_store: LocalImageStore, app, **options
+) -> Any:
+    """Re-encode the stale uploads with version 2 against a fake face-encoding app
+
+    Args:
+        crud (FaceEncoderCRUD): FaceEncoderCRUD instance.
+        image_store (LocalImageStore): The image store.
+        app: Fake face-encoding app.
+
+    Returns:
+        Any: The statistics of the run
+    """
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await reencoder.run(client=client)
+
+    config = EmbeddingConfig()
+    config.encoder_version = "2"
+    options.setdefault("rate", 0)
+    reencoder = Reencoder(crud, image_store, config, batch_size=4, retries=0, **options)
+    return asyncio.run(run())
+
+
+def test_reencode_switches_reads_to_new_version(
+    crud: FaceEncoderCRUD, image_store: LocalImageStore
+):
+    """Test the re-encode of every stale upload, then its promotion"""
+    app = build_app()
+    stats = reencode(crud, image_store, app)
+
+    assert (stats.total, stats.reencoded, stats.failed) == (6, 6, 0)
+    assert app.state.requests == 6
+    summary = crud.get_session_summary(SESSION, "face-encoding", "2")
+    assert summary.encoder_versions == ["face-encoding:2"] * 6
+    assert len(summary.all_face_encodings[0][0]) == 128
+    # The previous version still reads the current encodings.
+    assert crud.get_session_summary(SESSION).encoder_versions == ["face-encoding:1"] * 6
+
+    assert crud.promote_pending_encodings("face-encoding", "2") == 6
+    assert crud.get_session_summary(SESSION).encoder_versions == ["face-encoding:2"] * 6
+
+
+def test_reencode_resumes_and_skips_missing_images(
+    crud: FaceEncoderCRUD, image_store: LocalImageStore
+):
+    """Test that a second run only re-encodes the uploads that failed"""
+    os.remove(image_store.path_for(crud.get_stale_sessions("face-encoding", "2")[0][1]))
+
+    first = reencode(crud, image_store, build_app(error_rate=0.5))
+    assert first.missing_image == 1
+    assert first.reencoded + first.failed == 5
+
+    app = build_app()
+    second = reencode(crud, image_store, app)
+
+    assert second.total == 1 + first.failed
+    assert second.reencoded == first.failed
+    assert app.state.requests == first.failed
+    assert crud.count_stale_sessions("face-encoding", "2") == 1
+
+
+def test_reencode_is_throttled(crud: FaceEncoderCRUD, image_store: LocalImageStore):
+    """Test that the images are sent at the configured rate"""
+    start = time.perf_counter()
+    stats = reencode(crud, image_store, build_app(), rate=20.0, burst=1.0)
+
+    assert stats.reencoded == 6
+    assert time.perf_counter() - start >= 5 / 20.0
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from utils.helpers.embedding_utils import (
+    EmbeddingConfig,
+    decode_face_encodings,
+    dequantize,
+    l2_normalize,
+    postprocess_face_encodings,
+    quantize,
+)
+
+
+@pytest.fixture(name="embedding_config")
+def fixture_embedding_config() -> EmbeddingConfig:
+    """Fixture for creating the default embedding configuration."""
+    return EmbeddingConfig()
+
+
+def random_encodings(faces: int = 1, dimension: int = 128, seed: int = 0):
+    """Build random face encodings
+
+    Args:
+        faces (int, optional): Number of faces. Defaults to 1.
+        dimension (int, optional): Vector dimension. Defaults to 128.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        List[List[float]]: The face encodings
+    """
+    return np.random.default_rng(seed).normal(size=(faces, dimension)).tolist()
+
+
+def test_l2_normalize():
+    """Test case for the l2_normalize function"""
+    normalized, norms = l2_normalize(np.array([[3.0, 4.0], [0.0, 0.0]]))
+
+    assert np.allclose(normalized, [[0.6, 0.8], [0.0, 0.0]])
+    assert np.allclose(norms, [5.0, 0.0])
+
+
+@pytest.mark.parametrize(
+    "level, tolerance",
+    [("none", 0.0), ("float32", 1e-7), ("float16", 1e-3), ("int8", 1e-2)],
+)
+def test_quantize_round_trip(level: str, tolerance: float):
+    """Test case for the quantize and dequantize functions
+
+    Args:
+        level (str): Quantization level
+        tolerance (float): Maximum absolute error
+    """
+    matrix, _ = l2_normalize(np.asarray(random_encodings(faces=3)))
+
+    restored = dequantize(quantize(matrix, level))
+
+    assert restored.shape == matrix.shape
+    assert np.abs(restored - matrix).max() <= tolerance
+
+
+def test_decode_legacy_encodings():
+    """Test case for decoding rows stored as raw encoder output"""
+    assert decode_face_encodings([[0.1, 0.2]]) == [[0.1, 0.2]]
+
+
+def test_postprocess_face_encodings(embedding_config: EmbeddingConfig):
+    """Test case for the postprocess_face_encodings function
+
+    Args:
+        embedding_config (EmbeddingConfig): Embedding configuration
+    """
+    processed = postprocess_face_encodings(random_encodings(), embedding_config)
+
+    assert processed.quality.issues == []
+    assert processed.quality.faces_detected == 1
+    assert processed.quality.is_duplicate is False
+    assert np.allclose(np.linalg.norm(processed.normalized, axis=1), 1.0)
+    assert processed.stored["dtype"] == embedding_config.quantization
+
+
+def test_postprocess_rejects_no_face(embedding_config: EmbeddingConfig):
+    """Test case for the detection of images without faces
+
+    Args:
+        embedding_config (EmbeddingConfig): Embedding configuration
+    """
+    processed = postprocess_face_encodings([], embedding_config)
+
+    assert processed.quality.faces_detected == 0
+    assert len(processed.quality.issues) == 1
+    assert processed.stored is None
+
+
+def test_postprocess_rejects_zero_norm(embedding_config: EmbeddingConfig):
+    """Test case for the norm sanity check
+
+    Args:
+        embedding_config (EmbeddingConfig): Embedding configuration
+    """
+    processed = postprocess_face_encodings([[0.0] * 128], embedding_config)
+
+    assert processed.quality.issues == ["Face encoding norm out of range"]
+
+
+def test_postprocess_detects_near_duplicates(embedding_config: EmbeddingConfig):
+    """Test case for the near-duplicate detection against the session
+
+    Args:
+        embedding_config (EmbeddingConfig): Embedding configuration
+    """
+    first = postprocess_face_encodings(random_encodings(seed=1), embedding_config)
+    other = postprocess_face_encodings(random_encodings(seed=2), embedding_config)
+    retry = np.asarray(random_encodings(seed=1)) * 1.001
+
+    processed = postprocess_face_encodings(
+        retry.tolist(), embedding_config, session_encodings=[other.stored, first.stored]
+    )
+
+    assert processed.quality.is_duplicate is True
+    assert processed.quality.max_session_similarity > 0.99
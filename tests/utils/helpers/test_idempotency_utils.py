@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+
+from utils.helpers.idempotency_utils import (
+    IdempotencyConflictError,
+    IdempotencyStore,
+    IdempotencyStoreFullError,
+    StoredResponse,
+)
+
+
+class FakeClock:
+    """Manually advanced clock"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CountingHandler:
+    """Request handler counting its calls"""
+
+    def __init__(self, status_code: int = 200, delay: float = 0.0) -> None:
+        self.status_code = status_code
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self) -> StoredResponse:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return StoredResponse(self.status_code, f'{{"call": {self.calls}}}'.encode())
+
+
+def test_concurrent_retries_join_the_first_request():
+    """Test case for retries arriving while the first request is in flight"""
+    store = IdempotencyStore()
+    handler = CountingHandler(delay=0.05)
+
+    async def run_all():
+        return await asyncio.gather(
+            *(store.run("upload", "s1:key", "digest", handler) for _ in range(5))
+        )
+
+    results = asyncio.run(run_all())
+
+    assert handler.calls == 1
+    assert {response.body for response, _ in results} == {b'{"call": 1}'}
+    assert [shared for _, shared in results].count(False) == 1
+    assert store.metrics()["upload"]["joined"] == 4
+
+
+def test_completed_request_is_replayed():
+    """Test case for a retry after the first request completed"""
+    store = IdempotencyStore()
+    handler = CountingHandler()
+
+    async def run_twice():
+        first = await store.run("upload", "s1:key", "digest", handler)
+        second = await store.run("upload", "s1:key", "digest", handler)
+        return first, second
+
+    (first, first_shared), (second, second_shared) = asyncio.run(run_twice())
+
+    assert handler.calls == 1
+    assert first.body == second.body
+    assert (first_shared, second_shared) == (False, True)
+    assert store.metrics()["upload"] == {
+        "executed": 1,
+        "replayed": 1,
+        "joined": 0,
+        "conflicts": 0,
+        "saved": 1,
+    }
+
+
+def test_key_reused_for_another_request_conflicts():
+    """Test case for an idempotency key sent with a different request"""
+    store = IdempotencyStore()
+    handler = CountingHandler()
+
+    async def run_conflict():
+        await store.run("upload", "s1:key", "digest", handler)
+        await store.run("upload", "s1:key", "other-digest", handler)
+
+    with pytest.raises(IdempotencyConflictError):
+        asyncio.run(run_conflict())
+    assert handler.calls == 1
+
+
+def test_failed_request_can_be_retried():
+    """Test case for the retry of a request that failed with a 5xx status"""
+    store = IdempotencyStore()
+    failing = CountingHandler(status_code=500)
+    handler = CountingHandler()
+
+    async def run_retry():
+        await store.run("upload", "s1:key", "digest", failing)
+        return await store.run("upload", "s1:key", "digest", handler)
+
+    response, shared = asyncio.run(run_retry())
+
+    assert response.status_code == 200
+    assert shared is False
+    assert (failing.calls, handler.calls) == (1, 1)
+
+
+def test_cancelled_client_does_not_cancel_the_request():
+    """Test case for a client disconnecting while its request is in flight"""
+    store = IdempotencyStore()
+    handler = CountingHandler(delay=0.05)
+
+    async def run_cancelled():
+        first = asyncio.ensure_future(store.run("upload", "s1:key", "digest", handler))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await store.run("upload", "s1:key", "digest", handler)
+
+    response, shared = asyncio.run(run_cancelled())
+
+    assert handler.calls == 1
+    assert response.status_code == 200
+    assert shared is True
+
+
+def test_entries_are_evicted():
+    """Test case for the TTL and capacity bounds of the store"""
+    clock = FakeClock()
+    store = IdempotencyStore(max_keys=2, ttl=10.0, clock=clock)
+    handler = CountingHandler()
+
+    async def run_keys(*keys):
+        for key in keys:
+            await store.run("upload", key, "digest", handler)
+
+    asyncio.run(run_keys("a", "b", "c"))
+    assert len(store) == 2
+
+    clock.now += 11.0
+    asyncio.run(run_keys("a"))
+    assert len(store) == 1
+    assert handler.calls == 4
+
+
+def test_in_flight_entries_are_not_evicted():
+    """Test case for a full store of in-flight requests"""
+    store = IdempotencyStore(max_keys=2)
+    handler = CountingHandler(delay=0.05)
+
+    async def run_full():
+        in_flight = [
+            asyncio.ensure_future(store.run("upload", key, "digest", handler))
+            for key in ("a", "b")
+        ]
+        await asyncio.sleep(0.01)
+        with pytest.raises(IdempotencyStoreFullError):
+            await store.run("upload", "c", "digest", handler)
+        retry = await store.run("upload", "a", "digest", handler)
+        await asyncio.gather(*in_flight)
+        return retry, await store.run("upload", "c", "digest", handler)
+
+    (_, retry_shared), (_, shared) = asyncio.run(run_full())
+
+    assert retry_shared is True
+    assert shared is False
+    assert handler.calls == 3
+    assert len(store) == 2
@@ -0,0 +1,107 @@
+import threading
+import time
+
+from utils.helpers.profiling_utils import (
+    ProfileCapture,
+    ProfilingConfig,
+    StackSampler,
+    Traced,
+    end_trace,
+    span,
+    start_trace,
+)
+
+
+class Store:
+    """Object with one public method"""
+
+    limit = 5
+
+    def get(self, key: str) -> str:
+        return key.upper()
+
+
+def test_spans_are_only_recorded_in_a_trace():
+    """Test case for spans inside and outside of a traced request"""
+    with span("ignored"):
+        pass
+
+    trace, token = start_trace()
+    try:
+        with span("crud.get"):
+            time.sleep(0.01)
+        with span("crud.get"):
+            pass
+        with span("face_encoding"):
+            pass
+    finally:
+        end_trace(token)
+    with span("ignored"):
+        pass
+
+    breakdown = trace.breakdown()
+    assert list(breakdown) == ["crud.get", "face_encoding"]
+    assert breakdown["crud.get"][0] == 2
+    assert breakdown["crud.get"][1] >= 10
+    assert "crud.get" in trace.summary() and "(2 calls)" in trace.summary()
+    assert trace.server_timing().startswith("crud.get;dur=")
+
+
+def test_traced_proxy_records_method_calls():
+    """Test case for the spans of the Traced proxy"""
+    store = Traced(Store(), "store")
+
+    trace, token = start_trace()
+    try:
+        assert store.get("key") == "KEY"
+        assert store.get("key") == "KEY"
+    finally:
+        end_trace(token)
+
+    assert store.limit == 5
+    assert [name for name, _ in trace.spans] == ["store.get", "store.get"]
+
+
+def test_stack_sampler_folds_other_threads():
+    """Test case for the folded stacks of the sampler"""
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_worker, name="busy")
+    worker.start()
+    try:
+        sampler = StackSampler(interval=0.001).run(0.1)
+    finally:
+        stop.set()
+        worker.join()
+
+    assert sampler.samples > 10
+    lines = sampler.folded().splitlines()
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any(
+        line.startswith("busy;") and "busy_worker (test_profiling_utils.py:" in line
+        for line in lines
+    )
+
+
+def test_profile_capture_is_bounded():
+    """Test case for the duration cap and the single running capture"""
+    config = ProfilingConfig()
+    config.max_seconds = 0.05
+    capture = ProfileCapture(config)
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(capture.capture(0.05)))
+    thread.start()
+    time.sleep(0.01)
+    concurrent = capture.capture(0.05)
+    thread.join()
+    start = time.perf_counter()
+    capped = capture.capture(60)
+
+    assert concurrent is None
+    assert results[0] is not None
+    assert capped is not None and time.perf_counter() - start < 1
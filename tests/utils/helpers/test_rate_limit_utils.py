@@ -0,0 +1,180 @@
+import asyncio
+import os
+import uuid
+from typing import Any, Callable
+
+import pytest
+
+from utils.helpers.rate_limit_utils import (
+    ConcurrencyLimiter,
+    InMemoryRateLimitStore,
+    RedisRateLimitStore,
+)
+
+
+class FakeClock:
+    """Manually advanced clock"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_rejects():
+    """Test case for the burst capacity of the in-memory store"""
+    clock = FakeClock()
+    store = InMemoryRateLimitStore(clock=clock)
+
+    results = [asyncio.run(store.consume("user:1", 1.0, 3.0)) for _ in range(4)]
+
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert results[-1][1] == 1.0
+
+
+def test_token_bucket_refills_over_time():
+    """Test case for the refill of the in-memory store"""
+    clock = FakeClock()
+    store = InMemoryRateLimitStore(clock=clock)
+    for _ in range(2):
+        asyncio.run(store.consume("user:1", 2.0, 2.0))
+
+    assert asyncio.run(store.consume("user:1", 2.0, 2.0))[0] is False
+    clock.now += 0.5
+    assert asyncio.run(store.consume("user:1", 2.0, 2.0))[0] is True
+
+
+def test_idle_keys_are_evicted():
+    """Test case for the eviction of idle keys"""
+    clock = FakeClock()
+    store = InMemoryRateLimitStore(idle_ttl=10.0, clock=clock)
+    asyncio.run(store.consume("user:1", 1.0, 1.0))
+    clock.now += 11.0
+    asyncio.run(store.consume("user:2", 1.0, 1.0))
+
+    assert len(store) == 1
+
+
+def test_store_is_bounded_by_max_keys():
+    """Test case for the maximum number of keys of the in-memory store"""
+    store = InMemoryRateLimitStore(max_keys=100, clock=FakeClock())
+    for i in range(1000):
+        asyncio.run(store.consume(f"user:{i}", 1.0, 1.0))
+
+    assert len(store) == 100
+    assert store.overflowed == 900
+
+
+def test_active_keys_are_not_evicted():
+    """Test case for a full store: active buckets are kept, new keys share the
+    overflow bucket"""
+    clock = FakeClock()
+    store = InMemoryRateLimitStore(max_keys=2, idle_ttl=10.0, clock=clock)
+    for key in ("user:1", "user:2"):
+        assert asyncio.run(store.consume(key, 1.0, 1.0))[0] is True
+
+    overflow = [asyncio.run(store.consume(f"user:{i}", 1.0, 1.0)) for i in (3, 4)]
+    busy = asyncio.run(store.consume("user:1", 1.0, 1.0))
+
+    assert [allowed for allowed, _ in overflow] == [True, False]
+    assert busy[0] is False
+    clock.now += 11.0
+    assert asyncio.run(store.consume("user:3", 1.0, 1.0))[0] is True
+    assert len(store) == 1
+
+
+def test_refilled_keys_are_evicted_when_full():
+    """Test case for a store filled by a few clients: once their buckets have
+    refilled, new keys get their own bucket instead of the overflow bucket"""
+    clock = FakeClock()
+    store = InMemoryRateLimitStore(max_keys=40, idle_ttl=600.0, clock=clock)
+    for i in range(40):
+        for _ in range(10):
+            asyncio.run(store.consume(f"user:attacker-{i}", 5.0, 10.0))
+
+    clock.now += 1.0
+    draining = [asyncio.run(store.consume(f"user:{i}", 5.0, 10.0)) for i in range(30)]
+    assert [allowed for allowed, _ in draining].count(True) == 10
+
+    clock.now += 2.0
+    refilled = [asyncio.run(store.consume(f"user:{i}", 5.0, 10.0)) for i in range(30)]
+
+    assert all(allowed for allowed, _ in refilled)
+    assert len(store) == 40
+    assert store.overflowed == 30
+
+
+@pytest.fixture(name="redis_store")
+def fixture_redis_store() -> Callable[[], RedisRateLimitStore]:
+    """Fixture for creating Redis stores, on the server of TEST_REDIS_URL or on
+    fakeredis. The client is created in the event loop of the test."""
+    url = os.getenv("TEST_REDIS_URL")
+    if url:
+        pytest.importorskip("redis")
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        server = fakeredis.FakeServer()
+    prefix = f"test-{uuid.uuid4().hex}:"
+
+    def build() -> RedisRateLimitStore:
+        if url:
+            return RedisRateLimitStore(url, key_prefix=prefix, idle_ttl=60.0)
+        client = fakeredis.FakeAsyncRedis(server=server)
+        return RedisRateLimitStore(key_prefix=prefix, idle_ttl=60.0, client=client)
+
+    return build
+
+
+def test_redis_token_bucket(redis_store: Callable[[], RedisRateLimitStore]):
+    """Test case for the token bucket script of the Redis store: burst, rejection
+    with the wait until the next token, refill and expiry of the keys"""
+
+    async def run() -> Any:
+        store = redis_store()
+        burst = [await store.consume("user:a", 10.0, 2.0) for _ in range(3)]
+        other = await store.consume("user:b", 10.0, 2.0)
+        await asyncio.sleep(0.15)
+        refilled = await store.consume("user:a", 10.0, 2.0)
+        ttl = await store._client.ttl(  # pylint: disable=protected-access
+            store.key_prefix + "user:a"
+        )
+        return burst, other, refilled, ttl
+
+    burst, other, refilled, ttl = asyncio.run(run())
+
+    assert [allowed for allowed, _ in burst] == [True, True, False]
+    assert 0.0 < burst[2][1] <= 0.1
+    assert other == (True, 0.0)
+    assert refilled[0] is True
+    assert 0 < ttl <= 60
+
+
+def test_redis_store_is_shared(redis_store: Callable[[], RedisRateLimitStore]):
+    """Test case for two replicas sharing the buckets of the Redis store"""
+
+    async def run() -> Any:
+        first, second = redis_store(), redis_store()
+        return [
+            await store.consume("ip:1.2.3.4", 0.001, 3.0)
+            for store in (first, second, first, second)
+        ]
+
+    results = asyncio.run(run())
+
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+
+
+def test_concurrency_limiter():
+    """Test case for the ConcurrencyLimiter class"""
+    limiter = ConcurrencyLimiter(limit=2)
+
+    assert limiter.acquire("session") is True
+    assert limiter.acquire("session") is True
+    assert limiter.acquire("session") is False
+    limiter.release("session")
+    assert limiter.acquire("session") is True
+    limiter.release("session")
+    limiter.release("session")
+    assert limiter.active("session") == 0
@@ -1,18 +1,79 @@
-import hashlib
+import os
+import time
+import uuid
 from unittest.mock import patch
 
-from utils.helpers.session_utils import convert_bytes_to_megabytes, generate_unique_id
+import pytest
+
+from utils.helpers.session_utils import (
+    convert_bytes_to_megabytes,
+    decode_session_id,
+    encode_session_id,
+    generate_unique_id,
+    uuid7,
+)
 
 
 def test_generate_unique_id():
     """Test case for the generate_unique_id function"""
-    with patch("utils.helpers.session_utils.time") as mock_time, patch(
-        "utils.helpers.session_utils.uuid"
-    ) as mock_uuid:
-        mock_time.time.return_value = 1234567890.123456
-        mock_uuid.uuid4.return_value = "random_string"
-        expected_id = hashlib.md5("1234567890.123456random_string".encode()).hexdigest()
-        assert generate_unique_id() == expected_id
+    unique_id = generate_unique_id()
+
+    assert len(unique_id) == 32
+    assert uuid.UUID(unique_id).version == 7
+    assert generate_unique_id() != unique_id
+
+
+def test_uuid7_is_time_ordered():
+    """Test case for the timestamp and the ordering of the uuid7 function"""
+    before = time.time_ns() // 1_000_000
+    ids = [uuid7() for _ in range(10000)]
+    after = time.time_ns() // 1_000_000
+    timestamps = [u.int >> 80 for u in ids]
+
+    assert timestamps == sorted(timestamps)
+    assert len(set(ids)) == len(ids)
+    assert before <= timestamps[0] <= timestamps[-1] <= after
+    assert all(u.version == 7 and u.variant == uuid.RFC_4122 for u in ids)
+
+
+def test_uuid7_neighbours_share_only_the_timestamp():
+    """Test case for IDs generated in a row: their bits after the timestamp are
+    unrelated, so that an ID cannot be guessed from another one"""
+    ids = [uuid7() for _ in range(1000)]
+    # The 74 random bits, without the version and variant.
+    random_parts = [
+        f"{(u.int >> 64) & 0xFFF:012b}{u.int & ((1 << 62) - 1):062b}" for u in ids
+    ]
+
+    shared = [
+        len(os.path.commonprefix([first, second]))
+        for first, second in zip(random_parts, random_parts[1:])
+    ]
+    assert max(shared) < 32
+    assert sum(shared) / len(shared) < 2
+
+
+def test_uuid7_timestamp_does_not_go_back_with_the_clock():
+    """Test case for the uuid7 function with a clock going backwards"""
+    first = uuid7()
+    with patch("utils.helpers.session_utils.time") as mock_time:
+        mock_time.time_ns.return_value = 0
+        second = uuid7()
+
+    assert second.int >> 80 >= first.int >> 80
+
+
+def test_encode_and_decode_session_id():
+    """Test case for the encode_session_id and decode_session_id functions"""
+    session_id = uuid7()
+    legacy_id = "5d41402abc4b2a76b9719d911017c592"
+
+    assert decode_session_id(encode_session_id(session_id)) == session_id
+    assert decode_session_id(str(session_id)) == session_id
+    assert encode_session_id(decode_session_id(legacy_id)) == legacy_id
+    assert encode_session_id(str(session_id).upper()) == session_id.hex
+    with pytest.raises(ValueError):
+        decode_session_id("not-a-session-id")
 
 
 def test_convert_bytes_to_megabytes():
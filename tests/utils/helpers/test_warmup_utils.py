@@ -0,0 +1,38 @@
+import asyncio
+
+from utils.helpers.warmup_utils import Readiness
+
+
+class FlakyStep:
+    """Warm-up step failing a number of times before it succeeds"""
+
+    def __init__(self, failures: int) -> None:
+        self.failures = failures
+        self.calls = 0
+
+    async def __call__(self) -> int:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("unreachable")
+        return self.calls
+
+
+def test_failed_required_steps_are_retried():
+    """Test that the service gets ready once its failed required steps succeed"""
+    readiness = Readiness()
+    database = FlakyStep(failures=3)
+    optional = FlakyStep(failures=100)
+
+    async def warm_up():
+        await readiness.run_step("database", database)
+        await readiness.run_step("optional", optional, required=False)
+        readiness.finish()
+        assert not readiness.ready
+        await readiness.retry_until_ready(0.001, 0.002)
+
+    asyncio.run(warm_up())
+
+    assert readiness.ready
+    assert database.calls == 4
+    assert optional.calls == 1
+    assert readiness.steps["database"]["result"] == 4
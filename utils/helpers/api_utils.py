@@ -1,4 +1,25 @@
-import httpx
+import asyncio
+import os
+from typing import TYPE_CHECKING
+
+# httpx is imported on first use: the app does not need it before its first
+# upload, so it is kept off the import path of a starting pod.
+if TYPE_CHECKING:
+    import httpx
+
+FACE_ENCODING_HOST = os.getenv("FACE_ENCODING_HOST", "face-encoding")
+FACE_ENCODING_PORT = int(os.getenv("FACE_ENCODING_PORT", "8000"))
+
+
+class FaceEncodingClientConfig:
+    """Face-encoding Client Configuration Class"""
+
+    def __init__(self) -> None:
+        self.max_connections = int(os.getenv("FACE_ENCODING_MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = int(
+            os.getenv("FACE_ENCODING_MAX_KEEPALIVE_CONNECTIONS", "20")
+        )
+        self.keepalive_expiry = float(os.getenv("FACE_ENCODING_KEEPALIVE_EXPIRY", "60"))
 
 
 def build_api_url(endpoint: str, host: str = "localhost", port: int = 8000) -> str:
@@ -15,32 +36,143 @@ def build_api_url(endpoint: str, host: str = "localhost", port: int = 8000) -> s
     return f"http://{host}:{port}/{endpoint}"
 
 
+def build_face_encoding_client(config: FaceEncodingClientConfig) -> "httpx.AsyncClient":
+    """Build the client shared by the requests to the face-encoding service
+
+    Args:
+        config (FaceEncodingClientConfig): Client configuration.
+
+    Returns:
+        httpx.AsyncClient: The client, keeping its connections alive between
+        requests
+    """
+    import httpx  # pylint: disable=import-outside-toplevel
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        )
+    )
+
+
+async def warm_face_encoding_client(
+    client: "httpx.AsyncClient",
+    connections: int,
+    host: str = FACE_ENCODING_HOST,
+    port: int = FACE_ENCODING_PORT,
+    timeout: float = 5.0,
+) -> int:
+    """Open keep-alive connections to the face-encoding service
+
+    Sends concurrent requests to ``/ping``, so the client opens one connection
+    for each and keeps them for the first uploads. Any response, even an
+    error status, leaves an open connection.
+
+    Args:
+        client (httpx.AsyncClient): Client to warm up.
+        connections (int): Number of connections to open.
+        host (str, optional): Host name of the face-encoding service. Defaults to FACE_ENCODING_HOST.
+        port (int, optional): Port of the face-encoding service. Defaults to FACE_ENCODING_PORT.
+        timeout (float, optional): Timeout of each request. Defaults to 5.0.
+
+    Raises:
+        httpx.HTTPError: No connection could be opened
+
+    Returns:
+        int: The number of connections opened
+    """
+    url = build_api_url("ping", host, port)
+    responses = await asyncio.gather(
+        *(client.get(url, timeout=timeout) for _ in range(connections)),
+        return_exceptions=True,
+    )
+    errors = [r for r in responses if isinstance(r, Exception)]
+    if connections and len(errors) == connections:
+        raise errors[0]
+    return connections - len(errors)
+
+
 async def send_request_to_face_encoding(
     endpoint: str = "v1/selfie",
-    host: str = "face-encoding",
-    port: int = 8000,
+    host: str = FACE_ENCODING_HOST,
+    port: int = FACE_ENCODING_PORT,
     contents: bytes = None,
     timeout: int = 60,
-) -> httpx.Response:
+    client: "httpx.AsyncClient" = None,
+) -> "httpx.Response":
     """Send a request to the face-encoding service
 
     Args:
         endpoint (str, optional): Endpoint to send the request. Defaults to "v1/selfie".
-        host (str, optional): Host name of the face-encoding service. Defaults to "face-encoding".
-        port (int, optional): Port of the face-encoding service. Defaults to 8000.
+        host (str, optional): Host name of the face-encoding service. Defaults to FACE_ENCODING_HOST.
+        port (int, optional): Port of the face-encoding service. Defaults to FACE_ENCODING_PORT.
+        contents (bytes, optional): Image bytes. Defaults to None.
         timeout (int, optional): Timeout of the request. Defaults to 60.
+        client (httpx.AsyncClient, optional): Client to send the request with, to
+            reuse its connections. A new client is used when None. Defaults to None.
 
     Returns:
         httpx.Response: Response from the face-encoding service
     """
-    async with httpx.AsyncClient() as client:
+    import httpx  # pylint: disable=import-outside-toplevel
+
+    if client is None:
+        async with httpx.AsyncClient() as new_client:
+            return await send_request_to_face_encoding(
+                endpoint, host, port, contents, timeout, client=new_client
+            )
+
+    try:
+        return await client.post(
+            build_api_url(endpoint, host, port),
+            files={"file": contents},
+            timeout=timeout,
+        )
+    except httpx.HTTPError as e:
+        raise httpx.HTTPError(
+            f"Error connecting to face-encoding service: {str(e)}"
+        ) from e
+
+
+async def send_request_with_retries(
+    client: "httpx.AsyncClient",
+    contents: bytes,
+    host: str = FACE_ENCODING_HOST,
+    port: int = FACE_ENCODING_PORT,
+    retries: int = 3,
+    timeout: int = 60,
+) -> "httpx.Response":
+    """Send an image to the face-encoding service, retrying connection errors
+    and 5xx responses with an exponential backoff
+
+    Args:
+        client (httpx.AsyncClient): Client to send the requests with.
+        contents (bytes): Image bytes.
+        host (str, optional): Host name of the face-encoding service. Defaults to FACE_ENCODING_HOST.
+        port (int, optional): Port of the face-encoding service. Defaults to FACE_ENCODING_PORT.
+        retries (int, optional): Retries after the first attempt. Defaults to 3.
+        timeout (int, optional): Timeout of each request. Defaults to 60.
+
+    Raises:
+        httpx.HTTPError: Every attempt failed to connect
+
+    Returns:
+        httpx.Response: The first response below 500, or the last one
+    """
+    import httpx  # pylint: disable=import-outside-toplevel
+
+    attempt = 0
+    while True:
         try:
-            return await client.post(
-                build_api_url(endpoint, host, port),
-                files={"file": httpx.AsyncByteStream(contents)},
-                timeout=timeout,
+            response = await send_request_to_face_encoding(
+                host=host, port=port, contents=contents, timeout=timeout, client=client
             )
-        except httpx.HTTPError as e:
-            raise httpx.HTTPError(
-                f"Error connecting to face-encoding service: {str(e)}"
-            ) from e
+            if response.status_code < 500 or attempt >= retries:
+                return response
+        except httpx.HTTPError:
+            if attempt >= retries:
+                raise
+        attempt += 1
+        await asyncio.sleep(min(0.1 * 2 ** (attempt - 1), 5.0))
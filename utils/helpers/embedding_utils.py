@@ -0,0 +1,234 @@
+import base64
+import math
+import os
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from utils.schema.face_encoder_schema import FaceEncodingQuality
+
+QUANTIZATION_LEVELS = ("none", "float32", "float16", "int8")
+
+_INT8_MAX = 127.0
+
+
+class EmbeddingConfig:
+    """Embedding Post-processing Configuration Class"""
+
+    def __init__(self) -> None:
+        self.quantization = os.getenv("EMBEDDING_QUANTIZATION", "float16")
+        self.min_faces = int(os.getenv("EMBEDDING_MIN_FACES", "1"))
+        self.max_faces = int(os.getenv("EMBEDDING_MAX_FACES", "5"))
+        self.min_norm = float(os.getenv("EMBEDDING_MIN_NORM", "1e-6"))
+        self.max_norm = float(os.getenv("EMBEDDING_MAX_NORM", "1e6"))
+        self.duplicate_threshold = float(
+            os.getenv("EMBEDDING_DUPLICATE_THRESHOLD", "0.995")
+        )
+        # Model and version of the face-encoding service, stored with every
+        # encoding so that stale ones can be re-encoded after an upgrade.
+        self.encoder_model = os.getenv("FACE_ENCODER_MODEL", "face-encoding")
+        self.encoder_version = os.getenv("FACE_ENCODER_VERSION", "1")
+
+        if self.quantization not in QUANTIZATION_LEVELS:
+            raise ValueError(
+                f"Invalid EMBEDDING_QUANTIZATION '{self.quantization}'. "
+                f"Expected one of {QUANTIZATION_LEVELS}"
+            )
+
+
+class ProcessedEncodings:
+    """Result of the embedding post-processing stage"""
+
+    def __init__(
+        self, normalized: np.ndarray, stored: Dict, quality: FaceEncodingQuality
+    ) -> None:
+        self.normalized = normalized
+        self.stored = stored
+        self.quality = quality
+
+
+def as_matrix(face_encodings: Sequence[Sequence[float]]) -> np.ndarray:
+    """Convert the face encodings returned by the encoder to a 2D array
+
+    Args:
+        face_encodings (Sequence[Sequence[float]]): One vector per detected face.
+
+    Raises:
+        ValueError: The vectors do not have the same dimension
+
+    Returns:
+        np.ndarray: Array of shape (faces, dimension)
+    """
+    matrix = np.asarray(face_encodings, dtype=np.float64)
+    if matrix.size == 0:
+        return matrix.reshape(0, 0)
+    if matrix.ndim != 2:
+        raise ValueError("Face encodings must be a list of vectors of the same size")
+    return matrix
+
+
+def l2_normalize(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """L2 normalize every row of a matrix
+
+    Args:
+        matrix (np.ndarray): Array of shape (faces, dimension).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The normalized matrix and the original norms
+    """
+    norms = np.linalg.norm(matrix, axis=1)
+    safe_norms = np.where(norms > 0, norms, 1.0)
+    return matrix / safe_norms[:, None], norms
+
+
+def quantize(matrix: np.ndarray, level: str) -> Dict:
+    """Encode a matrix in its compact storage form
+
+    ``int8`` uses a symmetric per-vector scale, stored next to the data so the
+    vectors can be restored with :func:`dequantize`.
+
+    Args:
+        matrix (np.ndarray): Array of shape (faces, dimension).
+        level (str): One of ``none``, ``float32``, ``float16`` or ``int8``.
+
+    Raises:
+        ValueError: Unknown quantization level
+
+    Returns:
+        Dict: The compact representation
+    """
+    if level == "none":
+        return {"dtype": "none", "data": matrix.tolist()}
+    if level in ("float32", "float16"):
+        data = matrix.astype(level)
+        return {
+            "dtype": level,
+            "shape": list(matrix.shape),
+            "data": base64.b64encode(data.tobytes()).decode("ascii"),
+        }
+    if level == "int8":
+        scales = np.abs(matrix).max(axis=1, initial=0.0) / _INT8_MAX
+        scales = np.where(scales > 0, scales, 1.0)
+        data = np.rint(matrix / scales[:, None]).astype(np.int8)
+        return {
+            "dtype": "int8",
+            "shape": list(matrix.shape),
+            "scales": scales.tolist(),
+            "data": base64.b64encode(data.tobytes()).decode("ascii"),
+        }
+    raise ValueError(f"Unknown quantization level '{level}'")
+
+
+def dequantize(stored) -> np.ndarray:
+    """Restore a matrix from its storage form
+
+    Rows stored before the post-processing stage existed hold the raw list
+    returned by the encoder and are returned as they are.
+
+    Args:
+        stored (Dict | List): The stored face encodings.
+
+    Returns:
+        np.ndarray: Array of shape (faces, dimension)
+    """
+    if stored is None:
+        return np.zeros((0, 0))
+    if not isinstance(stored, dict):
+        return as_matrix(stored)
+
+    dtype = stored["dtype"]
+    if dtype == "none":
+        return as_matrix(stored["data"])
+
+    shape = tuple(stored["shape"])
+    data = np.frombuffer(base64.b64decode(stored["data"]), dtype=dtype)
+    matrix = data.reshape(shape).astype(np.float64)
+    if dtype == "int8":
+        matrix *= np.asarray(stored["scales"], dtype=np.float64)[:, None]
+    return matrix
+
+
+def decode_face_encodings(stored) -> List[List[float]]:
+    """Restore the face encodings of a row as plain lists
+
+    Args:
+        stored (Dict | List): The stored face encodings.
+
+    Returns:
+        List[List[float]]: One vector per detected face
+    """
+    return dequantize(stored).tolist()
+
+
+def max_similarity(matrix: np.ndarray, others: List[np.ndarray]) -> float:
+    """Get the highest cosine similarity between normalized vectors
+
+    Args:
+        matrix (np.ndarray): Normalized vectors of shape (faces, dimension).
+        others (List[np.ndarray]): Normalized vectors to compare against.
+
+    Returns:
+        float: The highest similarity, -1.0 if there is nothing to compare
+    """
+    others = [
+        other for other in others if other.size and other.shape[1:] == matrix.shape[1:]
+    ]
+    if matrix.size == 0 or not others:
+        return -1.0
+    return float((matrix @ np.concatenate(others).T).max())
+
+
+def postprocess_face_encodings(
+    face_encodings: Sequence[Sequence[float]],
+    config: EmbeddingConfig,
+    session_encodings: List = None,
+) -> ProcessedEncodings:
+    """Normalize, quality check and quantize the output of the encoder
+
+    Args:
+        face_encodings (Sequence[Sequence[float]]): Vectors returned by the encoder.
+        config (EmbeddingConfig): Post-processing configuration.
+        session_encodings (List, optional): Stored encodings of the same session,
+            used for near-duplicate detection. Defaults to None.
+
+    Returns:
+        ProcessedEncodings: The normalized vectors, their storage form (None if
+        the quality checks failed) and the quality report
+    """
+    matrix = as_matrix(face_encodings)
+    normalized, norms = l2_normalize(matrix) if matrix.size else (matrix, np.zeros(0))
+
+    issues = []
+    faces = matrix.shape[0]
+    if faces < config.min_faces:
+        issues.append(f"Expected at least {config.min_faces} face(s), found {faces}")
+    if faces > config.max_faces:
+        issues.append(f"Expected at most {config.max_faces} face(s), found {faces}")
+    if not np.all(np.isfinite(norms)) or np.any(
+        (norms < config.min_norm) | (norms > config.max_norm)
+    ):
+        issues.append("Face encoding norm out of range")
+
+    similarity = -1.0
+    if not issues:
+        similarity = max_similarity(
+            normalized,
+            [
+                l2_normalize(m)[0]
+                for m in map(dequantize, session_encodings or [])
+                if m.size
+            ],
+        )
+
+    quality = FaceEncodingQuality(
+        faces_detected=faces,
+        norms=[float(n) if math.isfinite(n) else None for n in norms],
+        max_session_similarity=similarity,
+        is_duplicate=similarity >= config.duplicate_threshold,
+        issues=issues,
+    )
+    return ProcessedEncodings(
+        normalized=normalized,
+        stored=None if issues else quantize(normalized, config.quantization),
+        quality=quality,
+    )
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Tuple
+
+from utils.logger.logger import Logger
+
+logger = Logger("face-encoder")
+
+
+class IdempotencyConfig:
+    """Idempotency Configuration Class"""
+
+    def __init__(self) -> None:
+        self.ttl = float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+        self.max_keys = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+
+class IdempotencyConflictError(ValueError):
+    """Raised when an idempotency key is reused for a different request"""
+
+
+class IdempotencyStoreFullError(RuntimeError):
+    """Raised when every slot of the store holds an in-flight request"""
+
+
+class StoredResponse:
+    """Response kept for the retries of a request"""
+
+    __slots__ = ("status_code", "body")
+
+    def __init__(self, status_code: int, body: bytes) -> None:
+        self.status_code = status_code
+        self.body = body
+
+
+class IdempotencyMetrics:
+    """Idempotency Metrics Class"""
+
+    def __init__(self) -> None:
+        self.executed = 0
+        self.replayed = 0
+        self.joined = 0
+        self.conflicts = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        """Get the counters
+
+        Returns:
+            Dict[str, int]: The counters. ``saved`` is the number of requests
+            answered without running the handler again.
+        """
+        return {
+            "executed": self.executed,
+            "replayed": self.replayed,
+            "joined": self.joined,
+            "conflicts": self.conflicts,
+            "saved": self.replayed + self.joined,
+        }
+
+
+class _Entry:
+    """Idempotency store entry"""
+
+    __slots__ = ("fingerprint", "task", "expires_at")
+
+    def __init__(self, fingerprint: str, task: asyncio.Future, expires_at: float):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.expires_at = expires_at
+
+
+class IdempotencyStore:
+    """Idempotency Store Class
+
+    Keeps the in-flight and completed responses by idempotency key, in
+    insertion order, bounded by ``max_keys`` and evicted after ``ttl``
+    seconds. A retry of an in-flight request waits on the same task, a retry
+    of a completed one gets the stored response. Failed requests (exceptions
+    and 5xx responses) are forgotten so that they can be retried.
+
+    In-flight entries are never evicted, otherwise a retry would run the
+    handler a second time. When every slot is in flight, new keys are
+    rejected until a request completes.
+
+    The handler runs in its own task, so a client that disconnects does not
+    cancel the work the retries are waiting on.
+    """
+
+    def __init__(
+        self,
+        max_keys: int = 10000,
+        ttl: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._metrics: Dict[str, IdempotencyMetrics] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def metrics(self) -> Dict[str, Dict[str, int]]:
+        """Get the counters of each endpoint
+
+        Returns:
+            Dict[str, Dict[str, int]]: The counters by endpoint
+        """
+        return {endpoint: m.to_dict() for endpoint, m in self._metrics.items()}
+
+    async def run(
+        self,
+        endpoint: str,
+        key: str,
+        fingerprint: str,
+        handler: Callable[[], Awaitable[StoredResponse]],
+    ) -> Tuple[StoredResponse, bool]:
+        """Run a handler at most once per idempotency key
+
+        Args:
+            endpoint (str): Endpoint name, metrics are counted by endpoint.
+            key (str): The idempotency key, scoped to the client it belongs to.
+            fingerprint (str): Digest of the request, to detect key reuse.
+            handler (Callable[[], Awaitable[StoredResponse]]): Request handler.
+
+        Raises:
+            IdempotencyConflictError: The key was used for a different request
+            IdempotencyStoreFullError: Every slot holds an in-flight request
+
+        Returns:
+            Tuple[StoredResponse, bool]: The response and whether it was shared
+            with another request instead of being computed for this one
+        """
+        metrics = self._metrics.setdefault(endpoint, IdempotencyMetrics())
+        now = self._clock()
+        self._evict(now)
+
+        entry_key = f"{endpoint}:{key}"
+        entry = self._entries.get(entry_key)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                metrics.conflicts += 1
+                raise IdempotencyConflictError(
+                    "Idempotency-Key was already used for a different request"
+                )
+            if entry.task.done():
+                metrics.replayed += 1
+            else:
+                metrics.joined += 1
+            return await asyncio.shield(entry.task), True
+
+        if len(self._entries) >= self.max_keys:
+            raise IdempotencyStoreFullError(
+                f"All {self.max_keys} idempotency keys are in flight"
+            )
+        metrics.executed += 1
+        task = asyncio.ensure_future(handler())
+        entry = _Entry(fingerprint, task, now + self.ttl)
+        self._entries[entry_key] = entry
+        task.add_done_callback(lambda t: self._on_done(entry_key, entry, t))
+        return await asyncio.shield(task), False
+
+    def _on_done(self, entry_key: str, entry: _Entry, task: asyncio.Future) -> None:
+        """Forget the failed requests
+
+        Args:
+            entry_key (str): Key of the entry.
+            entry (_Entry): The entry.
+            task (asyncio.Future): The finished handler task.
+        """
+        if task.cancelled() or task.exception() is not None:
+            failed = True
+        else:
+            failed = task.result().status_code >= 500
+        if failed and self._entries.get(entry_key) is entry:
+            del self._entries[entry_key]
+
+    def _evict(self, now: float) -> None:
+        """Evict the expired entries and the oldest ones over capacity, skipping
+        the in-flight ones
+
+        Args:
+            now (float): Current clock value.
+        """
+        entries = self._entries
+        evicted = []
+        for entry_key, entry in entries.items():
+            if len(entries) - len(evicted) < self.max_keys and entry.expires_at > now:
+                break
+            if entry.task.done():
+                evicted.append(entry_key)
+        for entry_key in evicted:
+            del entries[entry_key]
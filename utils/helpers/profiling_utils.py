@@ -0,0 +1,273 @@
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.logger.logger import Logger
+
+logger = Logger("face-encoder")
+
+
+class ProfilingConfig:
+    """Profiling Configuration Class"""
+
+    def __init__(self) -> None:
+        self.enabled = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+        self.sample_rate = float(os.getenv("PROFILING_SAMPLE_RATE", "0.01"))
+        self.slow_request_ms = float(os.getenv("PROFILING_SLOW_REQUEST_MS", "1000"))
+        self.server_timing = (
+            os.getenv("PROFILING_SERVER_TIMING", "true").lower() == "true"
+        )
+        # The /debug/profile endpoint is disabled when no token is set.
+        self.token = os.getenv("PROFILING_TOKEN", "")
+        self.max_seconds = float(os.getenv("PROFILING_MAX_SECONDS", "60"))
+        self.interval_ms = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+
+
+class RequestTrace:
+    """Spans of a sampled request"""
+
+    __slots__ = ("spans",)
+
+    def __init__(self) -> None:
+        self.spans: List[Tuple[str, float]] = []
+
+    def breakdown(self) -> Dict[str, Tuple[int, float]]:
+        """Aggregate the spans by name
+
+        Returns:
+            Dict[str, Tuple[int, float]]: Number of calls and total milliseconds
+            of each span name, in order of first call
+        """
+        totals: Dict[str, Tuple[int, float]] = {}
+        for name, duration in self.spans:
+            calls, total = totals.get(name, (0, 0.0))
+            totals[name] = (calls + 1, total + duration * 1000)
+        return totals
+
+    def summary(self) -> str:
+        """Get the span breakdown as one line
+
+        Returns:
+            str: Total milliseconds and calls of each span name
+        """
+        return ", ".join(
+            f"{name} {total:.1f} ms" + (f" ({calls} calls)" if calls > 1 else "")
+            for name, (calls, total) in self.breakdown().items()
+        )
+
+    def server_timing(self) -> str:
+        """Get the span breakdown as a Server-Timing header value
+
+        Returns:
+            str: One metric per span name
+        """
+        return ", ".join(
+            f"{name};dur={total:.1f}" for name, (_, total) in self.breakdown().items()
+        )
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar(
+    "current_trace", default=None
+)
+
+_NO_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+    """Context manager recording one span of a trace"""
+
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: RequestTrace, name: str) -> None:
+        self.trace = trace
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.trace.spans.append((self.name, time.perf_counter() - self.start))
+
+
+def span(name: str):
+    """Time a block of code in the trace of the current request
+
+    Outside of a sampled request this is a context variable lookup returning a
+    shared no-op context manager.
+
+    Args:
+        name (str): Span name.
+
+    Returns:
+        The context manager
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, name)
+
+
+def start_trace() -> Tuple[RequestTrace, Any]:
+    """Start the trace of the current request
+
+    Returns:
+        Tuple[RequestTrace, Any]: The trace, and the token to end it with
+    """
+    trace = RequestTrace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token: Any) -> None:
+    """End the trace of the current request
+
+    Args:
+        token (Any): Token returned by :func:`start_trace`.
+    """
+    _current_trace.reset(token)
+
+
+class Traced:
+    """Traced Proxy Class
+
+    Proxy of an object recording a span named ``<prefix>.<method>`` for each
+    call of its public methods. Only installed when profiling is enabled, so
+    the object is called directly otherwise.
+    """
+
+    def __init__(self, target: Any, prefix: str) -> None:
+        self._target = target
+        self._prefix = prefix
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        label = f"{self._prefix}.{name}"
+
+        @functools.wraps(attr)
+        def traced_call(*args, **kwargs):
+            with span(label):
+                return attr(*args, **kwargs)
+
+        # Cached on the proxy: later lookups skip __getattr__.
+        setattr(self, name, traced_call)
+        return traced_call
+
+
+def frame_label(frame) -> str:
+    """Get the label of a stack frame
+
+    Args:
+        frame: Stack frame.
+
+    Returns:
+        str: Function, file and line of definition, without the ``;``
+        separator of folded stacks
+    """
+    code = frame.f_code
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    ).replace(";", ":")
+
+
+class StackSampler:
+    """Stack Sampler Class
+
+    Statistical profiler of the whole process: a background thread reads the
+    stack of every other thread with ``sys._current_frames`` every
+    ``interval`` seconds. Threads are not paused or traced, so the cost is
+    one stack walk per thread and interval, and nothing when not sampling.
+
+    The result is in the folded format (``thread;outer;...;inner count`` per
+    line) read by ``flamegraph.pl``, speedscope and most flame graph viewers.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 128) -> None:
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def sample(self) -> None:
+        """Record the current stack of every other thread"""
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        # pylint: disable-next=protected-access
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, f"thread-{ident}").replace(";", ":"))
+            self.stacks[";".join(reversed(labels))] += 1
+        self.samples += 1
+
+    def run(self, seconds: float) -> "StackSampler":
+        """Sample the process for a duration, in the calling thread
+
+        Args:
+            seconds (float): Duration of the capture.
+
+        Returns:
+            StackSampler: The sampler, with the recorded stacks
+        """
+        deadline = time.perf_counter() + seconds
+        next_sample = time.perf_counter()
+        while next_sample < deadline:
+            self.sample()
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return self
+
+    def folded(self) -> str:
+        """Get the recorded stacks in the folded format
+
+        Returns:
+            str: One ``stack count`` line per distinct stack, most frequent first
+        """
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+class ProfileCapture:
+    """Profile Capture Class
+
+    Runs at most one :class:`StackSampler` capture at a time, in a worker
+    thread so that the event loop keeps serving (and is profiled).
+    """
+
+    def __init__(self, config: ProfilingConfig) -> None:
+        self.config = config
+        self._lock = threading.Lock()
+
+    def capture(self, seconds: float) -> Optional[StackSampler]:
+        """Capture a profile of the process
+
+        Args:
+            seconds (float): Duration of the capture, capped to
+                ``PROFILING_MAX_SECONDS``.
+
+        Returns:
+            Optional[StackSampler]: The sampler, None if a capture is already
+            running
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            seconds = min(max(seconds, 0.0), self.config.max_seconds)
+            logger.info(f"Capturing a {seconds:.1f}s profile of the process")
+            return StackSampler(self.config.interval_ms / 1000).run(seconds)
+        finally:
+            self._lock.release()
@@ -0,0 +1,303 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.logger.logger import Logger
+
+logger = Logger("face-encoder")
+
+# Token bucket executed atomically inside Redis so every replica shares the same
+# bucket. Time comes from the Redis server to avoid clock skew between pods.
+_REDIS_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local idle_ttl = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1])
+local updated_at = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+else
+    tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+end
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], idle_ttl)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class RateLimitConfig:
+    """Rate Limit Configuration Class"""
+
+    def __init__(self) -> None:
+        self.enabled = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+        self.user_rate = float(os.getenv("RATE_LIMIT_USER_RATE", "5"))
+        self.user_burst = float(os.getenv("RATE_LIMIT_USER_BURST", "10"))
+        self.ip_rate = float(os.getenv("RATE_LIMIT_IP_RATE", "20"))
+        self.ip_burst = float(os.getenv("RATE_LIMIT_IP_BURST", "40"))
+        self.max_concurrent_uploads = int(
+            os.getenv("RATE_LIMIT_MAX_CONCURRENT_UPLOADS", "2")
+        )
+        self.max_keys = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+        self.idle_ttl = float(os.getenv("RATE_LIMIT_IDLE_TTL", "600"))
+        self.trust_forwarded = (
+            os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+        )
+        self.redis_url = os.getenv("RATE_LIMIT_REDIS_URL")
+
+
+class TokenBucket:
+    """Token Bucket Class"""
+
+    __slots__ = ("tokens", "updated_at", "full_at")
+
+    def __init__(self, tokens: float, updated_at: float) -> None:
+        self.tokens = tokens
+        self.updated_at = updated_at
+        # Time at which the bucket is full again if it is not used.
+        self.full_at = updated_at
+
+
+class InMemoryRateLimitStore:
+    """In-memory token bucket store
+
+    Buckets are kept in an ``OrderedDict`` ordered by last access, so lookups,
+    refills and eviction of idle keys are all O(1) (amortized for eviction).
+    Only buckets idle for longer than ``idle_ttl`` are evicted: a bucket that
+    has been idle for longer than ``capacity / rate`` is full again, so
+    evicting it does not change the outcome of the next request.
+
+    When ``max_keys`` buckets are held, a new key evicts the least recently
+    used bucket that is full again, looking at the ``evict_scan`` oldest
+    buckets. Only when none of them has refilled do new keys share one
+    overflow bucket per key kind (the ``user`` or ``ip`` prefix of the key),
+    instead of evicting a busy client's bucket.
+    """
+
+    def __init__(
+        self,
+        max_keys: int = 100000,
+        idle_ttl: float = 600.0,
+        clock: Callable[[], float] = time.monotonic,
+        evict_scan: int = 64,
+    ) -> None:
+        self.max_keys = max_keys
+        self.idle_ttl = idle_ttl
+        self.evict_scan = evict_scan
+        self.overflowed = 0
+        self._clock = clock
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._overflow: Dict[str, TokenBucket] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    async def consume(
+        self, key: str, rate: float, capacity: float, cost: float = 1.0
+    ) -> Tuple[bool, float]:
+        """Take tokens from the bucket of a key
+
+        Args:
+            key (str): The bucket key.
+            rate (float): Tokens added to the bucket per second.
+            capacity (float): Maximum number of tokens in the bucket.
+            cost (float, optional): Tokens taken by the request. Defaults to 1.0.
+
+        Returns:
+            Tuple[bool, float]: Whether the request is allowed and, if not, the
+            number of seconds until enough tokens are available.
+        """
+        now = self._clock()
+        self._evict(now)
+
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            self._buckets.move_to_end(key)
+        elif len(self._buckets) < self.max_keys or self._evict_refilled(now):
+            bucket = TokenBucket(capacity, now)
+            self._buckets[key] = bucket
+        else:
+            if self.overflowed == 0:
+                logger.warning(
+                    f"Rate limit store full with {self.max_keys} draining keys, "
+                    "new keys share an overflow bucket"
+                )
+            self.overflowed += 1
+            kind = key.split(":", 1)[0]
+            bucket = self._overflow.get(kind)
+            if bucket is None:
+                bucket = TokenBucket(capacity, now)
+                self._overflow[kind] = bucket
+
+        bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated_at) * rate)
+        bucket.updated_at = now
+
+        allowed = bucket.tokens >= cost
+        if allowed:
+            bucket.tokens -= cost
+        bucket.full_at = now + (capacity - bucket.tokens) / rate
+        if allowed:
+            return True, 0.0
+        return False, (cost - bucket.tokens) / rate
+
+    def _evict(self, now: float) -> None:
+        """Evict the least recently used keys that are idle
+
+        Args:
+            now (float): Current clock value.
+        """
+        buckets = self._buckets
+        while buckets:
+            oldest = next(iter(buckets.values()))
+            if now - oldest.updated_at > self.idle_ttl:
+                buckets.popitem(last=False)
+            else:
+                break
+
+    def _evict_refilled(self, now: float) -> bool:
+        """Evict the least recently used bucket that is full again
+
+        Args:
+            now (float): Current clock value.
+
+        Returns:
+            bool: Whether a bucket was evicted
+        """
+        for key, bucket in islice(self._buckets.items(), self.evict_scan):
+            if bucket.full_at <= now:
+                break
+        else:
+            return False
+        del self._buckets[key]
+        return True
+
+
+class RedisRateLimitStore:
+    """Redis token bucket store shared by all the replicas
+
+    Requires the optional ``redis`` dependency group. ``client`` is an
+    existing ``redis.asyncio`` client used instead of connecting to ``url``.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        key_prefix: str = "face-encoder:rl:",
+        idle_ttl: float = 600.0,
+        client=None,
+    ) -> None:
+        if client is None:
+            try:
+                # pylint: disable=import-outside-toplevel
+                from redis import asyncio as aioredis
+            except ImportError as e:
+                raise ImportError(
+                    "The redis package is required for the shared rate limit "
+                    "backend, install the redis dependency group"
+                ) from e
+            client = aioredis.Redis.from_url(url)
+
+        logger.info("Using Redis rate limit backend")
+        self.key_prefix = key_prefix
+        self.idle_ttl = int(math.ceil(idle_ttl))
+        self._client = client
+        self._script = self._client.register_script(_REDIS_TOKEN_BUCKET_SCRIPT)
+
+    async def consume(
+        self, key: str, rate: float, capacity: float, cost: float = 1.0
+    ) -> Tuple[bool, float]:
+        """Take tokens from the bucket of a key
+
+        Args:
+            key (str): The bucket key.
+            rate (float): Tokens added to the bucket per second.
+            capacity (float): Maximum number of tokens in the bucket.
+            cost (float, optional): Tokens taken by the request. Defaults to 1.0.
+
+        Returns:
+            Tuple[bool, float]: Whether the request is allowed and, if not, the
+            number of seconds until enough tokens are available.
+        """
+        allowed, retry_after = await self._script(
+            keys=[self.key_prefix + key],
+            args=[rate, capacity, cost, self.idle_ttl],
+        )
+        return bool(allowed), float(retry_after)
+
+
+class ConcurrencyLimiter:
+    """Concurrency Limiter Class
+
+    Counts in-flight requests per key. Keys are dropped as soon as their
+    counter reaches zero, so the map only holds keys with active requests.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._active: Dict[str, int] = {}
+
+    def active(self, key: str) -> int:
+        """Get the number of in-flight requests of a key
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            int: The number of in-flight requests
+        """
+        return self._active.get(key, 0)
+
+    def acquire(self, key: str) -> bool:
+        """Try to reserve a slot for a key
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            bool: True if the slot was reserved, False if the limit was reached
+        """
+        count = self._active.get(key, 0)
+        if count >= self.limit:
+            return False
+        self._active[key] = count + 1
+        return True
+
+    def release(self, key: str) -> None:
+        """Release a slot previously reserved for a key
+
+        Args:
+            key (str): The key.
+        """
+        count = self._active.get(key, 0) - 1
+        if count > 0:
+            self._active[key] = count
+        else:
+            self._active.pop(key, None)
+
+
+def build_rate_limit_store(config: RateLimitConfig):
+    """Build the rate limit store configured for the service
+
+    Args:
+        config (RateLimitConfig): Rate limit configuration.
+
+    Returns:
+        InMemoryRateLimitStore | RedisRateLimitStore: The rate limit store
+    """
+    if config.redis_url:
+        return RedisRateLimitStore(config.redis_url, idle_ttl=config.idle_ttl)
+    return InMemoryRateLimitStore(max_keys=config.max_keys, idle_ttl=config.idle_ttl)
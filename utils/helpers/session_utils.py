@@ -1,19 +1,94 @@
+import secrets
+import threading
 import time
 import uuid
-import hashlib
+from typing import Union
 
+# Millisecond timestamp of the last UUIDv7, so that the timestamps never go
+# backwards with the system clock.
+_uuid7_lock = threading.Lock()
+_last_timestamp_ms = 0
+_RANDOM_BITS = 74
 
-def generate_unique_id():
+
+def uuid7() -> uuid.UUID:
     """
-    A function to generate a unique ID using timestamp, random string, and hashlib.
-    No parameters.
-    Returns a string representing the ID.
+    Generates a time-ordered UUID (version 7).
+    The first 48 bits are the Unix timestamp in milliseconds, the other 74
+    bits (besides the version and variant) are random for every ID. Session
+    IDs are the credential of a session, so IDs generated within the same
+    millisecond share nothing but their timestamp, unlike the counter based
+    method of RFC 9562. The timestamps of a process never go backwards, even
+    when the system clock does.
+
+    Returns:
+    uuid.UUID: The generated UUID.
+    """
+    global _last_timestamp_ms  # pylint: disable=global-statement
+
+    with _uuid7_lock:
+        timestamp_ms = max(time.time_ns() // 1_000_000, _last_timestamp_ms)
+        _last_timestamp_ms = timestamp_ms
+
+    random_bits = secrets.randbits(_RANDOM_BITS)
+    value = (
+        (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76
+        | (random_bits >> 62) << 64
+        | 0b10 << 62
+        | (random_bits & ((1 << 62) - 1))
+    )
+    return uuid.UUID(int=value)
+
+
+def encode_session_id(session_id: Union[uuid.UUID, str]) -> str:
+    """
+    Encodes a session ID for the API.
+
+    Parameters:
+    session_id (Union[uuid.UUID, str]): The session ID, or a string in any
+    form accepted by decode_session_id.
+
+    Raises:
+    ValueError: The session ID is a string which is not a valid UUID.
+
+    Returns:
+    str: The 32 character hexadecimal representation of the session ID.
+    """
+    if not isinstance(session_id, uuid.UUID):
+        session_id = decode_session_id(session_id)
+    return session_id.hex
+
+
+def decode_session_id(session_id: str) -> uuid.UUID:
+    """
+    Decodes a session ID received by the API.
+    Accepts the 32 character hexadecimal form returned by the API, which also
+    covers the IDs generated before the time-ordered ones, and the canonical
+    UUID form.
+
+    Parameters:
+    session_id (str): The encoded session ID.
+
+    Raises:
+    ValueError: The session ID is not a valid UUID.
+
+    Returns:
+    uuid.UUID: The session ID.
     """
-    timestamp = str(time.time())
-    random_str = str(uuid.uuid4())
-    unique_id = hashlib.md5((timestamp + random_str).encode()).hexdigest()
+    try:
+        return uuid.UUID(session_id)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid session ID '{session_id}'") from e
+
 
-    return unique_id
+def generate_unique_id() -> str:
+    """
+    A function to generate a unique, time-ordered session ID.
+    No parameters.
+    Returns the encoded UUIDv7, see :func:`uuid7`.
+    """
+    return encode_session_id(uuid7())
 
 
 def convert_bytes_to_megabytes(size_in_bytes: int, decimal_places: int = 2) -> float:
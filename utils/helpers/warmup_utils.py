@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from utils.logger.logger import Logger
+
+logger = Logger("face-encoder")
+
+
+class WarmupConfig:
+    """Warm-up Configuration Class"""
+
+    def __init__(self) -> None:
+        self.enabled = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+        self.db_connections = int(os.getenv("WARMUP_DB_CONNECTIONS", "4"))
+        self.encoder_connections = int(os.getenv("WARMUP_ENCODER_CONNECTIONS", "4"))
+        self.timeout = float(os.getenv("WARMUP_TIMEOUT", "5"))
+        self.retry_interval = float(os.getenv("WARMUP_RETRY_INTERVAL", "1"))
+        self.retry_max_interval = float(os.getenv("WARMUP_RETRY_MAX_INTERVAL", "30"))
+
+
+class Readiness:
+    """Readiness Class
+
+    Tracks the warm-up steps run after the service starts. The service is
+    ready once the warm-up finished and every required step succeeded. Steps
+    that are not required, like warming the connections to a dependency that
+    is down, are reported without holding the service back. Required steps
+    that failed are run again by :meth:`retry_failed`, so that the service
+    becomes ready once the dependency recovers.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        self.finished = False
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self._clock = clock
+        self._start = clock()
+        self._ready_after = None
+        self._required: Dict[str, Callable[[], Awaitable[Any]]] = {}
+
+    @property
+    def ready(self) -> bool:
+        """Whether the service is ready to receive traffic"""
+        return self.finished and all(
+            step["status"] == "ok" or not step["required"]
+            for step in self.steps.values()
+        )
+
+    async def run_step(
+        self, name: str, step: Callable[[], Awaitable[Any]], required: bool = True
+    ) -> None:
+        """Run a warm-up step and record its outcome
+
+        Args:
+            name (str): Step name.
+            step (Callable[[], Awaitable[Any]]): The step, its result is reported.
+            required (bool, optional): Whether the service is not ready when the
+                step fails. Defaults to True.
+        """
+        if required:
+            self._required[name] = step
+        start = self._clock()
+        record: Dict[str, Any] = {"required": required}
+        try:
+            record["result"] = await step()
+            record["status"] = "ok"
+        except Exception as e:  # pylint: disable=broad-except
+            log = logger.error if required else logger.warning
+            log(f"Warm-up step {name} failed: {str(e)}")
+            record["status"] = "failed"
+            record["error"] = str(e)
+        record["duration_ms"] = (self._clock() - start) * 1000
+        self.steps[name] = record
+
+    def finish(self) -> None:
+        """Mark the warm-up as finished"""
+        self.finished = True
+        self._ready_after = self._clock() - self._start
+        if self.ready:
+            logger.info(f"Service ready after {self._ready_after * 1000:.0f} ms")
+        else:
+            logger.error("Warm-up failed, the service is not ready")
+
+    async def retry_failed(self) -> bool:
+        """Run the failed required steps again
+
+        Returns:
+            bool: Whether the service is ready
+        """
+        for name, step in self._required.items():
+            if self.steps[name]["status"] == "failed":
+                await self.run_step(name, step)
+        if self.ready:
+            self._ready_after = self._clock() - self._start
+            logger.info(f"Service ready after {self._ready_after * 1000:.0f} ms")
+        return self.ready
+
+    async def retry_until_ready(self, interval: float, max_interval: float) -> None:
+        """Retry the failed required steps with an exponential backoff until
+        the service is ready
+
+        Args:
+            interval (float): Seconds before the first retry.
+            max_interval (float): Maximum seconds between two retries.
+        """
+        while not self.ready:
+            await asyncio.sleep(interval)
+            if await self.retry_failed():
+                return
+            interval = min(interval * 2, max_interval)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the state of the warm-up
+
+        Returns:
+            Dict[str, Any]: Readiness, and the outcome and duration of each step
+        """
+        return {
+            "ready": self.ready,
+            "finished": self.finished,
+            "ready_after_ms": (
+                self._ready_after * 1000 if self._ready_after is not None else None
+            ),
+            "steps": self.steps,
+        }
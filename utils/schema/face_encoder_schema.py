@@ -11,10 +11,29 @@ class FaceEncoderInput(BaseModel):
     selfie_file: UploadFile = Field(title="Selfie file", default=File(...))
 
 
+class FaceEncodingQuality(BaseModel):
+    """Face Encoding Quality Model"""
+
+    faces_detected: int = Field(title="Number of faces detected")
+    norms: List[Optional[float]] = Field(
+        title="Norm of each face encoding before normalization", default_factory=list
+    )
+    max_session_similarity: float = Field(
+        title="Highest cosine similarity with the session encodings", default=-1.0
+    )
+    is_duplicate: bool = Field(
+        title="Near-duplicate of a session upload", default=False
+    )
+    issues: List[str] = Field(title="Failed quality checks", default_factory=list)
+
+
 class FaceEncoderOutput(BaseModel):
     """Face Encoder Output Model"""
 
     face_embedding: List[List[float]] = Field(title="Face embedding")
+    quality: Optional[FaceEncodingQuality] = Field(
+        title="Face encoding quality", default=None
+    )
     timestamp: str = Field(default_factory=lambda: str(datetime.now()))
 
 
@@ -25,6 +44,10 @@ class FaceEncoderSessionSummary(BaseModel):
     all_face_encodings: Optional[List[List]] = Field(
         title="List of all face Encodings", default_factory=list
     )
+    encoder_versions: List[Optional[str]] = Field(
+        title="Encoder model and version of each face encoding",
+        default_factory=list,
+    )
     created_at: str = Field(
         title="Timestamp of session creation", default_factory=datetime.now
     )